@@ -0,0 +1,272 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List
+from decouple import config
+from sqlalchemy.exc import IntegrityError
+from .block import Block, HASH_V2
+from app.models import LedgerBlock
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Started by the FastAPI lifespan; without it (scripts, tests) every append commits inline
+LEDGER_APPENDER_ENABLED = config("LEDGER_APPENDER_ENABLED", default=True, cast=bool)
+# Most events committed in one transaction
+LEDGER_BATCH_SIZE = config("LEDGER_BATCH_SIZE", default=512, cast=int)
+# How long the writer lingers for more events once one arrives (group commit window)
+LEDGER_BATCH_DELAY_MS = config("LEDGER_BATCH_DELAY_MS", default=2, cast=float)
+# Hash format of new blocks (1: JSON, 2: binary; see block.py)
+LEDGER_HASH_VERSION = config("LEDGER_HASH_VERSION", default=HASH_V2, cast=int)
+# Retries when another server process appended first (unique index collision)
+WRITE_ATTEMPTS = 5
+
+_STOP = object()
+
+
+class _Append:
+    def __init__(self, events: List[Dict[str, str]]):
+        self.events = events
+        self.future = Future()
+
+
+class LedgerAppender:
+    """
+    Single writer for the ledger.
+
+    Callers enqueue events and get a Future; one background thread takes whatever is queued
+    (up to max_batch events, lingering max_delay for stragglers), assigns indices, chains the
+    hashes from the tip it keeps in memory and inserts the batch in one transaction. Futures
+    resolve with their blocks once that transaction has committed, so waiting on one means
+    the events are durable.
+
+    - Within the process, blocks are only ever chained by one writer at a time (the thread, or
+      inline callers under the same lock while it is not running), so the chain cannot fork.
+    - Across server processes the unique index decides: a batch that collides is re-chained
+      on the fresh tip and retried.
+
+    Listeners (add_listener) are called with every committed batch, in index order, by the
+    thread that committed it; they must be quick and must not append themselves.
+    """
+
+    def __init__(self, max_batch: int = LEDGER_BATCH_SIZE, max_delay: float = LEDGER_BATCH_DELAY_MS / 1000,
+                 hash_version: int = LEDGER_HASH_VERSION):
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.hash_version = hash_version
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._state_lock = threading.Lock()
+        self._thread = None
+        self._tip = None
+        self._listeners = []
+        # Metrics (a batch is one committed transaction)
+        self.appended = 0
+        self.batches = 0
+        self.conflicts = 0
+        self.last_batch_size = 0
+        self.max_batch_seen = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        with self._state_lock:
+            if self._thread is not None:
+                return
+            self._tip = None
+            self._thread = threading.Thread(target=self._run, name="ledger-appender", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """
+        Commits everything still queued, then stops the writer.
+        """
+        with self._state_lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._queue.put(_STOP)
+        thread.join()
+        self._tip = None
+
+    def add_listener(self, listener: Callable[[List[Block]], None]):
+        """
+        Registers listener(blocks), called after each committed batch.
+        """
+        self._listeners.append(listener)
+
+    def submit(self, events: List[Dict[str, str]]) -> Future:
+        """
+        Queues events (dicts with event_type, key_id, user_id and data_reference) for appending.
+        Returns a Future resolving to their blocks once committed. While the writer is not running
+        the events are committed right away and the Future is already done.
+        """
+        append = _Append(events)
+        with self._state_lock:
+            if self._thread is not None:
+                self._queue.put(append)
+                return append.future
+        try:
+            append.future.set_result(self.write(events))
+        except Exception as e:
+            append.future.set_exception(e)
+        return append.future
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            batch = [item]
+            count = len(item.events)
+            deadline = time.monotonic() + self.max_delay
+            # Group commit: take what queued up meanwhile, waiting at most max_delay for more
+            while count < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+                count += len(item.events)
+            self._commit(batch)
+
+        # Drain what was queued before stop()
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+        if remaining:
+            self._commit(remaining)
+
+    def _commit(self, batch: List[_Append]):
+        try:
+            blocks = self.write([event for append in batch for event in append.events], use_tip=True)
+        except Exception as e:
+            # The callers get the exception through their futures
+            logger.warning("Ledger append of %d events failed: %s", sum(len(a.events) for a in batch), e)
+            for append in batch:
+                append.future.set_exception(e)
+            return
+        position = 0
+        for append in batch:
+            append.future.set_result(blocks[position:position + len(append.events)])
+            position += len(append.events)
+
+    def write(self, events: List[Dict[str, str]], use_tip: bool = False) -> List[Block]:
+        """
+        Appends events as consecutive blocks in one transaction.
+        use_tip: chain from the tip kept in memory (the writer thread) instead of reading it.
+        """
+        if not events:
+            return []
+        with self._lock:
+            for _ in range(WRITE_ATTEMPTS):
+                db = SessionLocal()
+                try:
+                    previous_block = (self._tip if use_tip else None) or self._read_tip(db)
+                    new_blocks = []
+                    for event in events:
+                        # Block(index, timestamp, event_type, key_id, user_id, data_reference, previous_hash)
+                        now_ns = time.time_ns()
+                        new_block = Block(
+                            previous_block.index + 1,
+                            now_ns / 1e9,
+                            event["event_type"],
+                            event["key_id"],
+                            event["user_id"],
+                            event["data_reference"],
+                            previous_block.hash, # Use hash of previous block
+                            self.hash_version,
+                            now_ns
+                        )
+                        db.add(LedgerBlock(
+                            index=new_block.index,
+                            timestamp=new_block.stored_timestamp(), # Store as string
+                            event_type=new_block.event_type,
+                            key_id=new_block.key_id,
+                            user_id=new_block.user_id,
+                            data_reference=new_block.data_reference,
+                            previous_hash=new_block.previous_hash,
+                            hash=new_block.hash,
+                            hash_version=new_block.hash_version,
+                            ts=new_block.timestamp
+                        ))
+                        new_blocks.append(new_block)
+                        previous_block = new_block
+                    db.commit()
+                except IntegrityError:
+                    # Another process appended at these indices: re-chain on the new tip
+                    db.rollback()
+                    self._tip = None
+                    self.conflicts += 1
+                    continue
+                except Exception:
+                    self._tip = None
+                    raise
+                finally:
+                    db.close()
+                self._tip = new_blocks[-1] if use_tip else None
+                self.appended += len(new_blocks)
+                self.batches += 1
+                self.last_batch_size = len(new_blocks)
+                self.max_batch_seen = max(self.max_batch_seen, len(new_blocks))
+                self._notify(new_blocks)
+                return new_blocks
+        raise RuntimeError(f"Ledger append still conflicting after {WRITE_ATTEMPTS} attempts")
+
+    def _notify(self, blocks: List[Block]):
+        # Still under the write lock, so listeners see batches in index order
+        for listener in self._listeners:
+            try:
+                listener(blocks)
+            except Exception:
+                logger.exception("Ledger listener %r failed", listener)
+
+    @staticmethod
+    def _read_tip(db) -> Block:
+        # Get block with max index
+        last_db_block = db.query(LedgerBlock).order_by(LedgerBlock.index.desc()).first()
+        if not last_db_block:
+            # Should have been created by init_db, but if not:
+            return Block(0, time.time(), "GENESIS", "SYSTEM", "SYSTEM", "GENESIS_BLOCK", "0")
+        tip = Block.from_stored(
+            last_db_block.index,
+            last_db_block.timestamp,
+            last_db_block.event_type,
+            last_db_block.key_id,
+            last_db_block.user_id,
+            last_db_block.data_reference,
+            last_db_block.previous_hash,
+            last_db_block.hash_version
+        )
+        tip.hash = last_db_block.hash
+        return tip
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.running,
+            "queued": self._queue.qsize(),
+            "appended": self.appended,
+            "batches": self.batches,
+            "avg_batch_size": self.appended / self.batches if self.batches else 0.0,
+            "last_batch_size": self.last_batch_size,
+            "max_batch_size": self.max_batch_seen,
+            "conflicts": self.conflicts
+        }
+
+
+# Shared by every Blockchain instance in the process
+ledger_appender = LedgerAppender()
@@ -0,0 +1,409 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+import zlib
+from bisect import bisect_right
+from typing import Dict, Iterator, List, Optional
+from decouple import config
+from sqlalchemy.exc import IntegrityError
+from .appender import LedgerAppender, ledger_appender
+from .block import timestamp_seconds
+from app.models import LedgerBlock, LedgerSegment
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Where sealed segment files are written (keep it on persistent, backed-up storage)
+LEDGER_ARCHIVE_DIR = config("LEDGER_ARCHIVE_DIR", default="ledger_archive")
+# Blocks per segment file
+LEDGER_SEGMENT_BLOCKS = config("LEDGER_SEGMENT_BLOCKS", default=100000, cast=int)
+# Most recent blocks always kept in the ledger table
+LEDGER_HOT_BLOCKS = config("LEDGER_HOT_BLOCKS", default=100000, cast=int)
+# How often cold blocks are sealed into segments (0 disables archiving)
+LEDGER_ARCHIVE_INTERVAL_SECONDS = config("LEDGER_ARCHIVE_INTERVAL_SECONDS", default=3600, cast=int)
+# Blocks per compressed frame; the sparse index has one entry per frame
+FRAME_BLOCKS = 1000
+
+GENESIS_SEGMENT_HASH = "0" * 64
+SEGMENT_EVENT = "LEDGER_SEGMENT_SEALED"
+
+# Segment files (immutable once written, mode 0444):
+#
+#   <n>.seg   frames back to back; a frame is zlib(JSON rows, one per line) for up to FRAME_BLOCKS
+#             blocks. A row is the ledger row: [index, timestamp, event_type, key_id, user_id,
+#             data_reference, previous_hash, hash, hash_version]
+#   <n>.idx   JSON sparse index: one [first block index, first timestamp (s), offset, length] per frame
+#
+#   segment_hash = SHA-256(previous segment hash | first | last | last block hash | sha256(.seg) | sha256(.idx))
+#
+# The segment hash is also appended to the live chain as a LEDGER_SEGMENT_SEALED block, so
+# rewriting an archived block means rewriting its file, every later segment hash and the chain.
+_ROW_FIELDS = ("index", "timestamp", "event_type", "key_id", "user_id", "data_reference",
+               "previous_hash", "hash", "hash_version")
+
+
+def segment_hash(previous_segment_hash: str, first_index: int, last_index: int, last_block_hash: str,
+                 file_hash: str, index_hash: str) -> str:
+    message = f"{previous_segment_hash}|{first_index}|{last_index}|{last_block_hash}|{file_hash}|{index_hash}"
+    return hashlib.sha256(message.encode()).hexdigest()
+
+
+def _to_row(values: list) -> LedgerBlock:
+    # Detached LedgerBlock, so callers treat both tiers alike
+    row = LedgerBlock(**dict(zip(_ROW_FIELDS, values)))
+    row.ts = timestamp_seconds(row.timestamp, row.hash_version)
+    return row
+
+
+class LedgerArchive:
+    """
+    Cold tier of the ledger.
+
+    seal() moves complete runs of old, verified blocks out of the ledger table into compressed
+    segment files; only the hot tail (the last hot_blocks blocks, and never the verification
+    watermark) stays in the database. Segment metadata lives in ledger_segments.
+
+    rows() / iter_rows() / get() read through both tiers in index order, so Blockchain, Merkle
+    proofs and full verification do not care where a block lives.
+    """
+
+    def __init__(self, directory: str = LEDGER_ARCHIVE_DIR, segment_blocks: int = LEDGER_SEGMENT_BLOCKS,
+                 hot_blocks: int = LEDGER_HOT_BLOCKS, appender: LedgerAppender = ledger_appender):
+        self.directory = directory
+        self.segment_blocks = segment_blocks
+        self.hot_blocks = max(hot_blocks, 1)
+        self.appender = appender
+        self._lock = threading.Lock()
+        # Sparse indexes of the (immutable) segments read so far
+        self._indexes = {}
+        # Metrics
+        self.blocks_archived = 0
+        self.last_seal = None
+
+    # --- Sealing ---
+
+    def seal(self, up_to: int) -> int:
+        """
+        Seals every complete segment of blocks with index < up_to (the verification watermark)
+        that lies outside the hot tail. Returns the number of segments sealed.
+        """
+        sealed = 0
+        with self._lock:
+            db = SessionLocal()
+            try:
+                while True:
+                    last = db.query(LedgerSegment).order_by(LedgerSegment.segment_index.desc()).first()
+                    if last is None:
+                        head = db.query(LedgerBlock.index).order_by(LedgerBlock.index.asc()).first()
+                        if head is None:
+                            break
+                        segment_index, first_index, previous = 0, head[0], GENESIS_SEGMENT_HASH
+                    else:
+                        segment_index, first_index, previous = last.segment_index + 1, last.last_index + 1, last.segment_hash
+                    tip = db.query(LedgerBlock.index).order_by(LedgerBlock.index.desc()).first()[0]
+                    last_index = first_index + self.segment_blocks - 1
+                    if last_index >= up_to or last_index > tip - self.hot_blocks:
+                        break
+                    rows = db.query(LedgerBlock).filter(
+                        LedgerBlock.index >= first_index, LedgerBlock.index <= last_index
+                    ).order_by(LedgerBlock.index.asc()).all()
+                    if len(rows) != self.segment_blocks:
+                        break  # Gap in the indices: leave it to chain validation
+                    if not self._seal_segment(db, segment_index, previous, rows):
+                        break
+                    sealed += 1
+                    db.expunge_all()
+            finally:
+                db.close()
+        if sealed:
+            self.last_seal = {"segments": sealed, "finished_at": time.time()}
+        return sealed
+
+    def _seal_segment(self, db, segment_index: int, previous: str, rows: List[LedgerBlock]) -> bool:
+        # 1. Write the files (to temporary names, renamed once complete)
+        os.makedirs(self.directory, exist_ok=True)
+        frames, data = [], []
+        offset = 0
+        for start in range(0, len(rows), FRAME_BLOCKS):
+            chunk = rows[start:start + FRAME_BLOCKS]
+            frame = zlib.compress("\n".join(
+                json.dumps([getattr(row, field) for field in _ROW_FIELDS]) for row in chunk
+            ).encode(), 6)
+            frames.append([chunk[0].index, timestamp_seconds(chunk[0].timestamp, chunk[0].hash_version), offset, len(frame)])
+            data.append(frame)
+            offset += len(frame)
+        data = b"".join(data)
+        index = json.dumps({"first_index": rows[0].index, "last_index": rows[-1].index, "frames": frames}).encode()
+        file_name = f"{segment_index:08d}"
+        for suffix, content in ((".seg", data), (".idx", index)):
+            path = os.path.join(self.directory, file_name + suffix)
+            with open(path + ".tmp", "wb") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(path + ".tmp", 0o444)
+            os.replace(path + ".tmp", path)
+
+        counts = {}
+        for row in rows:
+            counts[row.event_type] = counts.get(row.event_type, 0) + 1
+
+        file_hash = hashlib.sha256(data).hexdigest()
+        index_hash = hashlib.sha256(index).hexdigest()
+        seg_hash = segment_hash(previous, rows[0].index, rows[-1].index, rows[-1].hash, file_hash, index_hash)
+
+        # 2. Link the segment into the live chain. If an earlier attempt recorded it and then failed
+        #    (crash, lost race) the files and hash are identical, so that event is reused
+        reference = f"segment:{segment_index}:{seg_hash}"
+        sealed_block = db.query(LedgerBlock).filter(
+            LedgerBlock.event_type == SEGMENT_EVENT, LedgerBlock.data_reference == reference
+        ).order_by(LedgerBlock.index.asc()).first()
+        if sealed_block is None:
+            sealed_block = self.appender.submit([{
+                "event_type": SEGMENT_EVENT,
+                "key_id": "SYSTEM",
+                "user_id": "SYSTEM",
+                "data_reference": reference
+            }]).result()[0]
+
+        # 3. Record the segment and drop its blocks from the hot table, in one transaction
+        first_index, last_index = rows[0].index, rows[-1].index
+        db.add(LedgerSegment(
+            segment_index=segment_index,
+            first_index=first_index,
+            last_index=last_index,
+            first_timestamp=frames[0][1],
+            last_timestamp=timestamp_seconds(rows[-1].timestamp, rows[-1].hash_version),
+            file_name=file_name,
+            file_hash=file_hash,
+            index_hash=index_hash,
+            last_block_hash=rows[-1].hash,
+            previous_segment_hash=previous,
+            segment_hash=seg_hash,
+            sealed_block_index=sealed_block.index,
+            sealed_at=str(time.time()),
+            event_counts=json.dumps(counts, sort_keys=True)
+        ))
+        db.query(LedgerBlock).filter(
+            LedgerBlock.index >= first_index, LedgerBlock.index <= last_index
+        ).delete(synchronize_session=False)
+        try:
+            db.commit()
+        except IntegrityError:
+            # Another server process sealed it first (its files are identical)
+            db.rollback()
+            return False
+        self.blocks_archived += last_index - first_index + 1
+        return True
+
+    # --- Reading ---
+
+    def segments(self, db) -> List[LedgerSegment]:
+        return db.query(LedgerSegment).order_by(LedgerSegment.segment_index.asc()).all()
+
+    def _index(self, segment: LedgerSegment) -> dict:
+        index = self._indexes.get(segment.segment_index)
+        if index is None:
+            with open(os.path.join(self.directory, segment.file_name + ".idx"), "rb") as f:
+                index = self._indexes[segment.segment_index] = json.loads(f.read())
+        return index
+
+    def _frames(self, segment: LedgerSegment, after: int = None) -> Iterator[List[list]]:
+        """
+        Decompressed frames of a segment, starting at the one holding block after + 1.
+        """
+        frames = self._index(segment)["frames"]
+        start = 0
+        if after is not None:
+            start = max(bisect_right([frame[0] for frame in frames], after + 1) - 1, 0)
+        with open(os.path.join(self.directory, segment.file_name + ".seg"), "rb") as f:
+            for _, _, offset, length in frames[start:]:
+                f.seek(offset)
+                yield [json.loads(line) for line in zlib.decompress(f.read(length)).split(b"\n")]
+
+    def read_segment(self, segment: LedgerSegment, after: int = None) -> Iterator[LedgerBlock]:
+        for frame in self._frames(segment, after):
+            for values in frame:
+                if after is None or values[0] > after:
+                    yield _to_row(values)
+
+    def event_counts(self, segment: LedgerSegment) -> Dict[str, int]:
+        """
+        Blocks per event type in the segment, as recorded when it was sealed. Segments sealed
+        before counts were recorded are read once and the counts stored.
+        """
+        if segment.event_counts:
+            return json.loads(segment.event_counts)
+        counts = {}
+        for row in self.read_segment(segment):
+            counts[row.event_type] = counts.get(row.event_type, 0) + 1
+        db = SessionLocal()
+        try:
+            db.query(LedgerSegment).filter(LedgerSegment.segment_index == segment.segment_index).update(
+                {LedgerSegment.event_counts: json.dumps(counts, sort_keys=True)}, synchronize_session=False)
+            db.commit()
+        finally:
+            db.close()
+        return counts
+
+    def get(self, db, index: int) -> Optional[LedgerBlock]:
+        """
+        The archived block at `index`, reading only the frame that holds it.
+        """
+        segment = db.query(LedgerSegment).filter(
+            LedgerSegment.first_index <= index, LedgerSegment.last_index >= index
+        ).first()
+        if segment is None:
+            return None
+        for row in self.read_segment(segment, after=index - 1):
+            return row if row.index == index else None
+        return None
+
+    def index_at(self, db, timestamp: float) -> Optional[int]:
+        """
+        Index of the first archived block at or after `timestamp` (seconds), from the segment
+        time ranges and the sparse index; None if every archived block is older.
+        """
+        segment = db.query(LedgerSegment).filter(LedgerSegment.last_timestamp >= timestamp).order_by(
+            LedgerSegment.segment_index.asc()).first()
+        if segment is None:
+            return None
+        frames = self._index(segment)["frames"]
+        position = max(bisect_right([frame[1] for frame in frames], timestamp) - 1, 0)
+        for row in self.read_segment(segment, after=frames[position][0] - 1):
+            if row.ts >= timestamp:
+                return row.index
+        return None
+
+    def iter_rows(self, db, after: int = None, last: int = None) -> Iterator[LedgerBlock]:
+        """
+        Ledger rows in index order (after < index <= last) from both tiers.
+        Segments are listed before the hot table is read, in the same transaction, so blocks
+        sealed meanwhile are still read from the table snapshot.
+        """
+        position = after
+        for segment in self.segments(db):
+            if (position is not None and segment.last_index <= position) or (last is not None and segment.first_index > last):
+                continue
+            for row in self.read_segment(segment, after=position):
+                if last is not None and row.index > last:
+                    return
+                yield row
+            position = segment.last_index
+        query = db.query(LedgerBlock)
+        if position is not None:
+            query = query.filter(LedgerBlock.index > position)
+        if last is not None:
+            query = query.filter(LedgerBlock.index <= last)
+        yield from query.order_by(LedgerBlock.index.asc()).execution_options(stream_results=True).yield_per(1000)
+
+    def rows(self, db, first: int, last: int) -> List[LedgerBlock]:
+        return list(self.iter_rows(db, after=first - 1, last=last))
+
+    def first_index(self, db) -> Optional[int]:
+        segment = db.query(LedgerSegment.first_index).order_by(LedgerSegment.segment_index.asc()).first()
+        if segment is not None:
+            return segment[0]
+        head = db.query(LedgerBlock.index).order_by(LedgerBlock.index.asc()).first()
+        return head[0] if head else None
+
+    # --- Verification ---
+
+    def verify(self, db, checkpoints: Dict[int, str] = None, rehash=None) -> dict:
+        """
+        Checks every segment: file and index hashes, the segment hash chain, the chain event
+        recording it, and (through rehash(row) -> hash) every archived block and link.
+        Returns: {"is_valid", "first_bad_index", "error", "blocks", "last_index", "last_hash"}
+        """
+        checkpoints = checkpoints or {}
+        outcome = {"is_valid": True, "first_bad_index": None, "error": None, "blocks": 0,
+                   "last_index": None, "last_hash": None}
+
+        def fail(index, error):
+            outcome.update(is_valid=False, first_bad_index=index, error=f"Block {index}: {error}")
+            return outcome
+
+        previous_segment, previous_hash = GENESIS_SEGMENT_HASH, None
+        segments = self.segments(db)
+        # Pinned blocks before the first segment were deleted with their segments
+        missing = [index for index in checkpoints if segments and index < segments[0].first_index]
+        if missing:
+            return fail(min(missing), "pinned by a signed checkpoint but missing (chain truncated)")
+        for segment in segments:
+            try:
+                with open(os.path.join(self.directory, segment.file_name + ".seg"), "rb") as f:
+                    file_hash = hashlib.sha256(f.read()).hexdigest()
+                with open(os.path.join(self.directory, segment.file_name + ".idx"), "rb") as f:
+                    index_hash = hashlib.sha256(f.read()).hexdigest()
+            except OSError as e:
+                return fail(segment.first_index, f"segment {segment.segment_index} unreadable ({e})")
+            expected = segment_hash(previous_segment, segment.first_index, segment.last_index,
+                                    segment.last_block_hash, file_hash, index_hash)
+            if file_hash != segment.file_hash or index_hash != segment.index_hash or expected != segment.segment_hash:
+                return fail(segment.first_index, f"segment {segment.segment_index} does not match its recorded hash")
+            if segment.previous_segment_hash != previous_segment:
+                return fail(segment.first_index, f"segment {segment.segment_index} is not linked to the one before")
+            sealed = self.get(db, segment.sealed_block_index) or db.query(LedgerBlock).filter(
+                LedgerBlock.index == segment.sealed_block_index).first()
+            if sealed is None or sealed.data_reference != f"segment:{segment.segment_index}:{segment.segment_hash}":
+                return fail(segment.first_index, f"segment {segment.segment_index} is not recorded in the chain")
+
+            expected_index = segment.first_index
+            counts = {}
+            for row in self.read_segment(segment):
+                if row.index != expected_index:
+                    return fail(expected_index, "missing from its segment")
+                if previous_hash is not None and row.previous_hash != previous_hash:
+                    return fail(row.index, "previous_hash does not match the block before")
+                # The chain's first block (genesis) is not re-hashed, as in the hot tier
+                if rehash is not None and previous_hash is not None and rehash(row) != row.hash:
+                    return fail(row.index, "hash does not match the block contents")
+                if checkpoints.get(row.index, row.hash) != row.hash:
+                    return fail(row.index, "hash differs from the signed checkpoint")
+                previous_hash = row.hash
+                expected_index += 1
+                counts[row.event_type] = counts.get(row.event_type, 0) + 1
+                outcome["blocks"] += 1
+            if expected_index != segment.last_index + 1 or previous_hash != segment.last_block_hash:
+                return fail(segment.last_index, f"segment {segment.segment_index} is truncated")
+            if segment.event_counts and json.loads(segment.event_counts) != counts:
+                return fail(segment.first_index, f"segment {segment.segment_index} event counts do not match its blocks")
+            previous_segment = segment.segment_hash
+            outcome["last_index"], outcome["last_hash"] = segment.last_index, segment.last_block_hash
+        return outcome
+
+    def stats(self) -> dict:
+        db = SessionLocal()
+        try:
+            segments = self.segments(db)
+        finally:
+            db.close()
+        return {
+            "segments": len(segments),
+            "archived_through": segments[-1].last_index if segments else None,
+            "blocks_archived": self.blocks_archived,
+            "last_seal": self.last_seal
+        }
+
+    async def run_scheduled(self, verifier, interval_seconds: int = LEDGER_ARCHIVE_INTERVAL_SECONDS):
+        """
+        Every interval_seconds: validate the new blocks, then seal what is cold and verified
+        (started by the FastAPI lifespan).
+        """
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                if await asyncio.to_thread(verifier.verify):
+                    await asyncio.to_thread(self.seal, verifier.verified_through())
+                else:
+                    logger.error("Ledger validation failed, not archiving")
+            except Exception:
+                logger.exception("Ledger archiving failed to run")
+
+
+# Shared by the whole app
+ledger_archive = LedgerArchive()
@@ -0,0 +1,114 @@
+import threading
+import time
+from decouple import config
+from sqlalchemy.exc import IntegrityError
+from .archive import LedgerArchive, ledger_archive
+from .block import Block
+from .merkle import GENESIS_BATCH_HASH, leaf_hash, merkle_root, audit_path, batch_hash
+from app.models import LedgerBlock, LedgerBatch
+from app.database import SessionLocal
+
+# Blocks per Merkle batch (proofs are ~log2 of this many hashes)
+LEDGER_MERKLE_BATCH_SIZE = config("LEDGER_MERKLE_BATCH_SIZE", default=1024, cast=int)
+
+
+class MerkleBatcher:
+    """
+    Seals the ledger into consecutive fixed-size batches with a Merkle root each
+    and serves inclusion proofs for single blocks.
+
+    Only complete batches of verified blocks are sealed (seal(up_to) is given the validation
+    watermark), so a block is provable once its batch has filled up.
+    """
+
+    def __init__(self, batch_size: int = LEDGER_MERKLE_BATCH_SIZE, archive: LedgerArchive = ledger_archive):
+        self.batch_size = batch_size
+        self.archive = archive # Blocks are read through both tiers
+        self._lock = threading.Lock()
+
+    def seal(self, up_to: int) -> int:
+        """
+        Seals every complete batch whose blocks all have index <= up_to.
+        Returns the number of batches sealed.
+        """
+        sealed = 0
+        with self._lock:
+            db = SessionLocal()
+            try:
+                last = db.query(LedgerBatch).order_by(LedgerBatch.batch_index.desc()).first()
+                if last is None:
+                    genesis = self.archive.first_index(db)
+                    if genesis is None:
+                        return 0
+                    batch_index, first_index, previous = 0, genesis, GENESIS_BATCH_HASH
+                else:
+                    batch_index, first_index, previous = last.batch_index + 1, last.last_index + 1, last.batch_hash
+
+                while first_index + self.batch_size - 1 <= up_to:
+                    last_index = first_index + self.batch_size - 1
+                    hashes = [row.hash for row in self.archive.rows(db, first_index, last_index)]
+                    if len(hashes) != self.batch_size:
+                        break  # Gap in the indices: leave it to chain validation
+                    root = merkle_root([leaf_hash(h) for h in hashes]).hex()
+                    batch = LedgerBatch(
+                        batch_index=batch_index,
+                        first_index=first_index,
+                        last_index=last_index,
+                        merkle_root=root,
+                        previous_batch_hash=previous,
+                        batch_hash=batch_hash(previous, root),
+                        sealed_at=str(time.time())
+                    )
+                    db.add(batch)
+                    try:
+                        db.commit()
+                    except IntegrityError:
+                        # Another server process sealed it first
+                        db.rollback()
+                        break
+                    sealed += 1
+                    batch_index, first_index, previous = batch_index + 1, last_index + 1, batch.batch_hash
+            finally:
+                db.close()
+        return sealed
+
+    def proof(self, index: int):
+        """
+        Returns the inclusion proof for the block at `index`, or None while its batch is not
+        sealed. Raises LookupError for blocks that do not exist.
+        """
+        db = SessionLocal()
+        try:
+            block = db.query(LedgerBlock).filter(LedgerBlock.index == index).first() or self.archive.get(db, index)
+            if block is None:
+                raise LookupError(f"No block at index {index}")
+            batch = db.query(LedgerBatch).filter(
+                LedgerBatch.first_index <= index, LedgerBatch.last_index >= index
+            ).first()
+            if batch is None:
+                return None
+            hashes = [row.hash for row in self.archive.rows(db, batch.first_index, batch.last_index)]
+        finally:
+            db.close()
+
+        path = audit_path(index - batch.first_index, [leaf_hash(h) for h in hashes])
+        return {
+            "block": {
+                **Block.from_stored(block.index, block.timestamp, block.event_type, block.key_id, block.user_id,
+                                    block.data_reference, block.previous_hash, block.hash_version).to_dict(),
+                "hash": block.hash # As stored
+            },
+            "batch": {
+                "batch_index": batch.batch_index,
+                "first_index": batch.first_index,
+                "last_index": batch.last_index,
+                "merkle_root": batch.merkle_root,
+                "previous_batch_hash": batch.previous_batch_hash,
+                "batch_hash": batch.batch_hash
+            },
+            "audit_path": [h.hex() for h in path]
+        }
+
+
+# Shared by the whole app
+merkle_batcher = MerkleBatcher()
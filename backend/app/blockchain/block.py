@@ -1,14 +1,43 @@
 import hashlib
 import json
+import struct
 import time
 from typing import Any, Dict
 
+# Block hash formats, recorded per block (LedgerBlock.hash_version) so chains mixing them verify.
+# v1: SHA-256 over sorted-key JSON of the fields; timestamp is a float (stored as str(float)).
+# v2: SHA-256 over a fixed binary encoding:
+#       b"DKB2" | index (u64) | timestamp in nanoseconds (i64)
+#       | event_type, key_id, user_id, data_reference, previous_hash: each i32 length + UTF-8 (-1: None)
+#     timestamp is stored as its integer nanoseconds, so nothing round-trips through float.
+HASH_V1 = 1
+HASH_V2 = 2
+HASH_VERSIONS = (HASH_V1, HASH_V2)
+_V2_MAGIC = b"DKB2"
+_V2_HEADER = struct.Struct(">4sQq")
+_V2_LENGTH = struct.Struct(">i")
+
+def timestamp_seconds(stored_timestamp: str, hash_version: int) -> float:
+    """
+    Seconds since the epoch of a stored block timestamp (LedgerBlock.ts), per hash version.
+    """
+    return int(stored_timestamp) / 1e9 if hash_version == HASH_V2 else float(stored_timestamp)
+
 class Block:
     def __init__(self, index: int, timestamp: float, event_type: str, 
                  key_id: str, user_id: str, data_reference: str, 
-                 previous_hash: str):
+                 previous_hash: str, hash_version: int = HASH_V1, timestamp_ns: int = None):
+        if hash_version not in HASH_VERSIONS:
+            raise ValueError(f"Unsupported block hash version: {hash_version}")
         self.index = index
-        self.timestamp = timestamp
+        self.hash_version = hash_version
+        if hash_version == HASH_V2:
+            # The integer nanoseconds are what gets hashed; timestamp stays in seconds for readers
+            self.timestamp_ns = timestamp_ns if timestamp_ns is not None else int(round(timestamp * 1e9))
+            self.timestamp = self.timestamp_ns / 1e9
+        else:
+            self.timestamp_ns = None
+            self.timestamp = timestamp
         self.event_type = event_type
         self.key_id = key_id
         self.user_id = user_id
@@ -16,7 +45,24 @@ class Block:
         self.previous_hash = previous_hash
         self.hash = self.calculate_hash()
 
+    @classmethod
+    def from_stored(cls, index: int, stored_timestamp: str, event_type: str, key_id: str, user_id: str,
+                    data_reference: str, previous_hash: str, hash_version: int = None) -> "Block":
+        """
+        Rebuilds a block from its ledger row; .hash is recomputed (callers compare or overwrite it).
+        """
+        if hash_version == HASH_V2:
+            return cls(index, None, event_type, key_id, user_id, data_reference, previous_hash,
+                       HASH_V2, int(stored_timestamp))
+        return cls(index, float(stored_timestamp), event_type, key_id, user_id, data_reference, previous_hash)
+
+    def stored_timestamp(self) -> str:
+        # LedgerBlock.timestamp: exactly what the hash covers
+        return str(self.timestamp_ns) if self.hash_version == HASH_V2 else str(self.timestamp)
+
     def calculate_hash(self) -> str:
+        if self.hash_version == HASH_V2:
+            return hashlib.sha256(self._encode_v2()).hexdigest()
         block_string = json.dumps({
             "index": self.index,
             "timestamp": self.timestamp,
@@ -29,6 +75,17 @@ class Block:
         
         return hashlib.sha256(block_string.encode()).hexdigest()
 
+    def _encode_v2(self) -> bytes:
+        parts = [_V2_HEADER.pack(_V2_MAGIC, self.index, self.timestamp_ns)]
+        for field in (self.event_type, self.key_id, self.user_id, self.data_reference, self.previous_hash):
+            if field is None:
+                parts.append(_V2_LENGTH.pack(-1))
+            else:
+                data = field.encode('utf-8')
+                parts.append(_V2_LENGTH.pack(len(data)))
+                parts.append(data)
+        return b"".join(parts)
+
     def to_dict(self) -> Dict[str, Any]:
         return {
             "index": self.index,
@@ -38,5 +95,7 @@ class Block:
             "user_id": self.user_id,
             "data_reference": self.data_reference,
             "previous_hash": self.previous_hash,
-            "hash": self.hash
+            "hash": self.hash,
+            "hash_version": self.hash_version,
+            **({"timestamp_ns": self.timestamp_ns} if self.hash_version == HASH_V2 else {})
         }
@@ -1,106 +1,199 @@
+import asyncio
 import time
-from typing import List
+from typing import Dict, Iterator, List, Optional
 from .block import Block
+from .appender import LedgerAppender, ledger_appender
+from .archive import LedgerArchive, ledger_archive
+from .verification import ChainVerifier, chain_verifier
+from sqlalchemy import func
 from app.models import LedgerBlock
 from app.database import SessionLocal
 import datetime
 
+# Columns the ledger can be filtered on (iter_blocks, /audit/ledger)
+LEDGER_FILTERS = ("event_type", "key_id", "user_id")
+
 class Blockchain:
-    def __init__(self):
+    def __init__(self, appender: LedgerAppender = ledger_appender, verifier: ChainVerifier = chain_verifier,
+                 archive: LedgerArchive = ledger_archive):
         # We don't keep the whole chain in memory anymore for scalability
         # But for validation, we might need to query.
-        pass
+        # Writes go through the shared single-writer appender
+        self.appender = appender
+        self.verifier = verifier
+        # Old blocks are sealed into segment files; reads go through both tiers
+        self.archive = archive
+
+    def _to_block(self, db_b: LedgerBlock) -> Block:
+        b = Block.from_stored(
+            db_b.index,
+            db_b.timestamp, # Parsed per hash version
+            db_b.event_type,
+            db_b.key_id,
+            db_b.user_id,
+            db_b.data_reference,
+            db_b.previous_hash,
+            db_b.hash_version
+        )
+        b.hash = db_b.hash
+        return b
+
+    def _latest_block(self, db) -> Block:
+        # Get block with max index
+        last_db_block = db.query(LedgerBlock).order_by(LedgerBlock.index.desc()).first()
+        if not last_db_block:
+            # Should have been created by init_db, but if not:
+            return Block(0, time.time(), "GENESIS", "SYSTEM", "SYSTEM", "GENESIS_BLOCK", "0")
+        return self._to_block(last_db_block)
 
     def get_latest_block(self) -> Block:
         db = SessionLocal()
         try:
-            # Get block with max index
-            last_db_block = db.query(LedgerBlock).order_by(LedgerBlock.index.desc()).first()
-            if not last_db_block:
-                # Should have been created by init_db, but if not:
-                return Block(0, time.time(), "GENESIS", "SYSTEM", "SYSTEM", "GENESIS_BLOCK", "0")
-            
-            return Block(
-                last_db_block.index,
-                float(last_db_block.timestamp), # Convert string back to float
-                last_db_block.event_type,
-                last_db_block.key_id,
-                last_db_block.user_id,
-                last_db_block.data_reference,
-                last_db_block.previous_hash
-            )
+            return self._latest_block(db)
         finally:
             db.close()
 
     def add_block(self, event_type: str, key_id: str, user_id: str, data_reference: str):
-        latest_block = self.get_latest_block()
-        new_index = latest_block.index + 1
-        new_timestamp = time.time()
-        
-        # Calculate hash (using Block class logic)
-        # Block(index, timestamp, event_type, key_id, user_id, data_reference, previous_hash)
-        temp_block = Block(
-            new_index,
-            new_timestamp,
-            event_type,
-            key_id,
-            user_id,
-            data_reference,
-            latest_block.hash # Use hash of previous block
-        )
-        
-        # Save to DB
+        return self.add_blocks([{
+            "event_type": event_type,
+            "key_id": key_id,
+            "user_id": user_id,
+            "data_reference": data_reference
+        }])[0]
+
+    def add_blocks(self, events: List[Dict[str, str]]) -> List[Block]:
+        """
+        Appends several events as consecutive blocks in one transaction (grouped with other
+        callers' events while the ledger appender runs). Returns once they are committed.
+        Each event is a dict with event_type, key_id, user_id and data_reference.
+        """
+        if not events:
+            return []
+        return self.appender.submit(events).result()
+
+    async def add_block_async(self, event_type: str, key_id: str, user_id: str, data_reference: str, wait: bool = True):
+        blocks = await self.add_blocks_async([{
+            "event_type": event_type,
+            "key_id": key_id,
+            "user_id": user_id,
+            "data_reference": data_reference
+        }], wait=wait)
+        return blocks[0] if blocks else None
+
+    async def add_blocks_async(self, events: List[Dict[str, str]], wait: bool = True) -> List[Block]:
+        """
+        Like add_blocks, without blocking the event loop while the batch commits.
+        wait=False returns as soon as the events are queued (not yet durable).
+        """
+        if not events:
+            return []
+        future = self.appender.submit(events)
+        if not wait:
+            return []
+        return await asyncio.wrap_future(future)
+
+    def get_block(self, index: int) -> Optional[Block]:
         db = SessionLocal()
         try:
-            db_block = LedgerBlock(
-                index=new_index,
-                timestamp=str(new_timestamp), # Store as string
-                event_type=event_type,
-                key_id=key_id,
-                user_id=user_id,
-                data_reference=data_reference,
-                previous_hash=latest_block.hash,
-                hash=temp_block.hash
-            )
-            db.add(db_block)
-            db.commit()
-            return temp_block
+            db_b = db.query(LedgerBlock).filter(LedgerBlock.index == index).first() or self.archive.get(db, index)
+            return self._to_block(db_b) if db_b else None
         finally:
             db.close()
 
-    def get_chain(self) -> List[Block]:
+    def iter_blocks(self, after: int = None, limit: int = None, filters: Dict[str, str] = None,
+                    chunk_size: int = 1000, since: float = None, until: float = None) -> Iterator[Block]:
         """
-        Retrieves the full chain from the database.
+        Yields blocks in index order (index > after, matching every filter in LEDGER_FILTERS,
+        since <= timestamp < until) without loading the chain: archived segments a frame at a
+        time, then the ledger table from a server-side cursor, chunk_size rows at a time.
+        Filters on the table run in SQL (indexes on (column, ts) and ts).
         """
+        filters = filters or {}
+        for column in filters:
+            if column not in LEDGER_FILTERS:
+                raise ValueError(f"Cannot filter the ledger on {column}")
+
+        def wanted(db_b) -> bool:
+            return ((since is None or db_b.ts >= since) and (until is None or db_b.ts < until)
+                    and all(getattr(db_b, column) == value for column, value in filters.items()))
+
         db = SessionLocal()
         try:
-            db_blocks = db.query(LedgerBlock).order_by(LedgerBlock.index.asc()).all()
-            chain = []
-            for db_b in db_blocks:
-                b = Block(
-                    db_b.index,
-                    float(db_b.timestamp), # Convert string back to float
-                    db_b.event_type,
-                    db_b.key_id,
-                    db_b.user_id,
-                    db_b.data_reference,
-                    db_b.previous_hash
-                )
-                b.hash = db_b.hash
-                chain.append(b)
-            return chain
+            # 1. Archived segments. They are listed before the table is read, in the same
+            # transaction, so blocks sealed meanwhile are still read from the table snapshot.
+            position = after
+            if since is not None:
+                # Skip straight to the first archived block in range (sparse time index)
+                start = self.archive.index_at(db, since)
+                if start is not None and (position is None or start - 1 > position):
+                    position = start - 1
+            for segment in self.archive.segments(db):
+                if position is not None and segment.last_index <= position:
+                    continue
+                if (since is not None and segment.last_timestamp < since) or (until is not None and segment.first_timestamp >= until):
+                    position = segment.last_index
+                    continue
+                for db_b in self.archive.read_segment(segment, after=position):
+                    if wanted(db_b):
+                        if limit is not None and limit <= 0:
+                            return
+                        yield self._to_block(db_b)
+                        limit = limit - 1 if limit is not None else None
+                position = segment.last_index
+            if limit is not None and limit <= 0:
+                return
+
+            # 2. Hot tail
+            query = db.query(LedgerBlock)
+            if position is not None:
+                query = query.filter(LedgerBlock.index > position)
+            for column, value in filters.items():
+                query = query.filter(getattr(LedgerBlock, column) == value)
+            if since is not None:
+                query = query.filter(LedgerBlock.ts >= since)
+            if until is not None:
+                query = query.filter(LedgerBlock.ts < until)
+            query = query.order_by(LedgerBlock.index.asc())
+            if limit is not None:
+                query = query.limit(limit)
+            for db_b in query.execution_options(stream_results=True).yield_per(chunk_size):
+                yield self._to_block(db_b)
         finally:
             db.close()
 
-    def is_chain_valid(self) -> bool:
-        chain = self.get_chain()
-        for i in range(1, len(chain)):
-            current_block = chain[i]
-            previous_block = chain[i-1]
+    def count_events(self) -> Dict[str, int]:
+        """
+        Number of blocks per event_type across both tiers (GROUP BY on the table, per-segment
+        counts stored in ledger_segments for the archive).
+        """
+        db = SessionLocal()
+        try:
+            counts = {}
+            archived_through = None
+            for segment in self.archive.segments(db):
+                for event_type, count in self.archive.event_counts(segment).items():
+                    counts[event_type] = counts.get(event_type, 0) + count
+                archived_through = segment.last_index
+            query = db.query(LedgerBlock.event_type, func.count(LedgerBlock.id))
+            if archived_through is not None:
+                query = query.filter(LedgerBlock.index > archived_through)
+            for event_type, count in query.group_by(LedgerBlock.event_type):
+                counts[event_type] = counts.get(event_type, 0) + count
+            return counts
+        finally:
+            db.close()
 
-            if current_block.hash != current_block.calculate_hash():
-                return False
+    def get_chain(self) -> List[Block]:
+        """
+        Retrieves the full chain (archived segments and the ledger table).
+        """
+        return list(self.iter_blocks())
 
-            if current_block.previous_hash != previous_block.hash:
-                return False
-        return True
+    def is_chain_valid(self, full: bool = False) -> bool:
+        """
+        Routine validation only re-hashes blocks appended since the last verified one
+        (see verification.py); full=True re-verifies the whole chain.
+        """
+        if full:
+            return self.verifier.verify_full()["is_valid"]
+        return self.verifier.verify()
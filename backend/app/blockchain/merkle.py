@@ -0,0 +1,111 @@
+import hashlib
+from typing import List
+from .block import Block
+
+# Merkle trees over ledger batches (RFC 6962 / RFC 9162 hashing)
+#
+#   leaf     = SHA-256(0x00 | block hash bytes)
+#   node     = SHA-256(0x01 | left | right)
+#   batch    = SHA-256(previous batch hash | merkle root)   (hex strings, genesis: "0" * 64)
+#
+# Trees of any size split at the largest power of two below n, so proofs are at most
+# ceil(log2(n)) hashes. This module has no database dependency: auditors can run
+# verify_proof() offline against a proof from /audit/proof/{index}.
+GENESIS_BATCH_HASH = "0" * 64
+
+
+def leaf_hash(block_hash: str) -> bytes:
+    return hashlib.sha256(b"\x00" + bytes.fromhex(block_hash)).digest()
+
+
+def _node(left: bytes, right: bytes) -> bytes:
+    return hashlib.sha256(b"\x01" + left + right).digest()
+
+
+def _split(n: int) -> int:
+    # Largest power of two strictly below n
+    return 1 << ((n - 1).bit_length() - 1)
+
+
+def merkle_root(leaves: List[bytes]) -> bytes:
+    if not leaves:
+        return hashlib.sha256(b"").digest()
+    if len(leaves) == 1:
+        return leaves[0]
+    k = _split(len(leaves))
+    return _node(merkle_root(leaves[:k]), merkle_root(leaves[k:]))
+
+
+def audit_path(position: int, leaves: List[bytes]) -> List[bytes]:
+    """
+    Sibling hashes from the leaf at `position` up to the root (leaf level first).
+    """
+    if len(leaves) <= 1:
+        return []
+    k = _split(len(leaves))
+    if position < k:
+        return audit_path(position, leaves[:k]) + [merkle_root(leaves[k:])]
+    return audit_path(position - k, leaves[k:]) + [merkle_root(leaves[:k])]
+
+
+def verify_inclusion(leaf: bytes, position: int, tree_size: int, path: List[bytes], root: bytes) -> bool:
+    """
+    RFC 9162 (2.1.3.2) inclusion check, in O(log n).
+    """
+    if not 0 <= position < tree_size:
+        return False
+    fn, sn, r = position, tree_size - 1, leaf
+    for p in path:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            r = _node(p, r)
+            while not fn & 1 and fn != 0:
+                fn >>= 1
+                sn >>= 1
+        else:
+            r = _node(r, p)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and r == root
+
+
+def batch_hash(previous_batch_hash: str, root: str) -> str:
+    return hashlib.sha256((previous_batch_hash + root).encode()).hexdigest()
+
+
+def verify_proof(proof: dict) -> bool:
+    """
+    Checks a proof as returned by /audit/proof/{index}:
+    the block's hash matches its fields, the block is a leaf of the batch's Merkle root,
+    and the batch hash commits to that root.
+    """
+    try:
+        block = proof["block"]
+        batch = proof["batch"]
+        computed = Block(
+            block["index"],
+            block["timestamp"],
+            block["event_type"],
+            block["key_id"],
+            block["user_id"],
+            block["data_reference"],
+            block["previous_hash"],
+            block.get("hash_version", 1),
+            block.get("timestamp_ns")
+        ).hash
+        if computed != block["hash"]:
+            return False
+        if not batch["first_index"] <= block["index"] <= batch["last_index"]:
+            return False
+        if batch_hash(batch["previous_batch_hash"], batch["merkle_root"]) != batch["batch_hash"]:
+            return False
+        return verify_inclusion(
+            leaf_hash(block["hash"]),
+            block["index"] - batch["first_index"],
+            batch["last_index"] - batch["first_index"] + 1,
+            [bytes.fromhex(h) for h in proof["audit_path"]],
+            bytes.fromhex(batch["merkle_root"])
+        )
+    except (KeyError, TypeError, ValueError):
+        return False
@@ -0,0 +1,176 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decouple import config
+from sqlalchemy import create_engine, func, select
+from .block import Block
+from app.models import LedgerBlock
+
+# Worker processes for full-chain verification (1 verifies inline)
+LEDGER_VERIFY_WORKERS = config("LEDGER_VERIFY_WORKERS", default=os.cpu_count() or 1, cast=int)
+# Blocks per chunk handed to one worker
+LEDGER_VERIFY_CHUNK_SIZE = config("LEDGER_VERIFY_CHUNK_SIZE", default=100000, cast=int)
+# Rows fetched per round trip inside a chunk
+FETCH_SIZE = 10000
+
+_COLUMNS = [
+    LedgerBlock.index,
+    LedgerBlock.timestamp,
+    LedgerBlock.event_type,
+    LedgerBlock.key_id,
+    LedgerBlock.user_id,
+    LedgerBlock.data_reference,
+    LedgerBlock.previous_hash,
+    LedgerBlock.hash,
+    LedgerBlock.hash_version
+]
+
+# One engine per database URL and process
+_engines = {}
+
+
+def _engine(database_url: str):
+    engine = _engines.get(database_url)
+    if engine is None:
+        connect_args = {"check_same_thread": False} if database_url.startswith("sqlite") else {}
+        engine = _engines[database_url] = create_engine(database_url, connect_args=connect_args)
+    return engine
+
+
+def verify_chunk(database_url: str, first_index: int, last_index: int, check_first: bool, checkpoints: dict) -> dict:
+    """
+    Re-hashes the blocks with first_index <= index <= last_index and checks the links and the
+    index sequence inside the range (and the pinned checkpoint hashes). Links into the range are
+    checked by the caller.
+    Module-level (and self-contained) so it can run on the worker processes.
+    check_first: also re-hash the range's first block (False for the chain's first block, genesis).
+    """
+    result = {
+        "first_index": first_index,
+        "last_index": last_index,
+        "count": 0,
+        "head_index": None,
+        "head_previous_hash": None,
+        "tail_index": None,
+        "tail_hash": None,
+        "bad_index": None,
+        "error": None
+    }
+    query = select(*_COLUMNS).where(
+        LedgerBlock.index >= first_index, LedgerBlock.index <= last_index
+    ).order_by(LedgerBlock.index.asc())
+    previous_hash = None
+    previous_index = None
+    with _engine(database_url).connect() as conn:
+        rows = conn.execution_options(stream_results=True, yield_per=FETCH_SIZE).execute(query)
+        for index, timestamp, event_type, key_id, user_id, data_reference, block_previous_hash, block_hash, hash_version in rows:
+            error = None
+            if previous_hash is None:
+                result["head_index"] = index
+                result["head_previous_hash"] = block_previous_hash
+            elif index != previous_index + 1:
+                error = "index does not follow the block before (blocks missing)"
+            elif block_previous_hash != previous_hash:
+                error = "previous_hash does not match the block before"
+            if error is None and (previous_hash is not None or check_first):
+                computed = Block.from_stored(index, timestamp, event_type, key_id, user_id,
+                                             data_reference, block_previous_hash, hash_version).hash
+                if computed != block_hash:
+                    error = "hash does not match the block contents"
+            if error is None and checkpoints.get(index, block_hash) != block_hash:
+                error = "hash differs from the signed checkpoint"
+            if error is not None:
+                result["bad_index"] = index
+                result["error"] = error
+                break
+            previous_hash = block_hash
+            previous_index = index
+            result["count"] += 1
+            result["tail_index"] = index
+            result["tail_hash"] = block_hash
+    return result
+
+
+class ParallelChainVerifier:
+    """
+    Full-chain verification split into index chunks.
+
+    Worker processes re-hash and link-check one chunk each; a final pass checks the links
+    between consecutive chunks. Reports the first bad index and keeps `progress` up to date
+    while running. Workers read the database themselves, so only small results cross processes.
+    """
+
+    def __init__(self, workers: int = LEDGER_VERIFY_WORKERS, chunk_size: int = LEDGER_VERIFY_CHUNK_SIZE):
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.progress = None
+
+    def run(self, database_url: str, checkpoints: dict = None, anchor: tuple = None) -> dict:
+        """
+        anchor: (index, hash) of the last archived block, when older blocks live in segment
+        files (see archive.py): the table's first block then links to it and is re-hashed.
+        Every checkpoint after the anchor must be in the table: one past its tail (or head)
+        means the chain was truncated.
+        Returns: {"is_valid", "first_bad_index", "error", "blocks", "last_index", "last_hash"}
+        """
+        checkpoints = checkpoints or {}
+        with _engine(database_url).connect() as conn:
+            lowest, highest = conn.execute(select(func.min(LedgerBlock.index), func.max(LedgerBlock.index))).one()
+        # Pinned blocks outside the table's range were deleted
+        missing = [index for index in checkpoints if (anchor is None or index > anchor[0])
+                   and (lowest is None or not lowest <= index <= highest)]
+        if missing:
+            return {"is_valid": False, "first_bad_index": min(missing), "blocks": 0, "last_index": None, "last_hash": None,
+                    "error": f"Block {min(missing)}: pinned by a signed checkpoint but missing (chain truncated)"}
+        if lowest is None:
+            return {"is_valid": True, "first_bad_index": None, "error": None, "blocks": 0, "last_index": None, "last_hash": None}
+
+        chunks = [(start, min(start + self.chunk_size - 1, highest))
+                  for start in range(lowest, highest + 1, self.chunk_size)]
+        self.progress = {"chunks_total": len(chunks), "chunks_done": 0, "blocks_done": 0, "started_at": time.time()}
+
+        def job(i):
+            first, last = chunks[i]
+            return (verify_chunk, database_url, first, last, i > 0 or anchor is not None,
+                    {k: v for k, v in checkpoints.items() if first <= k <= last})
+
+        results = [None] * len(chunks)
+        workers = min(self.workers, len(chunks))
+        if workers > 1:
+            # spawn, not fork: the server process holds DB connections and threads
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+                futures = {executor.submit(*job(i)): i for i in range(len(chunks))}
+                for future in as_completed(futures):
+                    results[futures[future]] = self._done(future.result())
+        else:
+            for i in range(len(chunks)):
+                fn, *args = job(i)
+                results[i] = self._done(fn(*args))
+
+        # Links between chunks, then the first failure in index order
+        failures = [(r["bad_index"], r["error"]) for r in results if r["bad_index"] is not None]
+        previous = {"tail_index": anchor[0], "tail_hash": anchor[1]} if anchor is not None else None
+        for r in results:
+            if r["head_index"] is None:
+                continue
+            if previous is not None and previous["tail_hash"] is not None:
+                if r["head_index"] != previous["tail_index"] + 1:
+                    failures.append((r["head_index"], "index does not follow the block before (blocks missing)"))
+                elif r["head_previous_hash"] != previous["tail_hash"]:
+                    failures.append((r["head_index"], "previous_hash does not match the block before"))
+            previous = r
+        first_bad = min(failures) if failures else None
+        return {
+            "is_valid": first_bad is None,
+            "first_bad_index": first_bad[0] if first_bad else None,
+            "error": f"Block {first_bad[0]}: {first_bad[1]}" if first_bad else None,
+            "blocks": sum(r["count"] for r in results),
+            "last_index": previous["tail_index"] if previous else None,
+            "last_hash": previous["tail_hash"] if previous else None
+        }
+
+    def _done(self, result: dict) -> dict:
+        self.progress["chunks_done"] += 1
+        self.progress["blocks_done"] += result["count"]
+        return result
@@ -1,5 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, Depends, HTTPException, Header
+from fastapi.responses import StreamingResponse
+import asyncio
+import json
 from app.blockchain.chain import Blockchain
+from app.blockchain.batches import merkle_batcher
 from app.rbac.dependencies import RoleChecker, UserRole
 
 router = APIRouter()
@@ -8,8 +12,51 @@ blockchain = Blockchain()
 # RBAC: Only AUDITOR and ADMIN can view the ledger
 allow_audit = RoleChecker([UserRole.AUDITOR, UserRole.ADMIN])
 
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+# Page sizes for cursor pagination of /ledger
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
 @router.get("/ledger", dependencies=[Depends(allow_audit)])
-async def get_ledger():
+async def get_ledger(
+    after: int = None,
+    limit: int = None,
+    event_type: str = None,
+    key_id: str = None,
+    user_id: str = None,
+    stream: bool = False,
+    accept: str = Header(None)
+):
+    """
+    Without parameters: the whole chain, as before.
+    ?after=<index>&limit=<n> (+ event_type / key_id / user_id filters): one page in index order,
+    with next_cursor and the page's boundary hashes.
+    ?stream=true or Accept: application/x-ndjson: one block per line from a server-side cursor,
+    then a final {"end": ...} line.
+    """
+    filters = {k: v for k, v in {"event_type": event_type, "key_id": key_id, "user_id": user_id}.items() if v is not None}
+    streaming = stream or (accept is not None and NDJSON_MEDIA_TYPE in accept)
+    if after is None and limit is None and not filters and not streaming:
+        return await _full_ledger()
+    
+    # Integrity: only the blocks appended since the last validation are re-hashed
+    if not await asyncio.to_thread(blockchain.is_chain_valid):
+        raise HTTPException(status_code=500, detail="Blockchain integrity compromised!")
+    
+    if streaming:
+        return StreamingResponse(_stream_ledger(after, limit, filters), media_type=NDJSON_MEDIA_TYPE)
+    
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    blocks = await asyncio.to_thread(lambda: list(blockchain.iter_blocks(after, limit, filters)))
+    return {
+        "chain": [block.to_dict() for block in blocks],
+        "next_cursor": blocks[-1].index if len(blocks) == limit else None,
+        "page": _page_integrity(blocks, filters)
+    }
+
+async def _full_ledger():
     try:
         # No need to load_chain() manually, get_chain() queries DB
         chain = blockchain.get_chain()
@@ -22,7 +69,96 @@ async def get_ledger():
         print(f"DEBUG: Ledger Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def _page_integrity(blocks: list, filters: dict) -> dict:
+    """
+    Boundary hashes of a page. Clients re-hash each block (Block.calculate_hash); on unfiltered
+    pages they also check the links inside the page and that previous_hash equals the last_hash
+    of the page before (blocks up to verified_through passed server-side validation).
+    """
+    return {
+        "first_index": blocks[0].index if blocks else None,
+        "last_index": blocks[-1].index if blocks else None,
+        "previous_hash": blocks[0].previous_hash if blocks else None,
+        "last_hash": blocks[-1].hash if blocks else None,
+        "contiguous": not filters,
+        "verified_through": blockchain.verifier.verified_through()
+    }
+
+def _stream_ledger(after: int, limit: int, filters: dict):
+    # Plain generator: Starlette iterates it in a worker thread, off the event loop
+    count = 0
+    last = None
+    for block in blockchain.iter_blocks(after, limit, filters):
+        yield json.dumps(block.to_dict()) + "\n"
+        count += 1
+        last = block
+    yield json.dumps({"end": {
+        "count": count,
+        "last_index": last.index if last else None,
+        "last_hash": last.hash if last else None
+    }}) + "\n"
+
+@router.get("/events", dependencies=[Depends(allow_audit)])
+async def get_events(
+    start: float = None,
+    end: float = None,
+    event_type: str = None,
+    user_id: str = None,
+    key_id: str = None,
+    after: int = None,
+    limit: int = None
+):
+    """
+    Ledger events in a time range (start <= timestamp < end, seconds since the epoch), optionally
+    for one event type, user or key. Filters run in SQL on the indexed ts columns; pages follow
+    index order, continue with ?after=<next_cursor>.
+    """
+    if start is not None and end is not None and start > end:
+        raise HTTPException(status_code=400, detail="start must not be after end")
+    limit = min(limit or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    filters = {k: v for k, v in {"event_type": event_type, "key_id": key_id, "user_id": user_id}.items() if v is not None}
+    
+    if not await asyncio.to_thread(blockchain.is_chain_valid):
+        raise HTTPException(status_code=500, detail="Blockchain integrity compromised!")
+    
+    blocks = await asyncio.to_thread(lambda: list(blockchain.iter_blocks(after, limit, filters, since=start, until=end)))
+    return {
+        "events": [block.to_dict() for block in blocks],
+        "next_cursor": blocks[-1].index if len(blocks) == limit else None
+    }
+
 @router.get("/validate", dependencies=[Depends(allow_audit)])
-async def validate_chain():
-    is_valid = blockchain.is_chain_valid()
+async def validate_chain(full: bool = False):
+    """
+    Verifies blocks appended since the last validation; ?full=true re-verifies the whole chain.
+    """
+    if full:
+        return await asyncio.to_thread(blockchain.verifier.verify_full)
+    is_valid = await asyncio.to_thread(blockchain.is_chain_valid)
     return {"is_valid": is_valid}
+
+@router.get("/proof/{index}", dependencies=[Depends(allow_audit)])
+async def get_inclusion_proof(index: int):
+    """
+    Merkle inclusion proof for one block, checkable offline with
+    app.blockchain.merkle.verify_proof (O(log n) hashes).
+    """
+    # Only blocks that passed validation get sealed into a batch
+    if not await asyncio.to_thread(blockchain.is_chain_valid):
+        raise HTTPException(status_code=500, detail="Blockchain integrity compromised!")
+    verified_through = blockchain.verifier.verified_through()
+    if verified_through is not None:
+        await asyncio.to_thread(merkle_batcher.seal, verified_through)
+    
+    try:
+        proof = await asyncio.to_thread(merkle_batcher.proof, index)
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    if proof is None:
+        raise HTTPException(
+            status_code=409,
+            detail=f"Block {index} is in a batch that is not sealed yet (batches of {merkle_batcher.batch_size} blocks)"
+        )
+    return proof
@@ -0,0 +1,272 @@
+import asyncio
+import hashlib
+import hmac
+import logging
+import threading
+import time
+from typing import Callable
+from decouple import config
+from .archive import LedgerArchive, ledger_archive
+from .block import Block
+from .parallel_verify import ParallelChainVerifier
+from app.models import LedgerBlock, LedgerCheckpoint
+from app.database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Signs checkpoints, so rewriting the ledger *and* its checkpoints needs this key
+# NOTE: In production, set it through the environment!
+LEDGER_CHECKPOINT_KEY = config("LEDGER_CHECKPOINT_KEY", default="ledger-checkpoint-key-please-change-in-production")
+# Every n-th block hash is pinned by a signed checkpoint
+LEDGER_CHECKPOINT_INTERVAL = config("LEDGER_CHECKPOINT_INTERVAL", default=1000, cast=int)
+# Full re-verification schedule (0 disables it)
+LEDGER_FULL_VERIFY_INTERVAL_SECONDS = config("LEDGER_FULL_VERIFY_INTERVAL_SECONDS", default=86400, cast=int)
+# Rows fetched per round trip while scanning
+VERIFY_PAGE_SIZE = 5000
+
+WATERMARK = "watermark"
+CHECKPOINT = "checkpoint"
+
+
+def sign_checkpoint(kind: str, block_index: int, block_hash: str, verified_at: str) -> str:
+    message = f"{kind}|{block_index}|{block_hash}|{verified_at}".encode()
+    return hmac.new(LEDGER_CHECKPOINT_KEY.encode(), message, hashlib.sha256).hexdigest()
+
+
+def _is_signed(record: LedgerCheckpoint) -> bool:
+    expected = sign_checkpoint(record.kind, record.block_index, record.block_hash, record.verified_at)
+    return hmac.compare_digest(expected, record.signature or "")
+
+
+def _computed_hash(row: LedgerBlock) -> str:
+    return Block.from_stored(
+        row.index,
+        row.timestamp,
+        row.event_type,
+        row.key_id,
+        row.user_id,
+        row.data_reference,
+        row.previous_hash,
+        row.hash_version
+    ).hash
+
+
+class ChainVerifier:
+    """
+    Validates the ledger incrementally.
+
+    - verify() starts from the signed watermark (last verified index and hash): it checks the
+      watermark block is unchanged, re-hashes only the blocks appended since, and moves the
+      watermark forward. Its cost follows the number of new events, not the chain length.
+    - verify_full() re-hashes the whole chain (archived segments, then the table in parallel
+      chunks) and checks it against the signed checkpoints.
+      Every checkpoint and the watermark must still be in the chain, so truncating it fails.
+      It runs on a schedule (run_scheduled) and on the first validation (no watermark, no
+      checkpoints); a missing or badly signed watermark afterwards is a failure.
+      A scheduled run that fails (or cannot run) is logged, kept in last_full and passed to the
+      listeners (add_listener), e.g. to raise an alert.
+    """
+
+    def __init__(self, checkpoint_interval: int = LEDGER_CHECKPOINT_INTERVAL, parallel: ParallelChainVerifier = None,
+                 archive: LedgerArchive = ledger_archive):
+        self.checkpoint_interval = checkpoint_interval
+        self.parallel = parallel or ParallelChainVerifier()
+        self.archive = archive
+        self._lock = threading.Lock()
+        self.last_full = None
+        self._listeners = []
+        # Metrics
+        self.incremental_runs = 0
+        self.blocks_verified = 0
+
+    def verify(self) -> bool:
+        with self._lock:
+            db = SessionLocal()
+            try:
+                watermark = db.query(LedgerCheckpoint).filter(LedgerCheckpoint.kind == WATERMARK).first()
+                if watermark is None:
+                    # First validation, unless checkpoints show the chain was verified before
+                    return self._verify_full(db)["is_valid"]
+                if not _is_signed(watermark):
+                    return False
+
+                anchor = db.query(LedgerBlock).filter(LedgerBlock.index == watermark.block_index).first()
+                if anchor is None or anchor.hash != watermark.block_hash:
+                    return False
+                self.incremental_runs += 1
+                is_valid, last, count = self._scan(db, anchor)
+                self.blocks_verified += count
+                if is_valid and last.index != watermark.block_index:
+                    self._save(db, watermark, last)
+                return is_valid
+            finally:
+                db.close()
+
+    def verify_full(self) -> dict:
+        with self._lock:
+            db = SessionLocal()
+            try:
+                return self._verify_full(db)
+            finally:
+                db.close()
+
+    def _verify_full(self, db) -> dict:
+        started = time.monotonic()
+        checkpoints = {}
+        error = None
+        for record in db.query(LedgerCheckpoint).filter(LedgerCheckpoint.kind == CHECKPOINT):
+            if not _is_signed(record):
+                error = f"Checkpoint at block {record.block_index} has an invalid signature"
+                break
+            checkpoints[record.block_index] = record.block_hash
+        # The watermark pins its block like a checkpoint: the chain may not end before it
+        watermark = db.query(LedgerCheckpoint).filter(LedgerCheckpoint.kind == WATERMARK).first()
+        if error is None:
+            if watermark is None and checkpoints:
+                error = "Ledger watermark is missing although checkpoints exist"
+            elif watermark is not None and not _is_signed(watermark):
+                error = "Ledger watermark has an invalid signature"
+            elif watermark is not None:
+                if checkpoints.get(watermark.block_index, watermark.block_hash) != watermark.block_hash:
+                    error = f"Watermark and checkpoint at block {watermark.block_index} disagree"
+                checkpoints[watermark.block_index] = watermark.block_hash
+
+        if error is None:
+            # Archived segments first, then the table in chunks on worker processes (see parallel_verify.py)
+            archived = self.archive.verify(db, checkpoints, _computed_hash)
+            if not archived["is_valid"]:
+                outcome = archived
+            else:
+                anchor = (archived["last_index"], archived["last_hash"]) if archived["last_index"] is not None else None
+                database_url = db.get_bind().url.render_as_string(hide_password=False)
+                outcome = self.parallel.run(database_url, checkpoints, anchor)
+                outcome["blocks"] += archived["blocks"]
+        else:
+            outcome = {"is_valid": False, "first_bad_index": None, "error": error, "blocks": 0, "last_index": None}
+        if outcome["is_valid"] and outcome["last_index"] is not None:
+            last = db.query(LedgerBlock).filter(LedgerBlock.index == outcome["last_index"]).one()
+            self._save(db, watermark, last)
+
+        self.last_full = {
+            "is_valid": outcome["is_valid"],
+            "verified_through": outcome["last_index"] if outcome["is_valid"] else None,
+            "first_bad_index": outcome["first_bad_index"],
+            "blocks": outcome["blocks"],
+            "seconds": time.monotonic() - started,
+            "finished_at": time.time(),
+            "error": outcome["error"]
+        }
+        return self.last_full
+
+    def _scan(self, db, previous: LedgerBlock):
+        """
+        Walks the blocks after `previous` in index order, a page at a time.
+        Returns (is_valid, last good block, blocks checked).
+        """
+        count = 0
+        while True:
+            rows = db.query(LedgerBlock).filter(LedgerBlock.index > previous.index).order_by(
+                LedgerBlock.index.asc()).limit(VERIFY_PAGE_SIZE).all()
+            if not rows:
+                return True, previous, count
+            for row in rows:
+                if row.hash != _computed_hash(row) or row.previous_hash != previous.hash:
+                    return False, previous, count
+                previous = row
+                count += 1
+            db.expunge_all()
+
+    def _save(self, db, watermark: LedgerCheckpoint, last: LedgerBlock):
+        """
+        Moves the watermark forward to `last` and pins the checkpoint blocks it passed.
+        """
+        if watermark is not None and last.index < watermark.block_index:
+            raise ValueError(f"Ledger watermark cannot move back from {watermark.block_index} to {last.index}")
+        verified_at = str(time.time())
+        since = watermark.block_index if watermark is not None else 0
+        interval = self.checkpoint_interval
+        pinned = range((since // interval + 1) * interval, last.index + 1, interval) if interval > 0 else []
+        if pinned:
+            existing = {index for (index,) in db.query(LedgerCheckpoint.block_index).filter(
+                LedgerCheckpoint.kind == CHECKPOINT, LedgerCheckpoint.block_index.in_(list(pinned)))}
+            for row in db.query(LedgerBlock).filter(LedgerBlock.index.in_([i for i in pinned if i not in existing])):
+                db.add(LedgerCheckpoint(
+                    kind=CHECKPOINT,
+                    block_index=row.index,
+                    block_hash=row.hash,
+                    verified_at=verified_at,
+                    signature=sign_checkpoint(CHECKPOINT, row.index, row.hash, verified_at)
+                ))
+
+        if watermark is None:
+            watermark = LedgerCheckpoint(kind=WATERMARK)
+            db.add(watermark)
+        else:
+            watermark = db.merge(watermark)
+        watermark.block_index = last.index
+        watermark.block_hash = last.hash
+        watermark.verified_at = verified_at
+        watermark.signature = sign_checkpoint(WATERMARK, last.index, last.hash, verified_at)
+        db.commit()
+
+    def verified_through(self):
+        """
+        Index of the last verified block (None before the first validation).
+        """
+        db = SessionLocal()
+        try:
+            watermark = db.query(LedgerCheckpoint).filter(LedgerCheckpoint.kind == WATERMARK).first()
+        finally:
+            db.close()
+        return watermark.block_index if watermark is not None else None
+
+    def stats(self) -> dict:
+        return {
+            "verified_through": self.verified_through(),
+            "incremental_runs": self.incremental_runs,
+            "blocks_verified": self.blocks_verified,
+            "last_full_verification": self.last_full,
+            "full_verification_progress": self.parallel.progress
+        }
+
+    def add_listener(self, listener: Callable[[dict], None]):
+        """
+        Registers listener(last_full), called when a scheduled full verification fails.
+        """
+        self._listeners.append(listener)
+
+    def _failed(self, result: dict):
+        for listener in self._listeners:
+            try:
+                listener(result)
+            except Exception:
+                logger.exception("Verification listener %r failed", listener)
+
+    async def run_scheduled(self, interval_seconds: int = LEDGER_FULL_VERIFY_INTERVAL_SECONDS):
+        """
+        Re-verifies the whole chain every interval_seconds (started by the FastAPI lifespan).
+        """
+        while True:
+            await asyncio.sleep(interval_seconds)
+            try:
+                result = await asyncio.to_thread(self.verify_full)
+            except Exception as e:
+                logger.exception("Full ledger verification failed to run")
+                result = self.last_full = {
+                    "is_valid": False,
+                    "verified_through": None,
+                    "first_bad_index": None,
+                    "blocks": 0,
+                    "seconds": None,
+                    "finished_at": time.time(),
+                    "error": f"Full verification failed to run: {e}"
+                }
+            else:
+                if result["is_valid"]:
+                    continue
+                logger.error("Full ledger verification FAILED at block %s: %s", result["first_bad_index"], result["error"])
+            self._failed(result)
+
+
+# Shared by every Blockchain instance in the process
+chain_verifier = ChainVerifier()
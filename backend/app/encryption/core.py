@@ -1,14 +1,35 @@
+import asyncio
 import base64
 import os
 import hashlib
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding
-from .kyber_utils import encapsulate_secret, decapsulate_secret
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+from .kyber_utils import encapsulate_secret, decapsulate_secret, zeroize
+from .kem_pool import KemPool, kem_pool
+from .encaps_pool import EncapsulationPool, encaps_pool
+from .envelope import Envelope, MultiRecipientEnvelope, Recipient, MAX_RECIPIENTS
+from .data_keys import DATA_KEY_SIZE, wrap_data_key, parse_wrapped_data_key, unwrap_data_key
+from .segment_pool import SegmentPool, segment_pool
+from .decaps_cache import DecapsulationCache, decaps_cache
+from .rewrap import unwrap_secret, rewrap_secret
+from .digests import DIGEST_CHUNK_SIZE, PayloadDigests
+from .streaming import DEFAULT_CHUNK_SIZE, HEADER_PREFIX_SIZE, SegmentHeader, SegmentedEncryptor, SegmentedDecryptor, SegmentedRangeReader
 
 class DualKeyEncryption:
-    def __init__(self):
+    def __init__(self, kem: KemPool = kem_pool, encaps: EncapsulationPool = encaps_pool,
+                 segments: SegmentPool = segment_pool, decaps: DecapsulationCache = decaps_cache):
         self.backend = default_backend()
+        # Used by the *_async methods to keep Kyber off the event loop
+        self.kem = kem
+        # Optional supply of pre-computed encapsulations, keyed by key_id
+        self.encaps = encaps
+        # Threads for sealing/opening file segments in parallel
+        self.segments = segments
+        # Optional cache of decapsulated secrets for repeat decrypts
+        self.decaps = decaps
 
     def _derive_master_key(self, kyber_secret: bytes, user_key_str: str) -> bytes:
         """
@@ -23,29 +44,118 @@ class DualKeyEncryption:
         master_key = hashlib.sha256(combined).digest()
         return master_key
 
-    def _encrypt_aes(self, data: bytes, key: bytes) -> bytes:
+    def _encrypt_aes(self, data: bytes, key: bytes, digests: PayloadDigests = None) -> bytes:
         iv = os.urandom(16)
         cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=self.backend)
         encryptor = cipher.encryptor()
-        
         padder = padding.PKCS7(128).padder()
-        padded_data = padder.update(data) + padder.finalize()
+        if digests is None:
+            return iv + encryptor.update(padder.update(data) + padder.finalize()) + encryptor.finalize()
         
-        encrypted_data = encryptor.update(padded_data) + encryptor.finalize()
-        return iv + encrypted_data
+        # A piece at a time, hashing plaintext and ciphertext in the same pass
+        out = [iv]
+        digests.update(b"", iv)
+        view = memoryview(data)
+        for start in range(0, len(view), DIGEST_CHUNK_SIZE):
+            piece = view[start:start + DIGEST_CHUNK_SIZE]
+            encrypted = encryptor.update(padder.update(piece))
+            digests.update(piece, encrypted)
+            out.append(encrypted)
+        encrypted = encryptor.update(padder.finalize()) + encryptor.finalize()
+        digests.update(b"", encrypted)
+        out.append(encrypted)
+        return b"".join(out)
 
-    def _decrypt_aes(self, data_with_iv: bytes, key: bytes) -> bytes:
-        iv = data_with_iv[:16]
-        ciphertext = data_with_iv[16:]
+    def _decrypt_aes(self, data_with_iv: bytes, key: bytes, digests: PayloadDigests = None) -> bytes:
+        view = memoryview(data_with_iv)
+        iv = bytes(view[:16])
         
         cipher = Cipher(algorithms.AES(key), modes.CBC(iv), backend=self.backend)
         decryptor = cipher.decryptor()
+        unpadder = padding.PKCS7(128).unpadder()
+        if digests is None:
+            padded_data = decryptor.update(view[16:]) + decryptor.finalize()
+            return unpadder.update(padded_data) + unpadder.finalize()
+        
+        out = []
+        digests.update(b"", iv)
+        for start in range(16, len(view), DIGEST_CHUNK_SIZE):
+            piece = view[start:start + DIGEST_CHUNK_SIZE]
+            decrypted = unpadder.update(decryptor.update(piece))
+            digests.update(decrypted, piece)
+            out.append(decrypted)
+        decrypted = unpadder.update(decryptor.finalize()) + unpadder.finalize()
+        digests.update(decrypted)
+        out.append(decrypted)
+        return b"".join(out)
+
+    def _decapsulate(self, kyber_ciphertext: bytes, system_private_key: bytes, key_id: str = None) -> bytes:
+        """
+        Kyber decapsulation, served from the decapsulation cache when enabled.
+        """
+        lookup_key = self.decaps.lookup_key(kyber_ciphertext, system_private_key) if self.decaps.enabled else None
+        kyber_secret = self.decaps.get(lookup_key) if lookup_key else None
+        if kyber_secret is None:
+            kyber_secret = decapsulate_secret(kyber_ciphertext, system_private_key)
+            if lookup_key:
+                self.decaps.put(lookup_key, kyber_secret, key_id)
+        return kyber_secret
+
+    def _recover_secret(self, kyber_secret: bytes, wrapped_secret: bytes, key_id: str, key_version: int, kyber_ciphertext: bytes) -> bytes:
+        """
+        Records re-wrapped by a key rotation reach their original Kyber secret through
+        the wrapped secret; others use the decapsulated secret directly (see rewrap.py).
+        """
+        if not wrapped_secret:
+            return kyber_secret
+        if key_id is None:
+            raise ValueError("key_id is required to open a re-wrapped record")
+        return unwrap_secret(wrapped_secret, kyber_secret, key_id, key_version, kyber_ciphertext)
+
+    def _seal_data(self, data: str, kyber_ciphertext: bytes, kyber_secret: bytes, user_key: str) -> dict:
+        # 2. Derive Master Key
+        master_key = self._derive_master_key(kyber_secret, user_key)
         
-        padded_data = decryptor.update(ciphertext) + decryptor.finalize()
+        # 3. AES Encryption
+        data_bytes = data.encode('utf-8')
+        digests = PayloadDigests()
+        encrypted_bytes = self._encrypt_aes(data_bytes, master_key, digests)
         
-        unpadder = padding.PKCS7(128).unpadder()
-        data = unpadder.update(padded_data) + unpadder.finalize()
-        return data
+        return {
+            "encrypted_data": base64.b64encode(encrypted_bytes).decode('utf-8'),
+            "kyber_ciphertext": base64.b64encode(kyber_ciphertext).decode('utf-8'),
+            **digests.to_dict()
+        }
+
+    def _open_data(self, encrypted_bytes: bytes, kyber_secret: bytes, user_key: str, digests: PayloadDigests = None) -> str:
+        # 2. Derive Master Key
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        
+        # 3. AES Decryption
+        decrypted_bytes = self._decrypt_aes(encrypted_bytes, master_key, digests)
+        
+        return decrypted_bytes.decode('utf-8')
+
+    def _seal_file(self, file_bytes: bytes, kyber_ciphertext: bytes, kyber_secret: bytes, user_key: str) -> dict:
+        # 2. Derive Master Key
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        
+        # 3. AES Encryption
+        digests = PayloadDigests()
+        encrypted_bytes = self._encrypt_aes(file_bytes, master_key, digests)
+        
+        return {
+            "encrypted_file": encrypted_bytes,
+            "kyber_ciphertext": base64.b64encode(kyber_ciphertext).decode('utf-8'),
+            **digests.to_dict()
+        }
+
+    def _open_file(self, encrypted_file_bytes: bytes, kyber_secret: bytes, user_key: str, digests: PayloadDigests = None) -> bytes:
+        # 2. Derive Master Key
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        
+        # 3. AES Decryption
+        return self._decrypt_aes(encrypted_file_bytes, master_key, digests)
 
     def encrypt_data(self, data: str, system_public_key: bytes, user_key: str) -> dict:
         """
@@ -56,81 +166,457 @@ class DualKeyEncryption:
         
         Returns: {
             "encrypted_data": base64_str,
-            "kyber_ciphertext": base64_str
+            "kyber_ciphertext": base64_str,
+            "plaintext_sha256": hex_str,
+            "ciphertext_sha256": hex_str  # over the decoded encrypted_data
         }
         """
         # 1. Kyber Encapsulation
         kyber_ciphertext, kyber_secret = encapsulate_secret(system_public_key)
-        
-        # 2. Derive Master Key
-        master_key = self._derive_master_key(kyber_secret, user_key)
-        
-        # 3. AES Encryption
-        data_bytes = data.encode('utf-8')
-        encrypted_bytes = self._encrypt_aes(data_bytes, master_key)
-        
-        return {
-            "encrypted_data": base64.b64encode(encrypted_bytes).decode('utf-8'),
-            "kyber_ciphertext": base64.b64encode(kyber_ciphertext).decode('utf-8')
-        }
+        return self._seal_data(data, kyber_ciphertext, kyber_secret, user_key)
 
-    def decrypt_data(self, encrypted_data_b64: str, kyber_ciphertext_b64: str, system_private_key: bytes, user_key: str) -> str:
+    def decrypt_data(self, encrypted_data_b64: str, kyber_ciphertext_b64: str, system_private_key: bytes, user_key: str,
+                     key_id: str = None, wrapped_secret_b64: str = None, key_version: int = 1, digests: PayloadDigests = None) -> str:
         """
         Decrypts data using Hybrid Dual-Key Scheme.
         1. Decapsulate secret using System Kyber Private Key -> shared_secret
         2. Derive Master Key from (shared_secret + user_key)
         3. Decrypt data with Master Key (AES)
+        digests, if given, receives the SHA-256 of the ciphertext and plaintext.
         """
         # Decode inputs
         encrypted_bytes = base64.b64decode(encrypted_data_b64)
         kyber_ciphertext = base64.b64decode(kyber_ciphertext_b64)
         
-        # 1. Kyber Decapsulation
-        kyber_secret = decapsulate_secret(kyber_ciphertext, system_private_key)
-        
-        # 2. Derive Master Key
-        master_key = self._derive_master_key(kyber_secret, user_key)
-        
-        # 3. AES Decryption
-        decrypted_bytes = self._decrypt_aes(encrypted_bytes, master_key)
-        
-        return decrypted_bytes.decode('utf-8')
+        # 1. Kyber Decapsulation (+ unwrap, for records re-wrapped by a key rotation)
+        kyber_secret = self._decapsulate(kyber_ciphertext, system_private_key, key_id)
+        kyber_secret = self._recover_secret(kyber_secret, base64.b64decode(wrapped_secret_b64 or ""), key_id, key_version, kyber_ciphertext)
+        return self._open_data(encrypted_bytes, kyber_secret, user_key, digests)
+
     def encrypt_file(self, file_bytes: bytes, system_public_key: bytes, user_key: str) -> dict:
         """
         Encrypts a file using Hybrid Dual-Key Scheme.
         Returns: {
             "encrypted_file": bytes,
-            "kyber_ciphertext": base64_str
+            "kyber_ciphertext": base64_str,
+            "plaintext_sha256": hex_str,
+            "ciphertext_sha256": hex_str
         }
         """
         # 1. Kyber Encapsulation
         kyber_ciphertext, kyber_secret = encapsulate_secret(system_public_key)
+        return self._seal_file(file_bytes, kyber_ciphertext, kyber_secret, user_key)
+
+    def decrypt_file(self, encrypted_file_bytes: bytes, kyber_ciphertext_b64: str, system_private_key: bytes, user_key: str,
+                     digests: PayloadDigests = None, key_id: str = None) -> bytes:
+        """
+        Decrypts a file using Hybrid Dual-Key Scheme.
+        """
+        # Decode Kyber ciphertext
+        kyber_ciphertext = base64.b64decode(kyber_ciphertext_b64)
+        
+        # 1. Kyber Decapsulation
+        kyber_secret = self._decapsulate(kyber_ciphertext, system_private_key, key_id)
+        return self._open_file(encrypted_file_bytes, kyber_secret, user_key, digests)
+
+    def open_stream_encryptor(self, system_public_key: bytes, user_key: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                              digests: PayloadDigests = None) -> SegmentedEncryptor:
+        """
+        Starts a streaming (segmented AES-GCM) file encryption.
+        The Kyber ciphertext is embedded in the container header, so the output is self-contained.
+        Segments are sealed (and hashed for encryptor.digests) in parallel on the segment pool.
+        """
+        # 1. Kyber Encapsulation
+        kyber_ciphertext, kyber_secret = encapsulate_secret(system_public_key)
         
         # 2. Derive Master Key
         master_key = self._derive_master_key(kyber_secret, user_key)
         
-        # 3. AES Encryption
-        encrypted_bytes = self._encrypt_aes(file_bytes, master_key)
+        # 3. Segmented AES-GCM Encryptor
+        return SegmentedEncryptor(master_key, kyber_ciphertext, chunk_size, self.segments.executor, digests)
+
+    def open_stream_decryptor(self, header: SegmentHeader, system_private_key: bytes, user_key: str,
+                              digests: PayloadDigests = None, key_id: str = None) -> SegmentedDecryptor:
+        """
+        Starts a streaming decryption of a segmented container whose header has already been parsed.
+        """
+        # 1. Kyber Decapsulation
+        kyber_secret = self._decapsulate(header.kyber_ciphertext, system_private_key, key_id)
         
-        return {
-            "encrypted_file": encrypted_bytes,
-            "kyber_ciphertext": base64.b64encode(kyber_ciphertext).decode('utf-8')
-        }
+        # 2. Derive Master Key
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        
+        # 3. Segmented AES-GCM Decryptor
+        return SegmentedDecryptor(master_key, header, self.segments.executor, digests)
 
-    def decrypt_file(self, encrypted_file_bytes: bytes, kyber_ciphertext_b64: str, system_private_key: bytes, user_key: str) -> bytes:
+    def encrypt_fileobj(self, src, dst, system_public_key: bytes, user_key: str, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                        digests: PayloadDigests = None) -> int:
         """
-        Decrypts a file using Hybrid Dual-Key Scheme.
+        Encrypts a binary file object into a segmented container written to dst,
+        a window of segments at a time (memory stays bounded for multi-GB inputs).
+        Returns the number of bytes written; digests, if given, receives the container digest
+        (and the input's SHA-256 if it tracks the plaintext), computed in the same pass.
         """
-        # Decode Kyber ciphertext
-        kyber_ciphertext = base64.b64decode(kyber_ciphertext_b64)
+        encryptor = self.open_stream_encryptor(system_public_key, user_key, chunk_size, digests)
+        window = self.segments.window(chunk_size)
+        written = 0
+        while True:
+            chunk = src.read(window)
+            if not chunk:
+                break
+            written += dst.write(encryptor.update(chunk))
+        return written + dst.write(encryptor.finalize())
+
+    def decrypt_fileobj(self, src, dst, system_private_key: bytes, user_key: str, digests: PayloadDigests = None,
+                        key_id: str = None) -> int:
+        """
+        Decrypts a segmented container from src into dst. Returns the number of plaintext bytes
+        (digests as for encrypt_fileobj).
+        """
+        prefix = src.read(HEADER_PREFIX_SIZE)
+        header = SegmentHeader.parse(prefix + src.read(SegmentHeader.kem_length(prefix)))
+        decryptor = self.open_stream_decryptor(header, system_private_key, user_key, digests, key_id)
+        window = self.segments.window(header.segment_size)
+        written = 0
+        while True:
+            chunk = src.read(window)
+            if not chunk:
+                break
+            written += dst.write(decryptor.update(chunk))
+        return written + dst.write(decryptor.finalize())
+
+    def open_range_reader(self, header: SegmentHeader, container_size: int, system_private_key: bytes, user_key: str,
+                          key_id: str = None) -> SegmentedRangeReader:
+        """
+        Starts random-access decryption of a segmented container of container_size bytes.
+        """
+        # 1. Kyber Decapsulation
+        kyber_secret = self._decapsulate(header.kyber_ciphertext, system_private_key, key_id)
+        
+        # 2. Derive Master Key
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        
+        # 3. Segment locator / decryptor
+        return SegmentedRangeReader(master_key, header, container_size, self.segments.executor)
+
+    def decrypt_range(self, src, start: int, end: int, system_private_key: bytes, user_key: str, key_id: str = None) -> bytes:
+        """
+        Decrypts the inclusive plaintext byte range [start, end] of a segmented container held
+        in a seekable file object, reading and authenticating only the segments it overlaps.
+        """
+        container_size = src.seek(0, os.SEEK_END)
+        src.seek(0)
+        prefix = src.read(HEADER_PREFIX_SIZE)
+        header = SegmentHeader.parse(prefix + src.read(SegmentHeader.kem_length(prefix)))
+        reader = self.open_range_reader(header, container_size, system_private_key, user_key, key_id)
+        first, offset, length = reader.locate(start, end)
+        src.seek(offset)
+        return reader.open(first, src.read(length), start, end)
+
+    def generate_data_key(self, system_public_key: bytes, user_key: str):
+        """
+        Generates a random AES-256 data key and wraps it under the dual-key master key.
+        One Kyber encapsulation covers every record later encrypted with the data key.
+        Returns: (data_key, wrapped_data_key)
+        """
+        # 1. Kyber Encapsulation
+        kyber_ciphertext, kyber_secret = encapsulate_secret(system_public_key)
+        return self._seal_data_key(kyber_ciphertext, kyber_secret, user_key)
+
+    def decrypt_data_key(self, wrapped_data_key: bytes, system_private_key: bytes, user_key: str, key_id: str = None) -> bytearray:
+        """
+        Unwraps a data key produced by generate_data_key.
+        """
+        kyber_ciphertext, nonce, wrapped = parse_wrapped_data_key(wrapped_data_key)
         
         # 1. Kyber Decapsulation
-        kyber_secret = decapsulate_secret(kyber_ciphertext, system_private_key)
+        kyber_secret = self._decapsulate(kyber_ciphertext, system_private_key, key_id)
         
+        # 2. Derive Master Key, 3. Unwrap
+        return unwrap_data_key(nonce, wrapped, self._derive_master_key(kyber_secret, user_key))
+
+    def _seal_data_key(self, kyber_ciphertext: bytes, kyber_secret: bytes, user_key: str):
         # 2. Derive Master Key
         master_key = self._derive_master_key(kyber_secret, user_key)
         
-        # 3. AES Decryption
-        decrypted_bytes = self._decrypt_aes(encrypted_file_bytes, master_key)
+        # 3. Wrap a fresh data key
+        data_key = os.urandom(DATA_KEY_SIZE)
+        return data_key, wrap_data_key(data_key, kyber_ciphertext, master_key)
+
+    @staticmethod
+    def _hash_envelope(envelope, plaintext: bytes, digests: PayloadDigests = None):
+        # Envelopes are identified by the SHA-256 of the whole serialized envelope
+        if digests is None:
+            return
+        digests.update(plaintext)
+        for chunk in envelope.chunks():
+            digests.update(ciphertext=chunk)
+
+    def _seal_envelope(self, data: bytes, key_id: str, kyber_ciphertext: bytes, kyber_secret: bytes, user_key: str,
+                       key_version: int = 1, digests: PayloadDigests = None) -> bytes:
+        # 2. Derive Master Key
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        
+        # 3. AES-GCM Encryption, with the envelope header as associated data
+        envelope = Envelope(key_id, kyber_ciphertext, os.urandom(12), b"", b"", key_version=key_version)
+        sealed = AESGCM(master_key).encrypt(envelope.iv, data, envelope.payload_aad())
+        envelope.ciphertext, envelope.tag = sealed[:-16], sealed[-16:]
+        self._hash_envelope(envelope, data, digests)
+        return envelope.to_bytes()
+
+    def _open_envelope(self, envelope: Envelope, kyber_secret: bytes, user_key: str, digests: PayloadDigests = None) -> bytes:
+        kyber_secret = self._recover_secret(kyber_secret, envelope.wrapped_secret, envelope.key_id,
+                                            envelope.key_version, envelope.kyber_ciphertext)
+        
+        # 2. Derive Master Key
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        
+        # 3. AES-GCM Decryption
+        try:
+            decrypted = AESGCM(master_key).decrypt(envelope.iv, envelope.ciphertext + envelope.tag, envelope.payload_aad())
+        except InvalidTag:
+            raise ValueError("Envelope authentication failed. Invalid keys or data.")
+        self._hash_envelope(envelope, decrypted, digests)
+        return decrypted
+
+    def encrypt_envelope(self, data: bytes, system_public_key: bytes, user_key: str, key_id: str, key_version: int = 1,
+                         digests: PayloadDigests = None) -> bytes:
+        """
+        Encrypts data into a self-describing binary envelope
+        (key_id, Kyber ciphertext, IV, ciphertext and tag in one blob; see envelope.py).
+        digests, if given, receives the SHA-256 of the plaintext and of the envelope.
+        """
+        # 1. Kyber Encapsulation
+        kyber_ciphertext, kyber_secret = encapsulate_secret(system_public_key)
+        return self._seal_envelope(data, key_id, kyber_ciphertext, kyber_secret, user_key, key_version, digests)
+
+    def decrypt_envelope(self, envelope: Envelope, system_private_key: bytes, user_key: str, digests: PayloadDigests = None) -> bytes:
+        """
+        Decrypts a parsed envelope. The caller looks up the private key for envelope.key_id.
+        digests as for encrypt_envelope.
+        """
+        # 1. Kyber Decapsulation
+        kyber_secret = self._decapsulate(envelope.kyber_ciphertext, system_private_key, envelope.key_id)
+        return self._open_envelope(envelope, kyber_secret, user_key, digests)
+
+    def _seal_multi(self, data: bytes, slots: list, digests: PayloadDigests = None) -> bytes:
+        """
+        slots: [(key_id, key_version, kyber_ciphertext, kyber_secret, user_key)]
+        """
+        if not 0 < len(slots) <= MAX_RECIPIENTS:
+            raise ValueError(f"A multi-recipient envelope needs 1-{MAX_RECIPIENTS} recipients")
+        if len({slot[0] for slot in slots}) != len(slots):
+            raise ValueError("Duplicate recipient key_id")
+        
+        # 1. Encrypt the payload once, under a random data key
+        data_key = bytearray(os.urandom(DATA_KEY_SIZE))
+        envelope = MultiRecipientEnvelope([], os.urandom(12), b"", b"")
+        try:
+            sealed = AESGCM(bytes(data_key)).encrypt(envelope.iv, data, envelope.payload_aad())
+            envelope.ciphertext, envelope.tag = sealed[:-16], sealed[-16:]
+            
+            # 2. Wrap the data key once per recipient, under its own master key
+            for key_id, key_version, kyber_ciphertext, kyber_secret, user_key in slots:
+                master_key = self._derive_master_key(kyber_secret, user_key)
+                nonce = os.urandom(12)
+                wrapped = nonce + AESGCM(master_key).encrypt(nonce, bytes(data_key), envelope.recipient_aad(key_id))
+                envelope.recipients.append(Recipient(key_id, kyber_ciphertext, wrapped, key_version))
+        finally:
+            zeroize(data_key)
+        self._hash_envelope(envelope, data, digests)
+        return envelope.to_bytes()
+
+    def _open_multi(self, envelope: MultiRecipientEnvelope, recipient: Recipient, kyber_secret: bytes, user_key: str,
+                    digests: PayloadDigests = None) -> bytes:
+        kyber_secret = self._recover_secret(kyber_secret, recipient.wrapped_secret, recipient.key_id,
+                                            recipient.key_version, recipient.kyber_ciphertext)
+        
+        # 2. Derive Master Key, unwrap the data key
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        wrapped = recipient.wrapped_data_key
+        try:
+            data_key = AESGCM(master_key).decrypt(wrapped[:12], wrapped[12:], envelope.recipient_aad(recipient.key_id))
+        except InvalidTag:
+            raise ValueError("Recipient slot authentication failed. Invalid keys or data.")
+        
+        # 3. AES-GCM Decryption of the shared payload
+        try:
+            decrypted = AESGCM(data_key).decrypt(envelope.iv, envelope.ciphertext + envelope.tag, envelope.payload_aad())
+        except InvalidTag:
+            raise ValueError("Envelope authentication failed. Invalid keys or data.")
+        self._hash_envelope(envelope, decrypted, digests)
+        return decrypted
+
+    def encrypt_multi(self, data: bytes, recipients: list, digests: PayloadDigests = None) -> bytes:
+        """
+        Encrypts data once for several system keys.
+        recipients: [(key_id, key_version, system_public_key, user_key)]
+        Each recipient can later decrypt with its own key_id and user key (decrypt_multi).
+        digests as for encrypt_envelope.
+        """
+        slots = []
+        for key_id, key_version, system_public_key, user_key in recipients:
+            kyber_ciphertext, kyber_secret = encapsulate_secret(system_public_key)
+            slots.append((key_id, key_version, kyber_ciphertext, kyber_secret, user_key))
+        return self._seal_multi(data, slots, digests)
+
+    def decrypt_multi(self, envelope: MultiRecipientEnvelope, key_id: str, system_private_key: bytes, user_key: str,
+                      digests: PayloadDigests = None) -> bytes:
+        """
+        Decrypts a multi-recipient envelope through the slot of key_id. The caller looks up the
+        private key for that slot's key_version.
+        """
+        recipient = envelope.recipient(key_id)
         
-        return decrypted_bytes
+        # 1. Kyber Decapsulation
+        kyber_secret = self._decapsulate(recipient.kyber_ciphertext, system_private_key, key_id)
+        return self._open_multi(envelope, recipient, kyber_secret, user_key, digests)
+
+    # Async variants: same results, but the Kyber step runs on the KEM process pool
+    # (or is served from the pre-computed encapsulation pool / decapsulation cache)
+    # so request handlers never block the event loop on it.
+
+    async def _encapsulate_async(self, system_public_key: bytes, key_id: str = None):
+        if key_id is not None:
+            pair = self.encaps.take(key_id, system_public_key)
+            if pair is not None:
+                return pair
+        return await self.kem.encapsulate(system_public_key)
+
+    async def _decapsulate_async(self, kyber_ciphertext: bytes, system_private_key: bytes, key_id: str = None) -> bytes:
+        lookup_key = self.decaps.lookup_key(kyber_ciphertext, system_private_key) if self.decaps.enabled else None
+        kyber_secret = self.decaps.get(lookup_key) if lookup_key else None
+        if kyber_secret is None:
+            kyber_secret = await self.kem.decapsulate(kyber_ciphertext, system_private_key)
+            if lookup_key:
+                self.decaps.put(lookup_key, kyber_secret, key_id)
+        return kyber_secret
+
+    async def encrypt_data_async(self, data: str, system_public_key: bytes, user_key: str, key_id: str = None) -> dict:
+        kyber_ciphertext, kyber_secret = await self._encapsulate_async(system_public_key, key_id)
+        try:
+            return self._seal_data(data, kyber_ciphertext, kyber_secret, user_key)
+        finally:
+            if isinstance(kyber_secret, bytearray):
+                zeroize(kyber_secret)
+
+    async def decrypt_data_async(self, encrypted_data_b64: str, kyber_ciphertext_b64: str, system_private_key: bytes, user_key: str, key_id: str = None,
+                                 wrapped_secret_b64: str = None, key_version: int = 1, digests: PayloadDigests = None) -> str:
+        encrypted_bytes = base64.b64decode(encrypted_data_b64)
+        kyber_ciphertext = base64.b64decode(kyber_ciphertext_b64)
+        kyber_secret = await self._decapsulate_async(kyber_ciphertext, system_private_key, key_id)
+        kyber_secret = self._recover_secret(kyber_secret, base64.b64decode(wrapped_secret_b64 or ""), key_id, key_version, kyber_ciphertext)
+        return self._open_data(encrypted_bytes, kyber_secret, user_key, digests)
+
+    async def encrypt_file_async(self, file_bytes: bytes, system_public_key: bytes, user_key: str, key_id: str = None) -> dict:
+        kyber_ciphertext, kyber_secret = await self._encapsulate_async(system_public_key, key_id)
+        try:
+            return self._seal_file(file_bytes, kyber_ciphertext, kyber_secret, user_key)
+        finally:
+            if isinstance(kyber_secret, bytearray):
+                zeroize(kyber_secret)
+
+    async def decrypt_file_async(self, encrypted_file_bytes: bytes, kyber_ciphertext_b64: str, system_private_key: bytes, user_key: str, key_id: str = None,
+                                 digests: PayloadDigests = None) -> bytes:
+        kyber_ciphertext = base64.b64decode(kyber_ciphertext_b64)
+        kyber_secret = await self._decapsulate_async(kyber_ciphertext, system_private_key, key_id)
+        return self._open_file(encrypted_file_bytes, kyber_secret, user_key, digests)
+
+    async def open_stream_encryptor_async(self, system_public_key: bytes, user_key: str, chunk_size: int = DEFAULT_CHUNK_SIZE, key_id: str = None,
+                                          digests: PayloadDigests = None) -> SegmentedEncryptor:
+        kyber_ciphertext, kyber_secret = await self._encapsulate_async(system_public_key, key_id)
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        if isinstance(kyber_secret, bytearray):
+            zeroize(kyber_secret)
+        return SegmentedEncryptor(master_key, kyber_ciphertext, chunk_size, self.segments.executor, digests)
+
+    async def open_stream_decryptor_async(self, header: SegmentHeader, system_private_key: bytes, user_key: str, key_id: str = None,
+                                          digests: PayloadDigests = None) -> SegmentedDecryptor:
+        kyber_secret = await self._decapsulate_async(header.kyber_ciphertext, system_private_key, key_id)
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        return SegmentedDecryptor(master_key, header, self.segments.executor, digests)
+
+    async def open_range_reader_async(self, header: SegmentHeader, container_size: int, system_private_key: bytes, user_key: str, key_id: str = None) -> SegmentedRangeReader:
+        kyber_secret = await self._decapsulate_async(header.kyber_ciphertext, system_private_key, key_id)
+        master_key = self._derive_master_key(kyber_secret, user_key)
+        return SegmentedRangeReader(master_key, header, container_size, self.segments.executor)
+
+    async def generate_data_key_async(self, system_public_key: bytes, user_key: str, key_id: str = None):
+        kyber_ciphertext, kyber_secret = await self._encapsulate_async(system_public_key, key_id)
+        try:
+            return self._seal_data_key(kyber_ciphertext, kyber_secret, user_key)
+        finally:
+            if isinstance(kyber_secret, bytearray):
+                zeroize(kyber_secret)
+
+    async def decrypt_data_key_async(self, wrapped_data_key: bytes, system_private_key: bytes, user_key: str, key_id: str = None) -> bytearray:
+        kyber_ciphertext, nonce, wrapped = parse_wrapped_data_key(wrapped_data_key)
+        kyber_secret = await self._decapsulate_async(kyber_ciphertext, system_private_key, key_id)
+        return unwrap_data_key(nonce, wrapped, self._derive_master_key(kyber_secret, user_key))
+
+    async def encrypt_envelope_async(self, data: bytes, system_public_key: bytes, user_key: str, key_id: str, key_version: int = 1,
+                                     digests: PayloadDigests = None) -> bytes:
+        kyber_ciphertext, kyber_secret = await self._encapsulate_async(system_public_key, key_id)
+        try:
+            return self._seal_envelope(data, key_id, kyber_ciphertext, kyber_secret, user_key, key_version, digests)
+        finally:
+            if isinstance(kyber_secret, bytearray):
+                zeroize(kyber_secret)
+
+    async def decrypt_envelope_async(self, envelope: Envelope, system_private_key: bytes, user_key: str,
+                                     digests: PayloadDigests = None) -> bytes:
+        kyber_secret = await self._decapsulate_async(envelope.kyber_ciphertext, system_private_key, envelope.key_id)
+        return self._open_envelope(envelope, kyber_secret, user_key, digests)
+
+    async def encrypt_multi_async(self, data: bytes, recipients: list, digests: PayloadDigests = None) -> bytes:
+        # Encapsulations for all recipients run concurrently
+        pairs = await asyncio.gather(*(self._encapsulate_async(pk, key_id) for key_id, _, pk, _ in recipients))
+        try:
+            return self._seal_multi(data, [
+                (key_id, key_version, kyber_ciphertext, kyber_secret, user_key)
+                for (key_id, key_version, _, user_key), (kyber_ciphertext, kyber_secret) in zip(recipients, pairs)
+            ], digests)
+        finally:
+            for _, kyber_secret in pairs:
+                if isinstance(kyber_secret, bytearray):
+                    zeroize(kyber_secret)
+
+    async def decrypt_multi_async(self, envelope: MultiRecipientEnvelope, key_id: str, system_private_key: bytes, user_key: str,
+                                  digests: PayloadDigests = None) -> bytes:
+        recipient = envelope.recipient(key_id)
+        kyber_secret = await self._decapsulate_async(recipient.kyber_ciphertext, system_private_key, key_id)
+        return self._open_multi(envelope, recipient, kyber_secret, user_key, digests)
+
+    # Key rotation: move a record to a new key version by replacing its Kyber ciphertext and
+    # wrapped secret only. The payload and the user key are never touched (see rewrap.py).
+
+    async def rewrap_record_async(self, kyber_ciphertext_b64: str, wrapped_secret_b64: str, key_id: str, old_version: int,
+                                  old_private_key: bytes, new_public_key: bytes, new_version: int):
+        """
+        Returns: (kyber_ciphertext_b64, wrapped_secret_b64) for new_version
+        """
+        kyber_ciphertext, wrapped_secret = await self.kem.run(
+            rewrap_secret, base64.b64decode(kyber_ciphertext_b64), base64.b64decode(wrapped_secret_b64 or ""),
+            old_private_key, old_version, new_public_key, new_version, key_id
+        )
+        return base64.b64encode(kyber_ciphertext).decode('utf-8'), base64.b64encode(wrapped_secret).decode('utf-8')
+
+    async def rewrap_envelope_async(self, envelope: Envelope, old_private_key: bytes, new_public_key: bytes, new_version: int) -> Envelope:
+        kyber_ciphertext, wrapped_secret = await self.kem.run(
+            rewrap_secret, envelope.kyber_ciphertext, envelope.wrapped_secret,
+            old_private_key, envelope.key_version, new_public_key, new_version, envelope.key_id
+        )
+        return envelope.rewrapped(kyber_ciphertext, wrapped_secret, new_version)
+
+    async def rewrap_recipient_async(self, envelope: MultiRecipientEnvelope, key_id: str, old_private_key: bytes,
+                                     new_public_key: bytes, new_version: int) -> MultiRecipientEnvelope:
+        """
+        Re-wraps the slot of key_id only; other recipients and the payload are left as is.
+        """
+        recipient = envelope.recipient(key_id)
+        kyber_ciphertext, wrapped_secret = await self.kem.run(
+            rewrap_secret, recipient.kyber_ciphertext, recipient.wrapped_secret,
+            old_private_key, recipient.key_version, new_public_key, new_version, key_id
+        )
+        recipient.kyber_ciphertext, recipient.wrapped_secret, recipient.key_version = kyber_ciphertext, wrapped_secret, new_version
+        return envelope
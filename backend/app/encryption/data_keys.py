@@ -0,0 +1,225 @@
+import hashlib
+import os
+import struct
+import threading
+import time
+from collections import OrderedDict
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.exceptions import InvalidTag
+from decouple import config
+from sqlalchemy.exc import IntegrityError
+from .kyber_utils import zeroize
+from app.database import SessionLocal
+from app.models import DataKeyUsage
+
+# Wrapped data key format (version 1)
+#
+#   version (u8) | kem_len (u16) | kyber_ciphertext | nonce (12) | AES-GCM(data_key) | tag (16)
+#
+# The data key is wrapped under the usual dual-key master key (Kyber secret + user key),
+# so unwrapping it needs both the system private key and the user key.
+WRAPPED_KEY_VERSION = 1
+WRAPPED_KEY_PREFIX = struct.Struct(">BH")
+DATA_KEY_SIZE = 32
+NONCE_SIZE = 12
+
+# Server-side data key sessions: how long an unwrapped key stays cached, how long after its
+# generation a wrapped key may encrypt records, and how many, before callers must generate a new one
+DATA_KEY_TTL_SECONDS = config("DATA_KEY_TTL_SECONDS", default=3600, cast=int)
+DATA_KEY_MAX_USES = config("DATA_KEY_MAX_USES", default=1000000, cast=int)
+DATA_KEY_CACHE_SIZE = config("DATA_KEY_CACHE_SIZE", default=1024, cast=int)
+
+
+def wrap_data_key(data_key: bytes, kyber_ciphertext: bytes, master_key: bytes) -> bytes:
+    nonce = os.urandom(NONCE_SIZE)
+    wrapped = AESGCM(master_key).encrypt(nonce, bytes(data_key), None)
+    return WRAPPED_KEY_PREFIX.pack(WRAPPED_KEY_VERSION, len(kyber_ciphertext)) + kyber_ciphertext + nonce + wrapped
+
+
+def parse_wrapped_data_key(blob: bytes):
+    """
+    Returns: (kyber_ciphertext, nonce, wrapped_key)
+    """
+    if len(blob) < WRAPPED_KEY_PREFIX.size:
+        raise ValueError("Truncated wrapped data key")
+    version, kem_len = WRAPPED_KEY_PREFIX.unpack(blob[:WRAPPED_KEY_PREFIX.size])
+    if version != WRAPPED_KEY_VERSION:
+        raise ValueError(f"Unsupported wrapped data key version: {version}")
+    start = WRAPPED_KEY_PREFIX.size
+    kyber_ciphertext = blob[start:start + kem_len]
+    nonce = blob[start + kem_len:start + kem_len + NONCE_SIZE]
+    wrapped = blob[start + kem_len + NONCE_SIZE:]
+    if len(kyber_ciphertext) != kem_len or len(nonce) != NONCE_SIZE or len(wrapped) != DATA_KEY_SIZE + 16:
+        raise ValueError("Truncated wrapped data key")
+    return kyber_ciphertext, nonce, wrapped
+
+
+def unwrap_data_key(nonce: bytes, wrapped: bytes, master_key: bytes) -> bytearray:
+    try:
+        return bytearray(AESGCM(master_key).decrypt(nonce, wrapped, None))
+    except InvalidTag:
+        raise ValueError("Data key unwrap failed. Invalid keys or data.")
+
+
+def encrypt_record(data_key: bytes, plaintext: bytes) -> bytes:
+    """
+    Encrypts one record under a data key: nonce (12) | ciphertext | tag (16).
+    """
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + AESGCM(bytes(data_key)).encrypt(nonce, plaintext, None)
+
+
+def decrypt_record(data_key: bytes, record: bytes) -> bytes:
+    if len(record) < NONCE_SIZE + 16:
+        raise ValueError("Truncated record")
+    try:
+        return AESGCM(bytes(data_key)).decrypt(record[:NONCE_SIZE], record[NONCE_SIZE:], None)
+    except InvalidTag:
+        raise ValueError("Record authentication failed")
+
+
+class _Session:
+    def __init__(self, data_key: bytearray, expires_at: float):
+        self.data_key = data_key
+        self.expires_at = expires_at
+
+
+class DataKeyCache:
+    """
+    Server-side cache of unwrapped data keys, so a session of many records pays for
+    one Kyber decapsulation. Entries are keyed by the wrapped key *and* the user key,
+    so a cache hit still requires the caller to present the user key.
+    Entries expire after a TTL and are zeroized. The encryption budget and lifetime of a
+    wrapped key are not kept here but in DataKeyBudget, so they survive eviction.
+    """
+
+    def __init__(self, ttl_seconds: int = DATA_KEY_TTL_SECONDS, max_entries: int = DATA_KEY_CACHE_SIZE):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._sessions = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def session_id(wrapped_data_key: bytes, user_key: str) -> bytes:
+        return hashlib.sha256(wrapped_data_key + hashlib.sha256(user_key.encode()).digest()).digest()
+
+    def get(self, session_id: bytes):
+        """
+        Returns the cached data key, or None on a miss.
+        """
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and session.expires_at <= time.monotonic():
+                self._drop(session_id)
+                session = None
+            if session is None:
+                self.misses += 1
+                return None
+            self._sessions.move_to_end(session_id)
+            self.hits += 1
+            return bytes(session.data_key)
+
+    def put(self, session_id: bytes, data_key: bytearray):
+        with self._lock:
+            if session_id in self._sessions:
+                self._drop(session_id)
+            self._sessions[session_id] = _Session(data_key, time.monotonic() + self.ttl_seconds)
+            while len(self._sessions) > self.max_entries:
+                self._drop(next(iter(self._sessions)))
+
+    def clear(self):
+        with self._lock:
+            for session_id in list(self._sessions):
+                self._drop(session_id)
+
+    def _drop(self, session_id: bytes):
+        session = self._sessions.pop(session_id)
+        zeroize(session.data_key)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._sessions)
+        return {"sessions": size, "hits": self.hits, "misses": self.misses}
+
+
+class DataKeyBudget:
+    """
+    Lifetime and encryption budget of each wrapped data key, in the data_key_usage table
+    (keyed by the SHA-256 of the wrapped key).
+
+    - The lifetime starts when the key is generated (or first used, for keys wrapped before
+      the table existed) and lasts ttl_seconds.
+    - charge() counts record encryptions with one conditional UPDATE, so re-unwrapping the key,
+      cache eviction or another server process cannot reset the budget.
+    Only encryption is limited: records already encrypted under a key stay decryptable.
+    """
+
+    def __init__(self, ttl_seconds: int = DATA_KEY_TTL_SECONDS, max_uses: int = DATA_KEY_MAX_USES):
+        self.ttl_seconds = ttl_seconds
+        self.max_uses = max_uses
+
+    @staticmethod
+    def key_hash(wrapped_data_key: bytes) -> str:
+        return hashlib.sha256(wrapped_data_key).hexdigest()
+
+    def register(self, wrapped_data_key: bytes):
+        db = SessionLocal()
+        try:
+            self._register(db, self.key_hash(wrapped_data_key))
+        finally:
+            db.close()
+
+    def check(self, wrapped_data_key: bytes):
+        """
+        Raises ValueError if the key may not encrypt any more records (so it is not unwrapped).
+        """
+        db = SessionLocal()
+        try:
+            usage = db.query(DataKeyUsage).filter(DataKeyUsage.key_hash == self.key_hash(wrapped_data_key)).first()
+        finally:
+            db.close()
+        if usage is not None:
+            self._refuse(usage)
+
+    def charge(self, wrapped_data_key: bytes, uses: int):
+        """
+        Counts `uses` record encryptions against the key; raises ValueError if it has expired
+        or they do not fit in what is left of its budget.
+        """
+        key_hash = self.key_hash(wrapped_data_key)
+        db = SessionLocal()
+        try:
+            self._register(db, key_hash)
+            charged = db.query(DataKeyUsage).filter(
+                DataKeyUsage.key_hash == key_hash,
+                DataKeyUsage.uses + uses <= DataKeyUsage.max_uses,
+                DataKeyUsage.expires_at > time.time()
+            ).update({DataKeyUsage.uses: DataKeyUsage.uses + uses}, synchronize_session=False)
+            db.commit()
+            if not charged:
+                self._refuse(db.query(DataKeyUsage).filter(DataKeyUsage.key_hash == key_hash).one(), uses)
+        finally:
+            db.close()
+
+    def _register(self, db, key_hash: str):
+        if db.query(DataKeyUsage.key_hash).filter(DataKeyUsage.key_hash == key_hash).first() is not None:
+            return
+        db.add(DataKeyUsage(key_hash=key_hash, uses=0, max_uses=self.max_uses, expires_at=time.time() + self.ttl_seconds))
+        try:
+            db.commit()
+        except IntegrityError:
+            # Registered concurrently by another request
+            db.rollback()
+
+    @staticmethod
+    def _refuse(usage: DataKeyUsage, uses: int = 1):
+        if usage.expires_at <= time.time():
+            raise ValueError("Data key expired. Generate a new data key.")
+        if usage.uses + uses > usage.max_uses:
+            raise ValueError("Data key usage limit reached. Generate a new data key.")
+
+
+data_key_cache = DataKeyCache()
+data_key_budget = DataKeyBudget()
@@ -0,0 +1,112 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+from .kyber_utils import zeroize
+
+# Off by default: keeping shared secrets in memory trades exposure for repeat-decrypt latency
+DECAPS_CACHE_ENABLED = config("DECAPS_CACHE_ENABLED", default=False, cast=bool)
+DECAPS_CACHE_TTL_SECONDS = config("DECAPS_CACHE_TTL_SECONDS", default=300, cast=int)
+DECAPS_CACHE_SIZE = config("DECAPS_CACHE_SIZE", default=4096, cast=int)
+
+
+class _Entry:
+    def __init__(self, key_id: str, secret: bytearray, expires_at: float):
+        self.key_id = key_id
+        self.secret = secret
+        self.expires_at = expires_at
+
+
+class DecapsulationCache:
+    """
+    Bounded cache of Kyber shared secrets, keyed by a digest of (private key, kyber_ciphertext),
+    so records that are decrypted again and again skip the KEM.
+
+    - Only the shared secret is cached: the master key still needs the user key on every call.
+    - The private key is part of the lookup key, so a rotated key never serves stale secrets;
+      invalidate(key_id) additionally wipes them right away.
+    - Entries expire after a TTL, are evicted least-recently-used beyond max_entries,
+      and are zeroized when dropped.
+    """
+
+    def __init__(self, enabled: bool = DECAPS_CACHE_ENABLED, ttl_seconds: int = DECAPS_CACHE_TTL_SECONDS,
+                 max_entries: int = DECAPS_CACHE_SIZE):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    @staticmethod
+    def lookup_key(kyber_ciphertext: bytes, private_key: bytes) -> bytes:
+        return hashlib.sha256(hashlib.sha256(private_key).digest() + kyber_ciphertext).digest()
+
+    def get(self, lookup_key: bytes):
+        """
+        Returns the cached shared secret, or None on a miss (or when disabled).
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(lookup_key)
+            if entry is not None and entry.expires_at <= time.monotonic():
+                self._drop(lookup_key)
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(lookup_key)
+            self.hits += 1
+            return bytes(entry.secret)
+
+    def put(self, lookup_key: bytes, secret: bytes, key_id: str = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            if lookup_key in self._entries:
+                self._drop(lookup_key)
+            self._entries[lookup_key] = _Entry(key_id, bytearray(secret), time.monotonic() + self.ttl_seconds)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+
+    def invalidate(self, key_id: str):
+        """
+        Drops (and wipes) every secret decapsulated with key_id, e.g. after a key rotation.
+        """
+        with self._lock:
+            for lookup_key in [k for k, entry in self._entries.items() if entry.key_id == key_id]:
+                self._drop(lookup_key)
+
+    def clear(self):
+        with self._lock:
+            for lookup_key in list(self._entries):
+                self._drop(lookup_key)
+
+    def _drop(self, lookup_key: bytes):
+        entry = self._entries.pop(lookup_key)
+        zeroize(entry.secret)
+        self.evicted += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._entries)
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "entries": size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evicted": self.evicted,
+            "ttl_seconds": self.ttl_seconds,
+            "max_entries": self.max_entries
+        }
+
+
+# Shared by the whole app; enabled with DECAPS_CACHE_ENABLED
+decaps_cache = DecapsulationCache()
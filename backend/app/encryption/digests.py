@@ -0,0 +1,48 @@
+import hashlib
+
+# Piece size the CBC paths work through, so each piece is hashed while still in cache
+DIGEST_CHUNK_SIZE = 1024 * 1024
+
+
+def reference(ciphertext_sha256: str) -> str:
+    # LedgerBlock.data_reference of an encrypted artifact
+    return f"sha256-{ciphertext_sha256}"
+
+
+class PayloadDigests:
+    """
+    Running SHA-256 of a payload's plaintext and ciphertext, fed by the cipher loops piece by
+    piece (no second pass over the data).
+
+    The ciphertext digest identifies the stored artifact (IV + ciphertext, envelope, or a
+    segmented container, hashed per segment as described in streaming.py) and is what goes in
+    the ledger: encrypt and decrypt events of the same artifact share it. The plaintext digest is
+    only returned to the caller, since the ledger is readable by auditors and plaintexts can be
+    guessable; plaintext=False skips it.
+    """
+
+    def __init__(self, plaintext: bool = True):
+        self.plaintext = hashlib.sha256() if plaintext else None
+        self.ciphertext = hashlib.sha256()
+
+    def update(self, plaintext: bytes = b"", ciphertext: bytes = b""):
+        if plaintext and self.plaintext is not None:
+            self.plaintext.update(plaintext)
+        if ciphertext:
+            self.ciphertext.update(ciphertext)
+
+    @property
+    def reference(self) -> str:
+        return reference(self.ciphertext.hexdigest())
+
+    def to_dict(self) -> dict:
+        digests = {"ciphertext_sha256": self.ciphertext.hexdigest()}
+        if self.plaintext is not None:
+            digests["plaintext_sha256"] = self.plaintext.hexdigest()
+        return digests
+
+    def headers(self) -> dict:
+        headers = {"X-Ciphertext-SHA256": self.ciphertext.hexdigest()}
+        if self.plaintext is not None:
+            headers["X-Plaintext-SHA256"] = self.plaintext.hexdigest()
+        return headers
@@ -0,0 +1,198 @@
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from decouple import config
+from .kem_pool import KemPool, kem_pool
+from .kyber_utils import encapsulate_secret, zeroize
+
+logger = logging.getLogger(__name__)
+
+# Off by default: pre-computed pairs trade memory (and a background producer) for encrypt latency
+ENCAPS_POOL_ENABLED = config("ENCAPS_POOL_ENABLED", default=False, cast=bool)
+# Refill a key's pool once it drops below the low watermark, up to the high watermark
+ENCAPS_POOL_LOW_WATERMARK = config("ENCAPS_POOL_LOW_WATERMARK", default=16, cast=int)
+ENCAPS_POOL_HIGH_WATERMARK = config("ENCAPS_POOL_HIGH_WATERMARK", default=64, cast=int)
+# Number of key_ids kept warm (least recently used beyond this are dropped)
+ENCAPS_POOL_MAX_KEYS = config("ENCAPS_POOL_MAX_KEYS", default=128, cast=int)
+# Keys not used for this long stop being refilled and their pairs are wiped
+ENCAPS_POOL_IDLE_SECONDS = config("ENCAPS_POOL_IDLE_SECONDS", default=600, cast=int)
+
+
+class _KeyPool:
+    def __init__(self, public_key: bytes):
+        self.public_key = public_key
+        self.pairs = deque()
+        self.last_used = time.monotonic()
+        self.refilling = False
+
+    def wipe(self) -> int:
+        count = len(self.pairs)
+        while self.pairs:
+            _, secret = self.pairs.popleft()
+            zeroize(secret)
+        return count
+
+
+class EncapsulationPool:
+    """
+    Keeps a bounded supply of fresh (kyber_ciphertext, shared_secret) pairs per active key_id,
+    produced in the background, so encrypt requests can skip Kyber encapsulation.
+
+    - Each pair is handed out exactly once: take() removes it from the pool under the lock.
+    - Shared secrets are kept in bytearrays and zeroized when evicted.
+    - A key_id becomes active on its first take(); if its public key changes (rotation),
+      the old pairs are wiped.
+    """
+
+    def __init__(self, kem: KemPool = kem_pool,
+                 low_watermark: int = ENCAPS_POOL_LOW_WATERMARK,
+                 high_watermark: int = ENCAPS_POOL_HIGH_WATERMARK,
+                 max_keys: int = ENCAPS_POOL_MAX_KEYS,
+                 idle_seconds: int = ENCAPS_POOL_IDLE_SECONDS):
+        if not 0 <= low_watermark <= high_watermark:
+            raise ValueError("Encapsulation pool watermarks must satisfy 0 <= low <= high")
+        self.kem = kem
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self.max_keys = max_keys
+        self.idle_seconds = idle_seconds
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.produced = 0
+        self.evicted = 0
+        self.refill_failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="encaps-pool", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        thread.join()
+        with self._lock:
+            for entry in self._keys.values():
+                self.evicted += entry.wipe()
+            self._keys.clear()
+
+    def take(self, key_id: str, public_key: bytes):
+        """
+        Pops a pre-computed pair for key_id, or returns None (caller encapsulates inline).
+        The returned secret is a bytearray the caller should zeroize after use.
+        """
+        if self._thread is None:
+            return None
+        with self._lock:
+            entry = self._keys.get(key_id)
+            if entry is None or entry.public_key != public_key:
+                if entry is not None:
+                    self.evicted += entry.wipe()
+                entry = _KeyPool(public_key)
+                self._keys[key_id] = entry
+                while len(self._keys) > self.max_keys:
+                    _, lru = self._keys.popitem(last=False)
+                    self.evicted += lru.wipe()
+            self._keys.move_to_end(key_id)
+            entry.last_used = time.monotonic()
+
+            pair = entry.pairs.popleft() if entry.pairs else None
+            if pair is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            needs_refill = len(entry.pairs) < self.low_watermark and not entry.refilling
+        if needs_refill:
+            self._wakeup.set()
+        return pair
+
+    def invalidate(self, key_id: str):
+        """
+        Drops (and wipes) every pair for key_id, e.g. after a key rotation.
+        """
+        with self._lock:
+            entry = self._keys.pop(key_id, None)
+            if entry is not None:
+                self.evicted += entry.wipe()
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth = {key_id: len(entry.pairs) for key_id, entry in self._keys.items()}
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.running,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "produced": self.produced,
+            "evicted": self.evicted,
+            "refill_failures": self.refill_failures,
+            "low_watermark": self.low_watermark,
+            "high_watermark": self.high_watermark,
+            "active_keys": len(depth),
+            "depth": depth
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            for key_id, entry in self._pending_refills():
+                try:
+                    self._refill(key_id, entry)
+                except Exception:
+                    self.refill_failures += 1
+                    logger.exception("Encapsulation pool refill failed for %s", key_id)
+                finally:
+                    entry.refilling = False
+
+    def _pending_refills(self) -> list:
+        now = time.monotonic()
+        pending = []
+        with self._lock:
+            for key_id, entry in list(self._keys.items()):
+                if now - entry.last_used > self.idle_seconds:
+                    del self._keys[key_id]
+                    self.evicted += entry.wipe()
+                elif len(entry.pairs) < self.low_watermark and not entry.refilling:
+                    entry.refilling = True
+                    pending.append((key_id, entry))
+        return pending
+
+    def _refill(self, key_id: str, entry: _KeyPool):
+        with self._lock:
+            missing = self.high_watermark - len(entry.pairs)
+        # Fan the encapsulations out across the KEM workers
+        futures = [self.kem.submit(encapsulate_secret, entry.public_key) for _ in range(missing)]
+        for future in futures:
+            ciphertext, secret = future.result()
+            secret = bytearray(secret)
+            with self._lock:
+                # The key may have been rotated, evicted or the pool stopped meanwhile
+                if self._keys.get(key_id) is not entry or self._stopping.is_set():
+                    zeroize(secret)
+                    continue
+                entry.pairs.append((ciphertext, secret))
+                self.produced += 1
+
+
+# Shared by the whole app; started by the FastAPI lifespan when ENCAPS_POOL_ENABLED is set
+encaps_pool = EncapsulationPool()
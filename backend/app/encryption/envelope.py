@@ -0,0 +1,247 @@
+import struct
+
+# Binary envelope format
+#
+#   MAGIC | version (u8) | algorithm (u8)
+#   | key_id_len (u16) | key_id (utf-8)
+#   | key_version (u32)                                  (version 2 only)
+#   | kem_len (u16) | kyber_ciphertext
+#   | wrapped_len (u8) | wrapped_secret                  (version 2 only, empty until rotated)
+#   | bound_len (u16) | bound_header                     (version 2 only, see below)
+#   | iv_len (u8) | iv
+#   | ct_len (u32) | ciphertext
+#   | tag_len (u8) | tag
+#
+# The payload is bound to its header as AES-GCM associated data, so key_id cannot be swapped
+# undetected. Version 1 binds the whole header, Kyber ciphertext included. Version 2 binds only
+# MAGIC | version | algorithm | key_id, so a key rotation can replace the Kyber ciphertext
+# (and wrapped secret, see rewrap.py) without touching the payload. A version 1 envelope that
+# was rotated keeps its original header in bound_header, as that is what its payload is bound to.
+# All integers are big-endian.
+MAGIC = b"DKEV"
+VERSION = 2
+SUPPORTED_VERSIONS = (1, 2)
+ALG_AES_256_GCM = 1
+MEDIA_TYPE = "application/octet-stream"
+
+_PREFIX = struct.Struct(">4sBBH")
+
+
+class Envelope:
+    def __init__(self, key_id: str, kyber_ciphertext: bytes, iv: bytes, ciphertext: bytes, tag: bytes,
+                 algorithm: int = ALG_AES_256_GCM, key_version: int = 1, wrapped_secret: bytes = b"",
+                 bound_header: bytes = b"", format_version: int = VERSION):
+        self.key_id = key_id
+        self.kyber_ciphertext = kyber_ciphertext
+        self.iv = iv
+        self.ciphertext = ciphertext
+        self.tag = tag
+        self.algorithm = algorithm
+        self.key_version = key_version
+        self.wrapped_secret = wrapped_secret
+        self.bound_header = bound_header
+        self.format_version = format_version
+
+    def _prefix(self) -> bytes:
+        key_id = self.key_id.encode('utf-8')
+        return _PREFIX.pack(MAGIC, self.format_version, self.algorithm, len(key_id)) + key_id
+
+    def header_bytes(self) -> bytes:
+        """
+        Everything before the IV.
+        """
+        if self.format_version == 1:
+            return self._prefix() + struct.pack(">H", len(self.kyber_ciphertext)) + self.kyber_ciphertext
+        return b"".join([
+            self._prefix(),
+            struct.pack(">IH", self.key_version, len(self.kyber_ciphertext)), self.kyber_ciphertext,
+            struct.pack(">B", len(self.wrapped_secret)), self.wrapped_secret,
+            struct.pack(">H", len(self.bound_header)), self.bound_header
+        ])
+
+    def payload_aad(self) -> bytes:
+        """
+        Associated data the payload is sealed with.
+        """
+        if self.format_version == 1:
+            return self.header_bytes()
+        return self.bound_header or self._prefix()
+
+    def rewrapped(self, kyber_ciphertext: bytes, wrapped_secret: bytes, key_version: int) -> "Envelope":
+        """
+        Returns a copy re-keyed to another key version; the payload is left as is.
+        """
+        bound_header = self.payload_aad() if self.format_version == 1 else self.bound_header
+        return Envelope(self.key_id, kyber_ciphertext, self.iv, self.ciphertext, self.tag, self.algorithm,
+                        key_version, wrapped_secret, bound_header)
+
+    def chunks(self) -> list:
+        """
+        The serialized envelope piece by piece (hashed without joining them into a copy).
+        """
+        return [
+            self.header_bytes(),
+            struct.pack(">B", len(self.iv)), self.iv,
+            struct.pack(">I", len(self.ciphertext)), self.ciphertext,
+            struct.pack(">B", len(self.tag)), self.tag
+        ]
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.chunks())
+
+    @staticmethod
+    def is_envelope(data: bytes) -> bool:
+        return data[:len(MAGIC)] == MAGIC
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "Envelope":
+        reader = _Reader(data)
+        magic, version, algorithm, key_id_len = reader.unpack(_PREFIX)
+        if magic != MAGIC:
+            raise ValueError("Not a dual-key envelope (bad magic)")
+        if version not in SUPPORTED_VERSIONS:
+            raise ValueError(f"Unsupported envelope version: {version}")
+        if algorithm != ALG_AES_256_GCM:
+            raise ValueError(f"Unsupported envelope algorithm: {algorithm}")
+        key_id = reader.take(key_id_len).decode('utf-8')
+        key_version, wrapped_secret, bound_header = 1, b"", b""
+        if version == 1:
+            kyber_ciphertext = reader.take(reader.unpack(">H")[0])
+        else:
+            key_version, kem_len = reader.unpack(">IH")
+            kyber_ciphertext = reader.take(kem_len)
+            wrapped_secret = reader.take(reader.unpack(">B")[0])
+            bound_header = reader.take(reader.unpack(">H")[0])
+        iv = reader.take(reader.unpack(">B")[0])
+        ciphertext = reader.take(reader.unpack(">I")[0])
+        tag = reader.take(reader.unpack(">B")[0])
+        if not reader.at_end():
+            raise ValueError("Trailing bytes after envelope")
+        return cls(key_id, kyber_ciphertext, iv, ciphertext, tag, algorithm,
+                   key_version, wrapped_secret, bound_header, version)
+
+
+# Multi-recipient envelope format (version 1)
+#
+#   MULTI_MAGIC | version (u8) | algorithm (u8) | recipient_count (u16)
+#   | recipient * recipient_count
+#   | iv_len (u8) | iv | ct_len (u32) | ciphertext | tag_len (u8) | tag
+#
+#   recipient = key_id_len (u16) | key_id | key_version (u32)
+#               | kem_len (u16) | kyber_ciphertext
+#               | wrapped_len (u8) | wrapped_secret      (empty until rotated, see rewrap.py)
+#               | key_len (u8) | wrapped_data_key       (nonce (12) | AES-GCM(data_key) | tag (16))
+#
+# The payload is encrypted once under a random data key; each recipient slot wraps that data key
+# under its own dual-key master key (Kyber secret for key_id + that recipient's user key), with
+# MULTI_MAGIC | version | algorithm | key_id as associated data. The payload's associated data is
+# MULTI_MAGIC | version | algorithm. Slots can thus be re-wrapped on rotation independently.
+MULTI_MAGIC = b"DKMR"
+MULTI_VERSION = 1
+MAX_RECIPIENTS = 64
+
+_MULTI_PREFIX = struct.Struct(">4sBBH")
+
+
+class Recipient:
+    def __init__(self, key_id: str, kyber_ciphertext: bytes, wrapped_data_key: bytes, key_version: int = 1,
+                 wrapped_secret: bytes = b""):
+        self.key_id = key_id
+        self.kyber_ciphertext = kyber_ciphertext
+        self.wrapped_data_key = wrapped_data_key
+        self.key_version = key_version
+        self.wrapped_secret = wrapped_secret
+
+    def to_bytes(self) -> bytes:
+        key_id = self.key_id.encode('utf-8')
+        return b"".join([
+            struct.pack(">H", len(key_id)), key_id,
+            struct.pack(">IH", self.key_version, len(self.kyber_ciphertext)), self.kyber_ciphertext,
+            struct.pack(">B", len(self.wrapped_secret)), self.wrapped_secret,
+            struct.pack(">B", len(self.wrapped_data_key)), self.wrapped_data_key
+        ])
+
+
+class MultiRecipientEnvelope:
+    def __init__(self, recipients: list, iv: bytes, ciphertext: bytes, tag: bytes, algorithm: int = ALG_AES_256_GCM):
+        self.recipients = recipients
+        self.iv = iv
+        self.ciphertext = ciphertext
+        self.tag = tag
+        self.algorithm = algorithm
+
+    def payload_aad(self) -> bytes:
+        return MULTI_MAGIC + struct.pack(">BB", MULTI_VERSION, self.algorithm)
+
+    def recipient_aad(self, key_id: str) -> bytes:
+        return self.payload_aad() + key_id.encode('utf-8')
+
+    def recipient(self, key_id: str) -> Recipient:
+        for recipient in self.recipients:
+            if recipient.key_id == key_id:
+                return recipient
+        raise ValueError(f"Envelope has no recipient slot for key {key_id}")
+
+    def chunks(self) -> list:
+        # As Envelope.chunks
+        return [
+            _MULTI_PREFIX.pack(MULTI_MAGIC, MULTI_VERSION, self.algorithm, len(self.recipients)),
+            *(recipient.to_bytes() for recipient in self.recipients),
+            struct.pack(">B", len(self.iv)), self.iv,
+            struct.pack(">I", len(self.ciphertext)), self.ciphertext,
+            struct.pack(">B", len(self.tag)), self.tag
+        ]
+
+    def to_bytes(self) -> bytes:
+        return b"".join(self.chunks())
+
+    @staticmethod
+    def is_multi_recipient(data: bytes) -> bool:
+        return data[:len(MULTI_MAGIC)] == MULTI_MAGIC
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MultiRecipientEnvelope":
+        reader = _Reader(data)
+        magic, version, algorithm, count = reader.unpack(_MULTI_PREFIX)
+        if magic != MULTI_MAGIC:
+            raise ValueError("Not a multi-recipient envelope (bad magic)")
+        if version != MULTI_VERSION:
+            raise ValueError(f"Unsupported multi-recipient envelope version: {version}")
+        if algorithm != ALG_AES_256_GCM:
+            raise ValueError(f"Unsupported envelope algorithm: {algorithm}")
+        if not 0 < count <= MAX_RECIPIENTS:
+            raise ValueError(f"Invalid recipient count: {count}")
+        recipients = []
+        for _ in range(count):
+            key_id = reader.take(reader.unpack(">H")[0]).decode('utf-8')
+            key_version, kem_len = reader.unpack(">IH")
+            kyber_ciphertext = reader.take(kem_len)
+            wrapped_secret = reader.take(reader.unpack(">B")[0])
+            wrapped_data_key = reader.take(reader.unpack(">B")[0])
+            recipients.append(Recipient(key_id, kyber_ciphertext, wrapped_data_key, key_version, wrapped_secret))
+        iv = reader.take(reader.unpack(">B")[0])
+        ciphertext = reader.take(reader.unpack(">I")[0])
+        tag = reader.take(reader.unpack(">B")[0])
+        if not reader.at_end():
+            raise ValueError("Trailing bytes after envelope")
+        return cls(recipients, iv, ciphertext, tag, algorithm)
+
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = memoryview(data)
+        self.offset = 0
+
+    def take(self, n: int) -> bytes:
+        if self.offset + n > len(self.data):
+            raise ValueError("Truncated envelope")
+        chunk = bytes(self.data[self.offset:self.offset + n])
+        self.offset += n
+        return chunk
+
+    def unpack(self, fmt):
+        fmt = fmt if isinstance(fmt, struct.Struct) else struct.Struct(fmt)
+        return fmt.unpack(self.take(fmt.size))
+
+    def at_end(self) -> bool:
+        return self.offset == len(self.data)
@@ -0,0 +1,122 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from decouple import config
+from .kyber_utils import encapsulate_secret, decapsulate_secret
+
+# Number of worker processes for Kyber operations.
+# 0 disables the pool: KEM calls then run inline in the caller (used by tests and scripts).
+KEM_POOL_WORKERS = config("KEM_POOL_WORKERS", default=os.cpu_count() or 1, cast=int)
+
+
+def _warm_up() -> int:
+    # Importing kyber_py and running one encapsulation builds its tables in the worker,
+    # so the first real request does not pay for it.
+    from kyber_py.kyber import Kyber1024
+    pk, _ = Kyber1024.keygen()
+    Kyber1024.encaps(pk)
+    return os.getpid()
+
+
+class KemPool:
+    """
+    Process pool for the pure-Python Kyber1024 operations.
+    kyber_py holds the GIL for milliseconds per call, so running it in worker processes keeps
+    the event loop free and lets KEM throughput scale with cores. run() never blocks the loop:
+    without workers it uses a thread, and a broken pool is replaced from a thread too.
+    """
+
+    def __init__(self, workers: int = KEM_POOL_WORKERS):
+        self.workers = workers
+        self._executor = None
+        self._restart_lock = threading.Lock()
+
+    @property
+    def running(self) -> bool:
+        return self._executor is not None
+
+    def start(self):
+        """
+        Starts (and warms up) the worker processes. No-op if disabled or already running.
+        """
+        if self._executor is not None or self.workers <= 0:
+            return
+        # spawn, not fork: the server process holds DB connections and threads
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+        self.warm_up()
+
+    def warm_up(self):
+        futures = [self._executor.submit(_warm_up) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self, wait: bool = True):
+        """
+        Stops the workers. Queued calls are cancelled; calls already running finish first when wait=True.
+        """
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+    def _restart(self, broken: ProcessPoolExecutor):
+        # A worker died (e.g. OOM-killed): replace the pool once instead of failing every later call.
+        # Spawns and warms up processes, so async callers run it in a thread.
+        with self._restart_lock:
+            if self._executor is broken:
+                self._executor = None
+                broken.shutdown(wait=False, cancel_futures=True)
+                self.start()
+
+    def submit(self, fn, *args) -> Future:
+        """
+        Submits fn(*args) to the pool from synchronous code (background threads).
+        Runs inline and returns a completed future when the pool is not running.
+        """
+        executor = self._executor
+        if executor is None:
+            future = Future()
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+            return future
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._restart(executor)
+            return self.submit(fn, *args)
+
+    async def run(self, fn, *args):
+        """
+        Awaits fn(*args) on the pool without blocking the event loop.
+        """
+        executor = self._executor
+        if executor is None:
+            return await asyncio.to_thread(fn, *args)
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        except BrokenProcessPool:
+            await asyncio.to_thread(self._restart, executor)
+            if self._executor is None:
+                return await asyncio.to_thread(fn, *args)
+            return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def encapsulate(self, public_key: bytes):
+        """
+        Returns: (ciphertext, shared_secret)
+        """
+        return await self.run(encapsulate_secret, public_key)
+
+    async def decapsulate(self, ciphertext: bytes, private_key: bytes) -> bytes:
+        return await self.run(decapsulate_secret, ciphertext, private_key)
+
+
+# Shared by the whole app; started and stopped by the FastAPI lifespan in app.main
+kem_pool = KemPool()
@@ -65,3 +65,10 @@ def decapsulate_secret(ciphertext: bytes, private_key: bytes):
     """
     key = Kyber1024.decaps(private_key, ciphertext)
     return key
+
+def zeroize(secret: bytearray):
+    """
+    Best-effort wipe of a secret held in a mutable buffer.
+    (Copies made by Python or C libraries along the way cannot be reached.)
+    """
+    secret[:] = bytes(len(secret))
@@ -0,0 +1,70 @@
+import os
+import struct
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.exceptions import InvalidTag
+from .kyber_utils import encapsulate_secret, decapsulate_secret
+
+# Key rotation without touching payloads
+#
+# A payload's master key is derived from the Kyber shared secret it was first encrypted with
+# (plus the user key). Rotating a system key therefore keeps that original secret and only
+# changes how it is reached: the record gets a fresh Kyber ciphertext for the new public key,
+# and the original secret is stored wrapped under that encapsulation:
+#
+#   wrapped_secret = nonce (12) | AES-GCM(KDF(new shared secret), original secret) | tag (16)
+#
+# bound to key_id, key version and the new Kyber ciphertext as associated data.
+# Records that were never rotated have no wrapped secret: the shared secret *is* the original.
+# Re-wrapping always wraps the original secret again, so rotations never nest.
+NONCE_SIZE = 12
+WRAPPED_SECRET_SIZE = NONCE_SIZE + 32 + 16
+
+
+def _binding(key_id: str, key_version: int, kyber_ciphertext: bytes) -> bytes:
+    return key_id.encode('utf-8') + struct.pack(">I", key_version) + kyber_ciphertext
+
+
+def _wrapping_key(kyber_secret: bytes) -> AESGCM:
+    return AESGCM(HKDF(
+        algorithm=hashes.SHA256(),
+        length=32,
+        salt=None,
+        info=b"dualkey-rewrap-v1",
+    ).derive(bytes(kyber_secret)))
+
+
+def wrap_secret(original_secret: bytes, kyber_secret: bytes, key_id: str, key_version: int, kyber_ciphertext: bytes) -> bytes:
+    nonce = os.urandom(NONCE_SIZE)
+    return nonce + _wrapping_key(kyber_secret).encrypt(
+        nonce, bytes(original_secret), _binding(key_id, key_version, kyber_ciphertext)
+    )
+
+
+def unwrap_secret(wrapped_secret: bytes, kyber_secret: bytes, key_id: str, key_version: int, kyber_ciphertext: bytes) -> bytes:
+    if len(wrapped_secret) != WRAPPED_SECRET_SIZE:
+        raise ValueError("Invalid wrapped secret")
+    try:
+        return _wrapping_key(kyber_secret).decrypt(
+            wrapped_secret[:NONCE_SIZE], wrapped_secret[NONCE_SIZE:], _binding(key_id, key_version, kyber_ciphertext)
+        )
+    except InvalidTag:
+        raise ValueError("Wrapped secret authentication failed. Wrong key version?")
+
+
+def rewrap_secret(kyber_ciphertext: bytes, wrapped_secret: bytes, old_private_key: bytes, old_version: int,
+                  new_public_key: bytes, new_version: int, key_id: str):
+    """
+    Moves one record from old_version to new_version of key_id.
+    Module-level (and self-contained) so it can run on the KEM worker processes.
+    Returns: (new_kyber_ciphertext, new_wrapped_secret)
+    """
+    # 1. Recover the original secret under the old key
+    original_secret = decapsulate_secret(kyber_ciphertext, old_private_key)
+    if wrapped_secret:
+        original_secret = unwrap_secret(wrapped_secret, original_secret, key_id, old_version, kyber_ciphertext)
+
+    # 2. Encapsulate to the new key and wrap the original secret under it
+    new_ciphertext, new_secret = encapsulate_secret(new_public_key)
+    return new_ciphertext, wrap_secret(original_secret, new_secret, key_id, new_version, new_ciphertext)
@@ -1,14 +1,21 @@
-from fastapi import APIRouter, Depends, HTTPException, Body, UploadFile, File, Form, Response
+from fastapi import APIRouter, Depends, HTTPException, Body, UploadFile, File, Form, Header, Request, Response
+from fastapi.responses import StreamingResponse
+import asyncio
 import base64
+import hashlib
+from typing import List
 from pydantic import BaseModel
 from app.encryption.core import DualKeyEncryption
-from app.key_management.manager import KeyManager
+from app.encryption.envelope import Envelope, MultiRecipientEnvelope, MAX_RECIPIENTS, MEDIA_TYPE as ENVELOPE_MEDIA_TYPE
+from app.encryption.data_keys import DataKeyCache, data_key_budget, data_key_cache, encrypt_record, decrypt_record
+from app.encryption.streaming import DEFAULT_CHUNK_SIZE, HEADER_PREFIX_SIZE, SegmentHeader
+from app.encryption.digests import PayloadDigests, reference
+from app.key_management.manager import key_manager
 from app.rbac.dependencies import RoleChecker, UserRole, get_current_user_id
 from app.blockchain.chain import Blockchain
 
 router = APIRouter()
 encryption_engine = DualKeyEncryption()
-key_manager = KeyManager()
 blockchain = Blockchain()
 
 # RBAC: Only ADMIN and SERVICE can encrypt
@@ -26,137 +33,703 @@ class DecryptionRequest(BaseModel):
     kyber_ciphertext: str # NEW: Required for Kyber Decapsulation
     user_key: str # Key-B
     key_id: str # Identifier for Key-A
+    key_version: int = 1 # Version of Key-A the record is wrapped for (records predating rotation: 1)
+    wrapped_secret: str = None # Set once the record has been re-wrapped by a key rotation
+
+class BatchEncryptionRequest(BaseModel):
+    records: List[EncryptionRequest]
+
+class BatchDecryptionRequest(BaseModel):
+    records: List[DecryptionRequest]
+
+class DataKeyRequest(BaseModel):
+    user_key: str # Key-B
+    key_id: str # Identifier for Key-A
+    return_plaintext: bool = True # False: only the wrapped key (for later server-side use)
+
+class DecryptDataKeyRequest(BaseModel):
+    wrapped_data_key: str
+    user_key: str
+    key_id: str
+    key_version: int = 1
+
+class DataKeyRecordsRequest(BaseModel):
+    wrapped_data_key: str
+    user_key: str
+    key_id: str
+    records: List[str] # Plaintexts (encrypt) or base64 records (decrypt)
+    key_version: int = 1
+
+class MultiRecipient(BaseModel):
+    key_id: str # Identifier for Key-A
+    user_key: str # Key-B for this recipient
+
+class MultiEncryptionRequest(BaseModel):
+    data: str
+    recipients: List[MultiRecipient]
+
+class MultiDecryptionRequest(BaseModel):
+    envelope: str # base64 multi-recipient envelope
+    key_id: str # Recipient slot to open
+    user_key: str
+
+# Upper bound on records per batch call
+MAX_BATCH_SIZE = 10000
+
+def _prefers_octet_stream(accept: str) -> bool:
+    """
+    Content negotiation: binary only when asked for, JSON stays the default.
+    """
+    if not accept:
+        return False
+    types = [part.split(";")[0].strip() for part in accept.split(",")]
+    if ENVELOPE_MEDIA_TYPE not in types:
+        return False
+    return "application/json" not in types or types.index(ENVELOPE_MEDIA_TYPE) < types.index("application/json")
+
+def _is_octet_stream(content_type: str) -> bool:
+    return bool(content_type) and content_type.split(";")[0].strip() == ENVELOPE_MEDIA_TYPE
+
+def _no_envelope_body(content_type: str = Header(None, include_in_schema=False)):
+    # Runs before the JSON body is validated, so binary envelopes get a pointer instead of a 422
+    if _is_octet_stream(content_type):
+        raise HTTPException(status_code=415, detail="Binary envelopes are posted to /decrypt-envelope")
 
 @router.post("/encrypt", dependencies=[Depends(allow_encrypt)])
-async def encrypt_data(request: EncryptionRequest, user_id: str = Depends(get_current_user_id)):
-    # 1. Retrieve System Key (Public Key only needed for encryption)
-    pk, _ = key_manager.get_or_create_system_keypair(request.key_id)
+async def encrypt_data(request: EncryptionRequest, user_id: str = Depends(get_current_user_id), accept: str = Header(None)):
+    # 1. Retrieve System Key (Public Key only needed for encryption), current version
+    key_version, pk, _ = await key_manager.get_current_key_async(request.key_id)
+    
+    # Accept: application/octet-stream -> compact binary envelope instead of base64 JSON
+    if _prefers_octet_stream(accept):
+        try:
+            digests = PayloadDigests()
+            envelope = await encryption_engine.encrypt_envelope_async(
+                request.data.encode('utf-8'),
+                pk,
+                request.user_key,
+                request.key_id,
+                key_version,
+                digests=digests
+            )
+            await blockchain.add_block_async(
+                event_type="ENCRYPTION_KYBER",
+                key_id=request.key_id,
+                user_id=user_id,
+                data_reference=digests.reference
+            )
+            return Response(content=envelope, media_type=ENVELOPE_MEDIA_TYPE, headers=digests.headers())
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
     
     # 2. Encrypt
     try:
-        result = encryption_engine.encrypt_data(
+        result = await encryption_engine.encrypt_data_async(
             request.data, 
             pk, 
-            request.user_key
+            request.user_key,
+            key_id=request.key_id
         )
         
-        # 3. Log to Blockchain
-        blockchain.add_block(
+        # 3. Log to Blockchain (SHA-256 of the ciphertext, computed while encrypting)
+        await blockchain.add_block_async(
             event_type="ENCRYPTION_KYBER",
             key_id=request.key_id,
             user_id=user_id,
-            data_reference=f"hash-{hash(result['encrypted_data'])}"
+            data_reference=reference(result["ciphertext_sha256"])
         )
         
         # Return both the encrypted data AND the Kyber ciphertext (encapsulated key)
         return {
             "encrypted_data": result["encrypted_data"],
             "kyber_ciphertext": result["kyber_ciphertext"],
-            "key_id": request.key_id
+            "key_id": request.key_id,
+            "key_version": key_version,
+            "plaintext_sha256": result["plaintext_sha256"],
+            "ciphertext_sha256": result["ciphertext_sha256"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/decrypt", dependencies=[Depends(allow_decrypt)])
+@router.post("/decrypt", dependencies=[Depends(allow_decrypt), Depends(_no_envelope_body)])
 async def decrypt_data(request: DecryptionRequest, user_id: str = Depends(get_current_user_id)):
-    # 1. Retrieve System Key (Private Key needed for decryption)
-    _, sk = key_manager.get_or_create_system_keypair(request.key_id)
-    
     # 2. Decrypt
     try:
-        decrypted = encryption_engine.decrypt_data(
+        # 1. Retrieve System Key (Private Key needed for decryption) of the record's version
+        _, sk = await key_manager.get_key_version_async(request.key_id, request.key_version)
+        
+        digests = PayloadDigests()
+        decrypted = await encryption_engine.decrypt_data_async(
             request.encrypted_data,
             request.kyber_ciphertext,
             sk, 
-            request.user_key
+            request.user_key,
+            key_id=request.key_id,
+            wrapped_secret_b64=request.wrapped_secret,
+            key_version=request.key_version,
+            digests=digests
         )
         
-        # 3. Log to Blockchain
-        blockchain.add_block(
+        # 3. Log to Blockchain (same reference as the ENCRYPTION_KYBER block of this ciphertext)
+        await blockchain.add_block_async(
             event_type="DECRYPTION_KYBER",
             key_id=request.key_id,
             user_id=user_id,
-            data_reference=f"hash-{hash(request.encrypted_data)}"
+            data_reference=digests.reference
         )
         
-        return {"data": decrypted}
+        return {"data": decrypted, **digests.to_dict()}
     except Exception as e:
         # Log failed attempt?
-        blockchain.add_block(
+        await blockchain.add_block_async(
             event_type="DECRYPTION_FAILED",
             key_id=request.key_id,
             user_id=user_id,
             data_reference="N/A"
         )
         raise HTTPException(status_code=400, detail=f"Decryption failed. Invalid keys or data. {str(e)}")
+
+# The raw body is read by the route itself; this documents it in OpenAPI
+ENVELOPE_BODY = {"requestBody": {"required": True, "content": {ENVELOPE_MEDIA_TYPE: {"schema": {"type": "string", "format": "binary"}}}}}
+
+@router.post("/decrypt-envelope", dependencies=[Depends(allow_decrypt)], openapi_extra=ENVELOPE_BODY)
+async def decrypt_envelope(http_request: Request, user_id: str = Depends(get_current_user_id),
+                           x_user_key: str = Header(...), x_key_id: str = Header(None), accept: str = Header(None)):
+    """
+    Opens a binary envelope posted as the raw body (Content-Type: application/octet-stream),
+    with the user key in the X-User-Key header. Multi-recipient envelopes name the slot to
+    open in X-Key-Id.
+    """
+    if not _is_octet_stream(http_request.headers.get("content-type")):
+        raise HTTPException(status_code=415, detail=f"Expected Content-Type: {ENVELOPE_MEDIA_TYPE}")
+    blob = await http_request.body()
+    if MultiRecipientEnvelope.is_multi_recipient(blob):
+        if not x_key_id:
+            raise HTTPException(status_code=400, detail="Missing X-Key-Id header")
+        decrypted, digests = await _decrypt_multi(blob, x_key_id, x_user_key, user_id)
+        return _plaintext_response(decrypted, accept, digests)
+    try:
+        envelope = Envelope.from_bytes(blob)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid envelope. {str(e)}")
+    # 2. Decrypt
+    try:
+        # 1. Retrieve System Key (and version) named by the envelope
+        _, sk = await key_manager.get_key_version_async(envelope.key_id, envelope.key_version)
+        
+        digests = PayloadDigests()
+        decrypted = await encryption_engine.decrypt_envelope_async(envelope, sk, x_user_key, digests=digests)
+    except Exception as e:
+        await blockchain.add_block_async(
+            event_type="DECRYPTION_FAILED",
+            key_id=envelope.key_id,
+            user_id=user_id,
+            data_reference="N/A"
+        )
+        raise HTTPException(status_code=400, detail=f"Decryption failed. Invalid keys or data. {str(e)}")
+    
+    # 3. Log to Blockchain
+    await blockchain.add_block_async(
+        event_type="DECRYPTION_KYBER",
+        key_id=envelope.key_id,
+        user_id=user_id,
+        data_reference=digests.reference
+    )
+    
+    return _plaintext_response(decrypted, accept, digests)
+
+def _plaintext_response(decrypted: bytes, accept: str, digests: PayloadDigests):
+    if _prefers_octet_stream(accept):
+        return Response(content=decrypted, media_type=ENVELOPE_MEDIA_TYPE, headers=digests.headers())
+    try:
+        return {"data": decrypted.decode('utf-8'), **digests.to_dict()}
+    except UnicodeDecodeError:
+        raise HTTPException(status_code=406, detail=f"Plaintext is binary. Send Accept: {ENVELOPE_MEDIA_TYPE}")
+
+@router.post("/encrypt-multi", dependencies=[Depends(allow_encrypt)])
+async def encrypt_multi(request: MultiEncryptionRequest, user_id: str = Depends(get_current_user_id), accept: str = Header(None)):
+    """
+    Encrypts the data once, readable under each recipient's system key (with that recipient's user key).
+    The payload is sealed under a random data key; each recipient gets its own wrapped copy of it.
+    Returns the multi-recipient envelope (base64 JSON, or raw with Accept: application/octet-stream).
+    """
+    if not 0 < len(request.recipients) <= MAX_RECIPIENTS:
+        raise HTTPException(status_code=400, detail=f"A multi-recipient envelope needs 1-{MAX_RECIPIENTS} recipients")
+    key_ids = [r.key_id for r in request.recipients]
+    if len(set(key_ids)) != len(key_ids):
+        raise HTTPException(status_code=400, detail="Duplicate recipient key_id")
+    
+    try:
+        # 1. Retrieve System Keys (current version of each)
+        keys = {key_id: await key_manager.get_current_key_async(key_id) for key_id in key_ids}
+        
+        # 2. Encrypt (recipient encapsulations run concurrently)
+        digests = PayloadDigests()
+        envelope = await encryption_engine.encrypt_multi_async(
+            request.data.encode('utf-8'),
+            [(r.key_id, keys[r.key_id][0], keys[r.key_id][1], r.user_key) for r in request.recipients],
+            digests=digests
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+    
+    # 3. Log to Blockchain: one block per recipient key, same payload reference
+    await blockchain.add_blocks_async([{
+        "event_type": "ENCRYPTION_MULTI",
+        "key_id": key_id,
+        "user_id": user_id,
+        "data_reference": digests.reference
+    } for key_id in key_ids])
+    
+    if _prefers_octet_stream(accept):
+        return Response(content=envelope, media_type=ENVELOPE_MEDIA_TYPE, headers=digests.headers())
+    return {
+        "envelope": base64.b64encode(envelope).decode('utf-8'),
+        "recipients": [{"key_id": key_id, "key_version": keys[key_id][0]} for key_id in key_ids],
+        **digests.to_dict()
+    }
+
+@router.post("/decrypt-multi", dependencies=[Depends(allow_decrypt)])
+async def decrypt_multi(request: MultiDecryptionRequest, user_id: str = Depends(get_current_user_id), accept: str = Header(None)):
+    """
+    Opens a multi-recipient envelope through the slot of key_id.
+    (Raw envelopes can also be posted to /decrypt-envelope with X-Key-Id and X-User-Key headers.)
+    """
+    try:
+        blob = base64.b64decode(request.envelope)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid envelope. {str(e)}")
+    decrypted, digests = await _decrypt_multi(blob, request.key_id, request.user_key, user_id)
+    return _plaintext_response(decrypted, accept, digests)
+
+async def _decrypt_multi(blob: bytes, key_id: str, user_key: str, user_id: str):
+    # Returns (plaintext, digests)
+    try:
+        envelope = MultiRecipientEnvelope.from_bytes(blob)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid envelope. {str(e)}")
+    
+    # 2. Decrypt
+    try:
+        # 1. Retrieve System Key of the version the recipient slot is wrapped for
+        _, sk = await key_manager.get_key_version_async(key_id, envelope.recipient(key_id).key_version)
+        
+        digests = PayloadDigests()
+        decrypted = await encryption_engine.decrypt_multi_async(envelope, key_id, sk, user_key, digests=digests)
+    except Exception as e:
+        await blockchain.add_block_async(
+            event_type="DECRYPTION_FAILED",
+            key_id=key_id,
+            user_id=user_id,
+            data_reference="N/A"
+        )
+        raise HTTPException(status_code=400, detail=f"Decryption failed. Invalid keys or data. {str(e)}")
+    
+    # 3. Log to Blockchain
+    await blockchain.add_block_async(
+        event_type="DECRYPTION_KYBER",
+        key_id=key_id,
+        user_id=user_id,
+        data_reference=digests.reference
+    )
+    return decrypted, digests
+
+@router.post("/encrypt-batch", dependencies=[Depends(allow_encrypt)])
+async def encrypt_batch(request: BatchEncryptionRequest, user_id: str = Depends(get_current_user_id)):
+    """
+    Encrypts many records in one call.
+    Each key_id is resolved once, and the whole batch is logged with one grouped ledger append
+    (one ENCRYPTION_BATCH block per key_id). Results come back in request order;
+    a failing record gets an "error" entry instead of failing the batch.
+    """
+    if len(request.records) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} records)")
+    
+    keys = await _resolve_batch_keys(request.records)
+    
+    async def encrypt_record(record: EncryptionRequest) -> dict:
+        _, pk, _ = _batch_key(keys, record.key_id)
+        return await encryption_engine.encrypt_data_async(record.data, pk, record.user_key, key_id=record.key_id)
+    
+    # Encapsulations run concurrently across the KEM pool
+    outcomes = await asyncio.gather(*(encrypt_record(r) for r in request.records), return_exceptions=True)
+    
+    results = []
+    for i, (record, outcome) in enumerate(zip(request.records, outcomes)):
+        if isinstance(outcome, Exception):
+            results.append({"index": i, "key_id": record.key_id, "error": str(outcome)})
+            continue
+        results.append({
+            "index": i,
+            "encrypted_data": outcome["encrypted_data"],
+            "kyber_ciphertext": outcome["kyber_ciphertext"],
+            "key_id": record.key_id,
+            "key_version": keys[record.key_id][0],
+            "plaintext_sha256": outcome["plaintext_sha256"],
+            "ciphertext_sha256": outcome["ciphertext_sha256"]
+        })
+    
+    await _log_batch("ENCRYPTION_BATCH", results, [], user_id)
+    return {"results": results}
+
+@router.post("/decrypt-batch", dependencies=[Depends(allow_decrypt)])
+async def decrypt_batch(request: BatchDecryptionRequest, user_id: str = Depends(get_current_user_id)):
+    """
+    Decrypts many records in one call, with the same key resolution and ledger grouping
+    as /encrypt-batch. Every failed record is still logged as its own DECRYPTION_FAILED block.
+    """
+    if len(request.records) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} records)")
+    
+    keys = await _resolve_batch_keys(request.records)
+    older = {(r.key_id, r.key_version) for r in request.records
+             if not isinstance(keys[r.key_id], Exception) and r.key_version != keys[r.key_id][0]}
+    retired = await asyncio.to_thread(_resolve_key_versions, older)
+    
+    async def decrypt_record(record: DecryptionRequest) -> dict:
+        version, _, sk = _batch_key(keys, record.key_id)
+        if record.key_version != version:
+            sk = _batch_key(retired, (record.key_id, record.key_version))
+        digests = PayloadDigests()
+        data = await encryption_engine.decrypt_data_async(
+            record.encrypted_data,
+            record.kyber_ciphertext,
+            sk,
+            record.user_key,
+            key_id=record.key_id,
+            wrapped_secret_b64=record.wrapped_secret,
+            key_version=record.key_version,
+            digests=digests
+        )
+        return {"data": data, **digests.to_dict()}
+    
+    # Decapsulations run concurrently across the KEM pool
+    outcomes = await asyncio.gather(*(decrypt_record(r) for r in request.records), return_exceptions=True)
+    
+    results = []
+    failures = []
+    for i, (record, outcome) in enumerate(zip(request.records, outcomes)):
+        if isinstance(outcome, Exception):
+            failures.append(record.key_id)
+            results.append({"index": i, "key_id": record.key_id, "error": f"Decryption failed. Invalid keys or data. {str(outcome)}"})
+            continue
+        results.append({"index": i, "key_id": record.key_id, **outcome})
+    
+    await _log_batch("DECRYPTION_BATCH", results, failures, user_id)
+    return {"results": results}
+
+@router.post("/generate-data-key", dependencies=[Depends(allow_encrypt)])
+async def generate_data_key(request: DataKeyRequest, user_id: str = Depends(get_current_user_id)):
+    """
+    KMS-style envelope encryption: returns a fresh AES-256 data key plus the same key wrapped
+    under the dual-key scheme. Encrypt many records locally with the data key
+    (AES-GCM, a new nonce per record) and store only the wrapped key alongside them.
+    """
+    key_version, pk, _ = await key_manager.get_current_key_async(request.key_id)
+    try:
+        data_key, wrapped = await encryption_engine.generate_data_key_async(pk, request.user_key, key_id=request.key_id)
+        # Its lifetime for server-side encryption starts now
+        await asyncio.to_thread(data_key_budget.register, wrapped)
+        
+        await blockchain.add_block_async(
+            event_type="DATA_KEY_GENERATED",
+            key_id=request.key_id,
+            user_id=user_id,
+            data_reference=f"data-key-{hashlib.sha256(wrapped).hexdigest()}"
+        )
+        
+        response = {
+            "wrapped_data_key": base64.b64encode(wrapped).decode('utf-8'),
+            "key_id": request.key_id,
+            "key_version": key_version
+        }
+        if request.return_plaintext:
+            response["data_key"] = base64.b64encode(data_key).decode('utf-8')
+        return response
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/decrypt-data-key", dependencies=[Depends(allow_decrypt)])
+async def decrypt_data_key(request: DecryptDataKeyRequest, user_id: str = Depends(get_current_user_id)):
+    try:
+        _, sk = await key_manager.get_key_version_async(request.key_id, request.key_version)
+        wrapped = base64.b64decode(request.wrapped_data_key)
+        data_key = await encryption_engine.decrypt_data_key_async(wrapped, sk, request.user_key, key_id=request.key_id)
+        
+        await blockchain.add_block_async(
+            event_type="DATA_KEY_DECRYPTION",
+            key_id=request.key_id,
+            user_id=user_id,
+            data_reference=f"data-key-{hashlib.sha256(wrapped).hexdigest()}"
+        )
+        
+        return {"data_key": base64.b64encode(data_key).decode('utf-8')}
+    except Exception as e:
+        await blockchain.add_block_async(
+            event_type="DECRYPTION_FAILED",
+            key_id=request.key_id,
+            user_id=user_id,
+            data_reference="N/A"
+        )
+        raise HTTPException(status_code=400, detail=f"Decryption failed. Invalid keys or data. {str(e)}")
+
+@router.post("/data-key/encrypt", dependencies=[Depends(allow_encrypt)])
+async def encrypt_with_data_key(request: DataKeyRecordsRequest, user_id: str = Depends(get_current_user_id)):
+    """
+    Server-side variant for clients that should never see the data key:
+    the wrapped key is unwrapped once and cached (TTL + usage limit), after which
+    each record costs one AES-GCM operation. One ledger block is written per call.
+    """
+    if len(request.records) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} records)")
+    try:
+        wrapped = base64.b64decode(request.wrapped_data_key)
+        data_key = await _session_data_key(wrapped, request, uses=len(request.records))
+        records = [
+            base64.b64encode(encrypt_record(data_key, record.encode('utf-8'))).decode('utf-8')
+            for record in request.records
+        ]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    await blockchain.add_block_async(
+        event_type="DATA_KEY_ENCRYPTION",
+        key_id=request.key_id,
+        user_id=user_id,
+        data_reference=f"batch-{len(records)}-data-key-{hashlib.sha256(wrapped).hexdigest()}"
+    )
+    return {"records": records}
+
+@router.post("/data-key/decrypt", dependencies=[Depends(allow_decrypt)])
+async def decrypt_with_data_key(request: DataKeyRecordsRequest, user_id: str = Depends(get_current_user_id)):
+    if len(request.records) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=413, detail=f"Batch too large (max {MAX_BATCH_SIZE} records)")
+    try:
+        wrapped = base64.b64decode(request.wrapped_data_key)
+        data_key = await _session_data_key(wrapped, request)
+        records = [
+            decrypt_record(data_key, base64.b64decode(record)).decode('utf-8')
+            for record in request.records
+        ]
+    except Exception as e:
+        await blockchain.add_block_async(
+            event_type="DECRYPTION_FAILED",
+            key_id=request.key_id,
+            user_id=user_id,
+            data_reference="N/A"
+        )
+        raise HTTPException(status_code=400, detail=f"Decryption failed. Invalid keys or data. {str(e)}")
+    
+    await blockchain.add_block_async(
+        event_type="DATA_KEY_DECRYPTION",
+        key_id=request.key_id,
+        user_id=user_id,
+        data_reference=f"batch-{len(records)}-data-key-{hashlib.sha256(wrapped).hexdigest()}"
+    )
+    return {"records": records}
+
+async def _session_data_key(wrapped: bytes, request: DataKeyRecordsRequest, uses: int = 0) -> bytes:
+    """
+    Returns the unwrapped data key from the session cache, unwrapping (one Kyber decapsulation) on a miss.
+    uses: records about to be encrypted, charged against the wrapped key's durable budget once the
+    caller has proven the user key (keys that are expired or used up are not unwrapped again).
+    """
+    if uses:
+        await asyncio.to_thread(data_key_budget.check, wrapped)
+    session_id = DataKeyCache.session_id(wrapped, request.user_key)
+    data_key = data_key_cache.get(session_id)
+    if data_key is None:
+        _, sk = await key_manager.get_key_version_async(request.key_id, request.key_version)
+        data_key = await encryption_engine.decrypt_data_key_async(wrapped, sk, request.user_key, key_id=request.key_id)
+        data_key_cache.put(session_id, data_key)
+        data_key = bytes(data_key)
+    if uses:
+        await asyncio.to_thread(data_key_budget.charge, wrapped, uses)
+    return data_key
+
+async def _resolve_batch_keys(records) -> dict:
+    """
+    Looks up each distinct key_id once, in bulk and in a thread (DB reads and key creation stay
+    off the event loop). A key_id that cannot be resolved maps to its exception, so its records
+    fail individually with the cause.
+    """
+    return await asyncio.to_thread(key_manager.get_current_keys, [record.key_id for record in records])
+
+def _resolve_key_versions(versions) -> dict:
+    # Older (key_id, key_version) pairs of a decrypt batch, each loaded once: private key or exception
+    keys = {}
+    for key_id, version in versions:
+        try:
+            keys[(key_id, version)] = key_manager.get_key_version(key_id, version)[1]
+        except Exception as e:
+            keys[(key_id, version)] = e
+    return keys
+
+def _batch_key(keys: dict, key_id):
+    key = keys[key_id]
+    if isinstance(key, Exception):
+        raise ValueError(f"System key {key_id} unavailable. {str(key)}")
+    return key
+
+async def _log_batch(event_type: str, results: List[dict], failures: List[str], user_id: str):
+    """
+    Records a batch in the ledger with a single grouped append:
+    one summary block per key_id and one DECRYPTION_FAILED block per failed decryption.
+    A summary holds the record count and the SHA-256 over the records' ciphertext digests in
+    request order (the ciphertext_sha256 each record is returned with, as /encrypt records it),
+    so encrypting and decrypting the same records gives the same reference.
+    """
+    counts, digests = {}, {}
+    for result in results:
+        if "error" not in result:
+            counts[result["key_id"]] = counts.get(result["key_id"], 0) + 1
+            digests.setdefault(result["key_id"], hashlib.sha256()).update(bytes.fromhex(result["ciphertext_sha256"]))
+    
+    events = [{
+        "event_type": event_type,
+        "key_id": key_id,
+        "user_id": user_id,
+        "data_reference": f"batch-{count}-{digests[key_id].hexdigest()}"
+    } for key_id, count in counts.items()]
+    events.extend({
+        "event_type": "DECRYPTION_FAILED",
+        "key_id": key_id,
+        "user_id": user_id,
+        "data_reference": "N/A"
+    } for key_id in failures)
+    await blockchain.add_blocks_async(events)
+
 @router.post("/encrypt-file", dependencies=[Depends(allow_encrypt)])
 async def encrypt_file(
     file: UploadFile = File(...),
     user_key: str = Form(...),
     key_id: str = Form(...),
+    stream: bool = Form(False),
+    chunk_size: int = Form(DEFAULT_CHUNK_SIZE),
     user_id: str = Depends(get_current_user_id)
 ):
-    # 1. Retrieve System Key
-    pk, _ = key_manager.get_or_create_system_keypair(key_id)
+    # 1. Retrieve System Key (current version)
+    key_version, pk, _ = await key_manager.get_current_key_async(key_id)
+    
+    if stream:
+        return await _encrypt_file_stream(file, pk, key_version, user_key, key_id, chunk_size, user_id)
     
     # 2. Read File
     file_bytes = await file.read()
     
     # 3. Encrypt
     try:
-        result = encryption_engine.encrypt_file(
+        result = await encryption_engine.encrypt_file_async(
             file_bytes, 
             pk, 
-            user_key
+            user_key,
+            key_id=key_id
         )
         
         # 4. Log to Blockchain
-        blockchain.add_block(
+        await blockchain.add_block_async(
             event_type="FILE_ENCRYPTION",
             key_id=key_id,
             user_id=user_id,
-            data_reference=f"file-hash-{hash(file.filename)}"
+            data_reference=reference(result["ciphertext_sha256"])
         )
         
         # Return as JSON with base64 encoded file (for simplicity in this MVP)
-        # In a real app, we might stream this back.
+        # Large files should use stream=true, which returns the segmented container directly.
         return {
             "encrypted_file": base64.b64encode(result["encrypted_file"]).decode('utf-8'),
             "kyber_ciphertext": result["kyber_ciphertext"],
-            "filename": f"{file.filename}.enc"
+            "key_version": key_version,
+            "filename": f"{file.filename}.enc",
+            "plaintext_sha256": result["plaintext_sha256"],
+            "ciphertext_sha256": result["ciphertext_sha256"]
         }
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _encrypt_file_stream(file: UploadFile, pk: bytes, key_version: int, user_key: str, key_id: str, chunk_size: int, user_id: str):
+    """
+    Streams the upload through the segmented AES-GCM encryptor.
+    Memory use is bounded by the chunk size; the Kyber ciphertext travels in the container header.
+    The container's SHA-256 is only known at the end, so it goes in the ledger (not a header).
+    """
+    try:
+        encryptor = await encryption_engine.open_stream_encryptor_async(pk, user_key, chunk_size, key_id=key_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # Read a window of segments at a time; they are sealed in parallel off the event loop
+    window = encryption_engine.segments.window(chunk_size)
+
+    async def generate():
+        while True:
+            chunk = await file.read(window)
+            if not chunk:
+                break
+            out = await asyncio.to_thread(encryptor.update, chunk)
+            if out:
+                yield out
+        yield encryptor.finalize()
+        
+        # Log to Blockchain once the whole file went through
+        await blockchain.add_block_async(
+            event_type="FILE_ENCRYPTION",
+            key_id=key_id,
+            user_id=user_id,
+            data_reference=encryptor.digests.reference
+        )
+
+    return StreamingResponse(
+        generate(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename={file.filename}.enc", "X-Key-Version": str(key_version)}
+    )
+
 @router.post("/decrypt-file", dependencies=[Depends(allow_decrypt)])
 async def decrypt_file(
     file: UploadFile = File(...),
-    kyber_ciphertext: str = Form(...),
+    kyber_ciphertext: str = Form(None),
     user_key: str = Form(...),
     key_id: str = Form(...),
+    key_version: int = Form(1),
+    range_header: str = Header(None, alias="Range"),
     user_id: str = Depends(get_current_user_id)
 ):
-    # 1. Retrieve System Key
-    _, sk = key_manager.get_or_create_system_keypair(key_id)
+    # 1. Retrieve System Key (version the file was encrypted for)
+    try:
+        _, sk = await key_manager.get_key_version_async(key_id, key_version)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    # Segmented containers carry their Kyber ciphertext in the header and can be sought.
+    # Legacy CBC blobs cannot, so a Range header is ignored for them (full 200 response).
+    if kyber_ciphertext is None:
+        byte_range = _parse_range(range_header)
+        if byte_range is not None:
+            return await _decrypt_file_range(file, byte_range, sk, user_key, key_id, user_id)
+        return await _decrypt_file_stream(file, sk, user_key, key_id, user_id)
     
     # 2. Read File
     encrypted_bytes = await file.read()
     
     # 3. Decrypt
     try:
-        decrypted_bytes = encryption_engine.decrypt_file(
+        digests = PayloadDigests()
+        decrypted_bytes = await encryption_engine.decrypt_file_async(
             encrypted_bytes,
             kyber_ciphertext,
             sk, 
-            user_key
+            user_key,
+            key_id=key_id,
+            digests=digests
         )
         
         # 4. Log to Blockchain
-        blockchain.add_block(
+        await blockchain.add_block_async(
             event_type="FILE_DECRYPTION",
             key_id=key_id,
             user_id=user_id,
-            data_reference=f"file-hash-{hash(file.filename)}"
+            data_reference=digests.reference
         )
         
         # Return as downloadable file
@@ -164,13 +737,216 @@ async def decrypt_file(
         return Response(
             content=decrypted_bytes,
             media_type="application/octet-stream",
-            headers={"Content-Disposition": f"attachment; filename={original_filename}"}
+            headers={"Content-Disposition": f"attachment; filename={original_filename}", **digests.headers()}
         )
     except Exception as e:
-        blockchain.add_block(
+        await blockchain.add_block_async(
             event_type="FILE_DECRYPTION_FAILED",
             key_id=key_id,
             user_id=user_id,
             data_reference="N/A"
         )
         raise HTTPException(status_code=400, detail=f"Decryption failed. {str(e)}")
+
+async def _decrypt_file_stream(file: UploadFile, sk: bytes, user_key: str, key_id: str, user_id: str):
+    """
+    Streams a segmented container back as plaintext.
+    The first segment is decrypted before the response starts, so a wrong key or a corrupt
+    header still produces a clean 400. A segment failing later aborts the stream.
+    """
+    async def log_failure():
+        await blockchain.add_block_async(
+            event_type="FILE_DECRYPTION_FAILED",
+            key_id=key_id,
+            user_id=user_id,
+            data_reference="N/A"
+        )
+
+    try:
+        # 1. Parse Header
+        prefix = await file.read(HEADER_PREFIX_SIZE)
+        kem_len = SegmentHeader.kem_length(prefix)
+        header = SegmentHeader.parse(prefix + await file.read(kem_len))
+        
+        # 2. Decrypt until the first plaintext is available (or the stream ends)
+        decryptor = await encryption_engine.open_stream_decryptor_async(header, sk, user_key, key_id=key_id)
+        first = b""
+        done = False
+        while not first and not done:
+            chunk = await file.read(header.segment_size)
+            if chunk:
+                first = decryptor.update(chunk)
+            else:
+                first = decryptor.finalize()
+                done = True
+    except Exception as e:
+        await log_failure()
+        raise HTTPException(status_code=400, detail=f"Decryption failed. {str(e)}")
+
+    async def generate():
+        try:
+            if first:
+                yield first
+            finished = done
+            window = encryption_engine.segments.window(header.segment_size)
+            while not finished:
+                chunk = await file.read(window)
+                if chunk:
+                    out = await asyncio.to_thread(decryptor.update, chunk)
+                else:
+                    out = decryptor.finalize()
+                    finished = True
+                if out:
+                    yield out
+        except Exception:
+            await log_failure()
+            raise
+        
+        # Log to Blockchain once the final segment authenticated (container SHA-256, as on encryption)
+        await blockchain.add_block_async(
+            event_type="FILE_DECRYPTION",
+            key_id=key_id,
+            user_id=user_id,
+            data_reference=decryptor.digests.reference
+        )
+
+    original_filename = file.filename.replace(".enc", "")
+    return StreamingResponse(
+        generate(),
+        media_type="application/octet-stream",
+        headers={"Content-Disposition": f"attachment; filename={original_filename}", "Accept-Ranges": "bytes"}
+    )
+
+def _parse_range(value: str):
+    """
+    Parses a single-range `bytes=` header into (start, end) with either side possibly None
+    ("bytes=100-" / "bytes=-100"). Anything else (multiple ranges, other units, garbage)
+    returns None and the whole file is served, as RFC 9110 allows.
+    """
+    if not value:
+        return None
+    unit, _, spec = value.partition("=")
+    if unit.strip().lower() != "bytes" or "," in spec:
+        return None
+    first, sep, last = spec.strip().partition("-")
+    if not sep or (not first and not last):
+        return None
+    try:
+        start = int(first) if first else None
+        end = int(last) if last else None
+    except ValueError:
+        return None
+    if (start is not None and start < 0) or (end is not None and end < 0):
+        return None
+    if start is not None and end is not None and end < start:
+        return None
+    return start, end
+
+def _resolve_range(byte_range, size: int):
+    """
+    Returns the inclusive (start, end) of byte_range within a plaintext of `size` bytes,
+    or None if it is unsatisfiable.
+    """
+    start, end = byte_range
+    if start is None:
+        # Suffix range: the last `end` bytes
+        if end == 0 or size == 0:
+            return None
+        return max(0, size - end), size - 1
+    if start >= size:
+        return None
+    return start, size - 1 if end is None else min(end, size - 1)
+
+async def _decrypt_file_range(file: UploadFile, byte_range, sk: bytes, user_key: str, key_id: str, user_id: str):
+    """
+    Serves a byte range of a segmented container as 206 Partial Content.
+    Only the segments overlapping the range are read and decrypted, plus the final segment,
+    which authenticates the total length reported in Content-Range.
+    """
+    async def log_failure():
+        await blockchain.add_block_async(
+            event_type="FILE_DECRYPTION_FAILED",
+            key_id=key_id,
+            user_id=user_id,
+            data_reference="N/A"
+        )
+
+    async def read_at(offset: int, length: int) -> bytes:
+        await file.seek(offset)
+        return await file.read(length)
+
+    try:
+        # 1. Parse Header
+        container_size = file.size if file.size is not None else await asyncio.to_thread(file.file.seek, 0, 2)
+        prefix = await read_at(0, HEADER_PREFIX_SIZE)
+        kem_len = SegmentHeader.kem_length(prefix)
+        header = SegmentHeader.parse(prefix + await file.read(kem_len))
+        
+        # 2. Kyber Decapsulation + segment locator
+        reader = await encryption_engine.open_range_reader_async(header, container_size, sk, user_key, key_id=key_id)
+        
+        # 3. Authenticate the final segment, so the total size is trustworthy
+        final_index, offset, length = reader.final_span()
+        await asyncio.to_thread(reader.open, final_index, await read_at(offset, length))
+    except Exception as e:
+        await log_failure()
+        raise HTTPException(status_code=400, detail=f"Decryption failed. {str(e)}")
+
+    resolved = _resolve_range(byte_range, reader.plaintext_size)
+    if resolved is None:
+        raise HTTPException(
+            status_code=416,
+            detail="Requested range not satisfiable",
+            headers={"Content-Range": f"bytes */{reader.plaintext_size}"}
+        )
+    start, end = resolved
+
+    # Decrypt a window of segments at a time; the first one before responding for a clean 400
+    chunk_size = header.chunk_size
+    window = encryption_engine.segments.window(header.segment_size) // header.segment_size * chunk_size
+
+    async def decrypt_piece(piece_start: int) -> bytes:
+        piece_end = min(end, (piece_start // chunk_size) * chunk_size + window - 1)
+        first, offset, length = reader.locate(piece_start, piece_end)
+        data = await read_at(offset, length)
+        return await asyncio.to_thread(reader.open, first, data, piece_start, piece_end)
+
+    try:
+        first_piece = await decrypt_piece(start)
+    except Exception as e:
+        await log_failure()
+        raise HTTPException(status_code=400, detail=f"Decryption failed. {str(e)}")
+
+    async def generate():
+        position = start + len(first_piece)
+        yield first_piece
+        try:
+            while position <= end:
+                piece = await decrypt_piece(position)
+                position += len(piece)
+                yield piece
+        except Exception:
+            await log_failure()
+            raise
+        
+        # 4. Log to Blockchain. Only part of the container is read, so it is identified by
+        # the SHA-256 of its header (unique per container: random salt, nonces and Kyber ciphertext)
+        await blockchain.add_block_async(
+            event_type="FILE_DECRYPTION",
+            key_id=key_id,
+            user_id=user_id,
+            data_reference=f"header-sha256-{hashlib.sha256(header.to_bytes()).hexdigest()}:bytes={start}-{end}"
+        )
+
+    original_filename = file.filename.replace(".enc", "")
+    return StreamingResponse(
+        generate(),
+        status_code=206,
+        media_type="application/octet-stream",
+        headers={
+            "Content-Disposition": f"attachment; filename={original_filename}",
+            "Accept-Ranges": "bytes",
+            "Content-Range": f"bytes {start}-{end}/{reader.plaintext_size}",
+            "Content-Length": str(end - start + 1)
+        }
+    )
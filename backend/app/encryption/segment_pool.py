@@ -0,0 +1,47 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from decouple import config
+
+# Threads used to seal/open segments of large files in parallel.
+# AES-GCM in `cryptography` releases the GIL, so this scales with cores. 1 disables it.
+SEGMENT_WORKERS = config("SEGMENT_WORKERS", default=os.cpu_count() or 1, cast=int)
+# Most bytes one request buffers for a window of segments (at least one segment, whatever its size)
+SEGMENT_WINDOW_BYTES = config("SEGMENT_WINDOW_BYTES", default=16 * 1024 * 1024, cast=int)
+
+
+class SegmentPool:
+    """
+    Lazily created thread pool shared by every segmented encryption/decryption.
+    """
+
+    def __init__(self, workers: int = SEGMENT_WORKERS, window_bytes: int = SEGMENT_WINDOW_BYTES):
+        self.workers = workers
+        self.window_bytes = window_bytes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    @property
+    def executor(self):
+        if self.workers <= 1:
+            return None
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="segment-aead")
+            return self._executor
+
+    def window(self, segment_size: int) -> int:
+        """
+        Bytes to hand to one update() call: a segment per worker, but no more segments than fit
+        in window_bytes (segment_size comes from the client, so it cannot scale the buffer).
+        """
+        return segment_size * max(1, min(self.workers, self.window_bytes // segment_size))
+
+    def shutdown(self, wait: bool = True):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
+
+
+segment_pool = SegmentPool()
@@ -0,0 +1,299 @@
+import hashlib
+import os
+import struct
+from concurrent.futures import Executor
+from cryptography.hazmat.primitives import hashes
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.hkdf import HKDF
+from cryptography.exceptions import InvalidTag
+from .digests import PayloadDigests
+
+# Segmented container format (version 1)
+#
+#   header  = MAGIC | version (u8) | chunk_size (u32) | salt (16) | nonce_prefix (7)
+#             | kem_len (u16) | kyber_ciphertext
+#   segment = AES-GCM(chunk) | tag (16)
+#
+# Every segment holds `chunk_size` bytes of plaintext except the last one, which may be
+# shorter (or empty). Each segment gets its own nonce: nonce_prefix | index (u32) | final (u8),
+# so segments cannot be reordered, dropped or truncated without failing authentication.
+# The header is bound to every segment as associated data.
+#
+# The container digest (PayloadDigests.ciphertext, the ledger reference) is
+# SHA-256(header | SHA-256(segment 0) | SHA-256(segment 1) | ...): each segment is hashed by the
+# worker that seals or opens it, so only 32 bytes per segment are hashed in order.
+MAGIC = b"DKSF"
+VERSION = 1
+SALT_SIZE = 16
+NONCE_PREFIX_SIZE = 7
+TAG_SIZE = 16
+HEADER_PREFIX = struct.Struct(">4sBI16s7sH")
+HEADER_PREFIX_SIZE = HEADER_PREFIX.size
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+MAX_CHUNK_SIZE = 16 * 1024 * 1024
+MAX_SEGMENTS = 2 ** 32
+
+
+class SegmentHeader:
+    def __init__(self, chunk_size: int, kyber_ciphertext: bytes, salt: bytes = None, nonce_prefix: bytes = None):
+        if not 0 < chunk_size <= MAX_CHUNK_SIZE:
+            raise ValueError(f"Invalid chunk size: {chunk_size}")
+        self.chunk_size = chunk_size
+        self.kyber_ciphertext = kyber_ciphertext
+        self.salt = salt if salt is not None else os.urandom(SALT_SIZE)
+        self.nonce_prefix = nonce_prefix if nonce_prefix is not None else os.urandom(NONCE_PREFIX_SIZE)
+
+    @property
+    def size(self) -> int:
+        return HEADER_PREFIX_SIZE + len(self.kyber_ciphertext)
+
+    @property
+    def segment_size(self) -> int:
+        """Size of one full encrypted segment on the wire."""
+        return self.chunk_size + TAG_SIZE
+
+    def to_bytes(self) -> bytes:
+        return HEADER_PREFIX.pack(
+            MAGIC, VERSION, self.chunk_size, self.salt, self.nonce_prefix, len(self.kyber_ciphertext)
+        ) + self.kyber_ciphertext
+
+    @staticmethod
+    def kem_length(prefix: bytes) -> int:
+        """
+        Returns the length of the Kyber ciphertext that follows the fixed-size header prefix.
+        """
+        if len(prefix) < HEADER_PREFIX_SIZE:
+            raise ValueError("Truncated segmented container header")
+        magic, version, _, _, _, kem_len = HEADER_PREFIX.unpack(prefix[:HEADER_PREFIX_SIZE])
+        if magic != MAGIC:
+            raise ValueError("Not a segmented container (bad magic)")
+        if version != VERSION:
+            raise ValueError(f"Unsupported segmented container version: {version}")
+        return kem_len
+
+    @classmethod
+    def parse(cls, data: bytes) -> "SegmentHeader":
+        kem_len = cls.kem_length(data)
+        if len(data) < HEADER_PREFIX_SIZE + kem_len:
+            raise ValueError("Truncated segmented container header")
+        _, _, chunk_size, salt, nonce_prefix, _ = HEADER_PREFIX.unpack(data[:HEADER_PREFIX_SIZE])
+        kyber_ciphertext = bytes(data[HEADER_PREFIX_SIZE:HEADER_PREFIX_SIZE + kem_len])
+        return cls(chunk_size, kyber_ciphertext, salt, nonce_prefix)
+
+
+class _SegmentCipher:
+    def __init__(self, master_key: bytes, header: SegmentHeader):
+        self.header = header
+        self._aad = header.to_bytes()
+        # Per-file segment key, so the master key itself never touches GCM directly
+        segment_key = HKDF(
+            algorithm=hashes.SHA256(),
+            length=32,
+            salt=header.salt,
+            info=b"dualkey-segmented-v1",
+        ).derive(master_key)
+        self._aead = AESGCM(segment_key)
+
+    def _nonce(self, index: int, final: bool) -> bytes:
+        if index >= MAX_SEGMENTS:
+            raise ValueError("Segmented container exceeds the maximum number of segments")
+        return self.header.nonce_prefix + struct.pack(">IB", index, 1 if final else 0)
+
+    def seal(self, index: int, chunk: bytes, final: bool) -> bytes:
+        return self._aead.encrypt(self._nonce(index, final), chunk, self._aad)
+
+    def open(self, index: int, segment: bytes, final: bool) -> bytes:
+        try:
+            return self._aead.decrypt(self._nonce(index, final), segment, self._aad)
+        except InvalidTag:
+            raise ValueError(f"Segment {index} failed authentication")
+
+    def seal_hashed(self, index: int, chunk: bytes, final: bool):
+        segment = self.seal(index, chunk, final)
+        return segment, hashlib.sha256(segment).digest()
+
+    def open_hashed(self, index: int, segment: bytes, final: bool):
+        return self.open(index, segment, final), hashlib.sha256(segment).digest()
+
+
+class SegmentedEncryptor:
+    """
+    Incremental encryptor for the segmented container.
+    Feed plaintext with update() and emit whatever it returns; call finalize() once at the end.
+    Only the segments completed by one update() call are buffered at any time.
+
+    With an executor, the segments of each update() call are sealed in parallel;
+    the output is identical to the serial one (nonces depend only on the segment index).
+    digests: container digest (see the format notes above); the plaintext SHA-256 only if the
+    caller passes PayloadDigests() (it is a sequential pass on the calling thread).
+    """
+
+    def __init__(self, master_key: bytes, kyber_ciphertext: bytes, chunk_size: int = DEFAULT_CHUNK_SIZE,
+                 executor: Executor = None, digests: PayloadDigests = None):
+        self.header = SegmentHeader(chunk_size, kyber_ciphertext)
+        self._cipher = _SegmentCipher(master_key, self.header)
+        self._executor = executor
+        self.digests = digests or PayloadDigests(plaintext=False)
+        self.digests.update(ciphertext=self.header.to_bytes())
+        self._buffer = bytearray()
+        self._index = 0
+        self._header_sent = False
+        self._finalized = False
+
+    def _take_header(self) -> bytes:
+        if self._header_sent:
+            return b""
+        self._header_sent = True
+        return self.header.to_bytes()
+
+    def update(self, data: bytes) -> bytes:
+        if self._finalized:
+            raise ValueError("Encryptor already finalized")
+        # Keep the last full chunk back: we only know it is final once the input ends
+        jobs, self._buffer = _split_segments(self._buffer, data, self.header.chunk_size, self._index)
+        self._index += len(jobs)
+        self.digests.update(data)
+        sealed = _map_segments(self._executor, self._cipher.seal_hashed, jobs)
+        return self._take_header() + _join_hashed(sealed, self.digests)
+
+    def finalize(self) -> bytes:
+        if self._finalized:
+            raise ValueError("Encryptor already finalized")
+        self._finalized = True
+        out = self._take_header() + _join_hashed([self._cipher.seal_hashed(self._index, self._buffer, True)], self.digests)
+        self._buffer = bytearray()
+        return out
+
+
+class SegmentedDecryptor:
+    """
+    Incremental decryptor for the segmented container body (everything after the header).
+    Output of update() is authenticated, but the stream is only known to be complete
+    once finalize() has verified the final segment.
+    digests: as for SegmentedEncryptor, so both sides produce the same container digest.
+    """
+
+    def __init__(self, master_key: bytes, header: SegmentHeader, executor: Executor = None,
+                 digests: PayloadDigests = None):
+        self.header = header
+        self._cipher = _SegmentCipher(master_key, header)
+        self._executor = executor
+        self.digests = digests or PayloadDigests(plaintext=False)
+        self.digests.update(ciphertext=header.to_bytes())
+        self._buffer = bytearray()
+        self._index = 0
+        self._finalized = False
+
+    def update(self, data: bytes) -> bytes:
+        if self._finalized:
+            raise ValueError("Decryptor already finalized")
+        jobs, self._buffer = _split_segments(self._buffer, data, self.header.segment_size, self._index)
+        self._index += len(jobs)
+        opened = _map_segments(self._executor, self._cipher.open_hashed, jobs)
+        out = _join_hashed(opened, self.digests)
+        self.digests.update(out)
+        return out
+
+    def finalize(self) -> bytes:
+        if self._finalized:
+            raise ValueError("Decryptor already finalized")
+        self._finalized = True
+        if len(self._buffer) < TAG_SIZE:
+            raise ValueError("Truncated segmented container")
+        out = _join_hashed([self._cipher.open_hashed(self._index, self._buffer, True)], self.digests)
+        self._buffer = bytearray()
+        self.digests.update(out)
+        return out
+
+
+class SegmentedRangeReader:
+    """
+    Random-access decryption of a segmented container of known total size.
+    Segment i starts at header.size + i * segment_size, so a plaintext byte range maps to a
+    contiguous run of segments: only those are read and authenticated.
+
+    Callers do the I/O: locate() says which ciphertext bytes to read, open() decrypts them.
+    The final segment is what proves the container was not truncated, so final_span()
+    gives its location for callers that report the total plaintext size.
+    """
+
+    def __init__(self, master_key: bytes, header: SegmentHeader, container_size: int, executor: Executor = None):
+        body_size = container_size - header.size
+        if body_size < TAG_SIZE:
+            raise ValueError("Truncated segmented container")
+        self.header = header
+        self.container_size = container_size
+        self._cipher = _SegmentCipher(master_key, header)
+        self._executor = executor
+        self.segment_count = -(-body_size // header.segment_size)
+        if body_size - (self.segment_count - 1) * header.segment_size < TAG_SIZE:
+            raise ValueError("Truncated segmented container")
+        self.plaintext_size = body_size - self.segment_count * TAG_SIZE
+
+    def _offset(self, index: int) -> int:
+        return self.header.size + index * self.header.segment_size
+
+    def locate(self, start: int, end: int):
+        """
+        Maps the inclusive plaintext range [start, end] to the segments holding it.
+        Returns: (first_index, ciphertext_offset, ciphertext_length)
+        """
+        if not 0 <= start <= end < self.plaintext_size:
+            raise ValueError(f"Range {start}-{end} outside plaintext of {self.plaintext_size} bytes")
+        first = start // self.header.chunk_size
+        last = end // self.header.chunk_size
+        offset = self._offset(first)
+        return first, offset, min(self._offset(last + 1), self.container_size) - offset
+
+    def final_span(self):
+        """
+        Returns: (final_index, ciphertext_offset, ciphertext_length) of the final segment.
+        """
+        final = self.segment_count - 1
+        offset = self._offset(final)
+        return final, offset, self.container_size - offset
+
+    def open(self, first_index: int, data: bytes, start: int = None, end: int = None) -> bytes:
+        """
+        Decrypts consecutive segments starting at first_index and, given the inclusive
+        plaintext range, trims the result to it.
+        """
+        size = self.header.segment_size
+        view = memoryview(data)
+        final = self.segment_count - 1
+        jobs = []
+        for i in range(0, len(data), size):
+            index = first_index + i // size
+            jobs.append((index, view[i:i + size], index == final))
+        plaintext = b"".join(_map_segments(self._executor, self._cipher.open, jobs))
+        if start is None:
+            return plaintext
+        base = first_index * self.header.chunk_size
+        return plaintext[start - base:end - base + 1]
+
+
+def _split_segments(buffer: bytearray, data: bytes, size: int, first_index: int):
+    """
+    Cuts buffer + data into segments that are certainly not final (as zero-copy views)
+    and the remainder, which keeps the last segment back since it may be the final one.
+    """
+    joined = buffer + data if buffer else data
+    count = (len(joined) - 1) // size if joined else 0
+    view = memoryview(joined)
+    jobs = [(first_index + i, view[i * size:(i + 1) * size], False) for i in range(count)]
+    return jobs, bytearray(view[count * size:])
+
+
+def _map_segments(executor: Executor, fn, jobs: list) -> list:
+    # executor.map keeps results in submission order, whatever order the workers finish in
+    if executor is None or len(jobs) < 2:
+        return [fn(*job) for job in jobs]
+    return list(executor.map(lambda job: fn(*job), jobs))
+
+
+def _join_hashed(results: list, digests: PayloadDigests) -> bytes:
+    # (output, segment hash) pairs in segment order: the hashes extend the container digest
+    for _, segment_hash in results:
+        digests.update(ciphertext=segment_hash)
+    return b"".join(out for out, _ in results)
@@ -0,0 +1,153 @@
+import logging
+import threading
+import time
+from collections import deque
+from decouple import config
+from app.encryption.kem_pool import KemPool, kem_pool
+from app.encryption.kyber_utils import generate_kyber_keypair
+
+logger = logging.getLogger(__name__)
+
+# Off by default: the reservoir keeps unassigned private keys in memory and a producer thread busy
+KEYPAIR_POOL_ENABLED = config("KEYPAIR_POOL_ENABLED", default=False, cast=bool)
+# Refill once the reservoir drops below the low watermark, up to the high watermark
+KEYPAIR_POOL_LOW_WATERMARK = config("KEYPAIR_POOL_LOW_WATERMARK", default=8, cast=int)
+KEYPAIR_POOL_HIGH_WATERMARK = config("KEYPAIR_POOL_HIGH_WATERMARK", default=32, cast=int)
+
+
+class KeypairReservoir:
+    """
+    Bounded supply of pre-generated Kyber1024 keypairs, refilled in the background on the
+    KEM worker processes, so creating a new key_id only has to claim and persist one.
+
+    - Each keypair is handed out exactly once: take() pops it under the lock.
+    - generate(n) fans n keygens out across the KEM workers (draining the reservoir first),
+      for bulk provisioning.
+    """
+
+    def __init__(self, kem: KemPool = kem_pool,
+                 low_watermark: int = KEYPAIR_POOL_LOW_WATERMARK,
+                 high_watermark: int = KEYPAIR_POOL_HIGH_WATERMARK):
+        if not 0 <= low_watermark <= high_watermark:
+            raise ValueError("Keypair pool watermarks must satisfy 0 <= low <= high")
+        self.kem = kem
+        self.low_watermark = low_watermark
+        self.high_watermark = high_watermark
+        self._lock = threading.Lock()
+        self._pairs = deque()
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.produced = 0
+        self.last_refill_count = 0
+        self.last_refill_seconds = 0.0
+        self.refill_failures = 0
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self._thread is not None:
+            return
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="keypair-pool", daemon=True)
+        self._thread.start()
+        self._wakeup.set()
+
+    def stop(self):
+        thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._stopping.set()
+        self._wakeup.set()
+        thread.join()
+        with self._lock:
+            self._pairs.clear()
+
+    def take(self):
+        """
+        Pops a pre-generated (public_key, private_key), or returns None (caller generates inline).
+        """
+        if self._thread is None:
+            return None
+        with self._lock:
+            pair = self._pairs.popleft() if self._pairs else None
+            if pair is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            needs_refill = len(self._pairs) < self.low_watermark
+        if needs_refill:
+            self._wakeup.set()
+        return pair
+
+    def generate(self, count: int) -> list:
+        """
+        Returns `count` fresh keypairs: reservoir stock first, the rest generated in parallel.
+        """
+        pairs = []
+        with self._lock:
+            while self._pairs and len(pairs) < count:
+                pairs.append(self._pairs.popleft())
+            self.hits += len(pairs)
+        futures = [self.kem.submit(generate_kyber_keypair) for _ in range(count - len(pairs))]
+        pairs.extend(future.result() for future in futures)
+        if self._thread is not None:
+            self._wakeup.set()
+        return pairs
+
+    def stats(self) -> dict:
+        with self._lock:
+            depth = len(self._pairs)
+        return {
+            "enabled": self.running,
+            "depth": depth,
+            "hits": self.hits,
+            "misses": self.misses,
+            "produced": self.produced,
+            "refill_failures": self.refill_failures,
+            "low_watermark": self.low_watermark,
+            "high_watermark": self.high_watermark,
+            "refill_rate_per_sec": (self.last_refill_count / self.last_refill_seconds
+                                    if self.last_refill_seconds else 0.0)
+        }
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wakeup.wait(timeout=1.0)
+            self._wakeup.clear()
+            if self._stopping.is_set():
+                break
+            with self._lock:
+                missing = self.high_watermark - len(self._pairs) if len(self._pairs) < self.low_watermark else 0
+            if missing <= 0:
+                continue
+            try:
+                self._refill(missing)
+            except Exception:
+                self.refill_failures += 1
+                logger.exception("Keypair pool refill failed")
+
+    def _refill(self, missing: int):
+        started = time.monotonic()
+        # Fan the keygens out across the KEM workers
+        futures = [self.kem.submit(generate_kyber_keypair) for _ in range(missing)]
+        added = 0
+        for future in futures:
+            pair = future.result()
+            if self._stopping.is_set():
+                continue
+            with self._lock:
+                self._pairs.append(pair)
+                self.produced += 1
+            added += 1
+        self.last_refill_count = added
+        self.last_refill_seconds = time.monotonic() - started
+
+
+# Shared by the whole app; started by the FastAPI lifespan when KEYPAIR_POOL_ENABLED is set
+keypair_reservoir = KeypairReservoir()
@@ -1,35 +1,374 @@
-from app.encryption.kyber_utils import generate_kyber_keypair
-from app.models import SystemKey
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from decouple import config
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+from typing import List
+from app.encryption.decaps_cache import decaps_cache
+from app.encryption.encaps_pool import encaps_pool
+from app.key_management.keypair_pool import KeypairReservoir, keypair_reservoir
+from app.models import SystemKey, SystemKeyVersion
 from app.database import SessionLocal
 
-class KeyManager:
+# Number of system keypairs kept in memory (least recently used beyond this are dropped)
+KEY_CACHE_SIZE = config("KEY_CACHE_SIZE", default=1024, cast=int)
+# Current keypairs are reloaded after this long, so rotations by other server processes are seen
+KEY_CACHE_TTL_SECONDS = config("KEY_CACHE_TTL_SECONDS", default=60, cast=float)
+# key_ids per IN (...) query of a bulk lookup
+BULK_QUERY_SIZE = 500
+
+
+class _Flight:
+    """
+    One in-progress load/creation of a key_id that concurrent callers wait on.
+    """
+
     def __init__(self):
-        # No longer need file path checks
-        pass
-            
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class KeyManager:
+    """
+    Hands out system Kyber keypairs by key_id.
+
+    - Keypairs are cached in memory (LRU bounded), so steady-state lookups cost no DB round trip.
+      Current keypairs expire after ttl_seconds, since another server process may rotate them;
+      a record of a version newer than the cached one reloads the key at once.
+    - Concurrent misses on the same key_id are single-flighted: one caller loads (or generates
+      and inserts) the keypair, the others wait for its result.
+    - invalidate(key_id) drops the cached keypair and bumps the key's generation, so a load
+      that started before the invalidation cannot put the old keypair back.
+    - New key_ids claim a pre-generated keypair from the reservoir when it is running.
+    - Keys are versioned: rotate() archives the current keypair in system_key_versions and
+      installs a new one; get_key_version() still serves retired versions for old records.
+    - Request handlers use the *_async variants: cache hits return at once, misses (DB reads,
+      keygen and insert) run in a thread.
+    """
+
+    def __init__(self, max_entries: int = KEY_CACHE_SIZE, reservoir: KeypairReservoir = keypair_reservoir,
+                 ttl_seconds: float = KEY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.reservoir = reservoir
+        self._lock = threading.Lock()
+        self._keys = OrderedDict()
+        self._retired = OrderedDict()
+        self._flights = {}
+        self._generations = {}
+        # Metrics
+        self.hits = 0
+        self.misses = 0
+        self.created = 0
+
     def get_or_create_system_keypair(self, key_id: str):
         """
         Returns (public_key, private_key) for the given key_id.
         Creates them if they don't exist in the DB.
         """
+        _, public_key, private_key = self.get_current_key(key_id)
+        return public_key, private_key
+
+    def get_current_key(self, key_id: str):
+        """
+        Like get_or_create_system_keypair, with the key version.
+        Returns: (version, public_key, private_key)
+        """
+        with self._lock:
+            keypair = self._cached(key_id)
+            if keypair is not None:
+                return keypair
+            self.misses += 1
+            flight = self._flights.get(key_id)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key_id] = _Flight()
+                generation = self._generations.get(key_id, 0)
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = self._load_or_create(key_id)
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key_id]
+                if flight.error is None and self._generations.get(key_id, 0) == generation:
+                    self._remember(key_id, flight.result)
+            flight.done.set()
+        return flight.result
+
+    def _cached(self, key_id: str):
+        # Caller holds self._lock
+        entry = self._keys.get(key_id)
+        if entry is None or entry[1] <= time.monotonic():
+            return None
+        self._keys.move_to_end(key_id)
+        self.hits += 1
+        return entry[0]
+
+    def _remember(self, key_id: str, key):
+        # Caller holds self._lock
+        self._keys[key_id] = (key, time.monotonic() + self.ttl_seconds)
+        self._keys.move_to_end(key_id)
+        while len(self._keys) > self.max_entries:
+            self._keys.popitem(last=False)
+
+    def get_key_version(self, key_id: str, version: int = None):
+        """
+        Returns (public_key, private_key) of a specific version of key_id (None: current).
+        Raises ValueError for versions that never existed.
+        """
+        current_version, public_key, private_key = self.get_current_key(key_id)
+        if version is not None and version > current_version:
+            # The record may have been re-wrapped after another process rotated the key
+            self.invalidate(key_id)
+            current_version, public_key, private_key = self.get_current_key(key_id)
+        if version is None or version == current_version:
+            return public_key, private_key
+        if not 0 < version < current_version:
+            raise ValueError(f"Unknown version {version} of system key {key_id}")
+
+        # Retired versions never change, so they can be cached without invalidation
+        with self._lock:
+            keypair = self._retired.get((key_id, version))
+            if keypair is not None:
+                self._retired.move_to_end((key_id, version))
+                return keypair
+        db = SessionLocal()
+        try:
+            record = db.query(SystemKeyVersion).filter(
+                SystemKeyVersion.key_id == key_id, SystemKeyVersion.version == version
+            ).first()
+        finally:
+            db.close()
+        if record is None:
+            raise ValueError(f"Unknown version {version} of system key {key_id}")
+        keypair = (record.public_key, record.private_key)
+        with self._lock:
+            self._retired[(key_id, version)] = keypair
+            while len(self._retired) > self.max_entries:
+                self._retired.popitem(last=False)
+        return keypair
+
+    async def get_current_key_async(self, key_id: str):
+        with self._lock:
+            keypair = self._cached(key_id)
+        return keypair or await asyncio.to_thread(self.get_current_key, key_id)
+
+    async def get_key_version_async(self, key_id: str, version: int = None):
+        with self._lock:
+            current = self._cached(key_id)
+            if current is not None and version is not None and 0 < version < current[0]:
+                retired = self._retired.get((key_id, version))
+                if retired is not None:
+                    self._retired.move_to_end((key_id, version))
+                    return retired
+        if current is not None and (version is None or version == current[0]):
+            return current[1:]
+        return await asyncio.to_thread(self.get_key_version, key_id, version)
+
+    def get_current_keys(self, key_ids: List[str]) -> dict:
+        """
+        get_current_key for many key_ids (batch calls): cached keys come from memory, the others
+        from one query per BULK_QUERY_SIZE key_ids, and missing ones are created together (provision).
+        Returns {key_id: (version, public_key, private_key), or the exception the lookup failed with}.
+        """
+        keys, missing = {}, []
+        with self._lock:
+            for key_id in dict.fromkeys(key_ids):
+                keypair = self._cached(key_id)
+                if keypair is None:
+                    missing.append(key_id)
+                else:
+                    keys[key_id] = keypair
+            self.misses += len(missing)
+            generations = {key_id: self._generations.get(key_id, 0) for key_id in missing}
+        if not missing:
+            return keys
+
+        try:
+            loaded = self._load_many(missing)
+            new_ids = [key_id for key_id in missing if key_id not in loaded]
+            if new_ids:
+                self.provision(new_ids)
+                loaded.update(self._load_many(new_ids))
+        except Exception as e:
+            keys.update((key_id, e) for key_id in missing)
+            return keys
+        with self._lock:
+            for key_id, keypair in loaded.items():
+                # As in get_current_key: an invalidation meanwhile wins
+                if key_id not in self._flights and self._generations.get(key_id, 0) == generations[key_id]:
+                    self._remember(key_id, keypair)
+        for key_id in missing:
+            keys[key_id] = loaded.get(key_id) or ValueError(f"System key {key_id} could not be created")
+        return keys
+
+    def _load_many(self, key_ids: List[str]) -> dict:
+        loaded = {}
+        db = SessionLocal()
+        try:
+            for start in range(0, len(key_ids), BULK_QUERY_SIZE):
+                chunk = key_ids[start:start + BULK_QUERY_SIZE]
+                retired = dict(db.query(SystemKeyVersion.key_id, func.max(SystemKeyVersion.version))
+                               .filter(SystemKeyVersion.key_id.in_(chunk)).group_by(SystemKeyVersion.key_id))
+                for record in db.query(SystemKey).filter(SystemKey.key_id.in_(chunk)):
+                    loaded[record.key_id] = ((retired.get(record.key_id) or 0) + 1, record.public_key, record.private_key)
+        finally:
+            db.close()
+        return loaded
+
+    @staticmethod
+    def _current_version(db, key_id: str) -> int:
+        retired = db.query(func.max(SystemKeyVersion.version)).filter(SystemKeyVersion.key_id == key_id).scalar()
+        return (retired or 0) + 1
+
+    def _load_or_create(self, key_id: str):
         db = SessionLocal()
         try:
             key_record = db.query(SystemKey).filter(SystemKey.key_id == key_id).first()
-            
+
             if key_record:
-                return key_record.public_key, key_record.private_key
-            else:
-                # Generate new Kyber Keypair
-                pk, sk = generate_kyber_keypair()
-                
-                new_key = SystemKey(
-                    key_id=key_id,
-                    public_key=pk,
-                    private_key=sk
-                )
-                db.add(new_key)
+                return self._current_version(db, key_id), key_record.public_key, key_record.private_key
+
+            # Claim a pre-generated Kyber Keypair, or generate one now (on the KEM workers)
+            pk, sk = self.reservoir.take() or self.reservoir.generate(1)[0]
+
+            new_key = SystemKey(
+                key_id=key_id,
+                public_key=pk,
+                private_key=sk
+            )
+            db.add(new_key)
+            try:
+                db.commit()
+            except IntegrityError:
+                # Another server process inserted the same key_id first: use theirs
+                db.rollback()
+                key_record = db.query(SystemKey).filter(SystemKey.key_id == key_id).one()
+                return self._current_version(db, key_id), key_record.public_key, key_record.private_key
+            self.created += 1
+            return 1, pk, sk
+        finally:
+            db.close()
+
+    def provision(self, key_ids: List[str]) -> dict:
+        """
+        Creates keypairs for many key_ids at once, generated in parallel on the KEM workers
+        and inserted in one transaction. key_ids that already exist are left untouched.
+        Returns: {"created": [...], "existing": [...]}
+        """
+        key_ids = list(dict.fromkeys(key_ids))
+        db = SessionLocal()
+        try:
+            existing = {row.key_id for row in db.query(SystemKey.key_id).filter(SystemKey.key_id.in_(key_ids))}
+            new_ids = [key_id for key_id in key_ids if key_id not in existing]
+            keypairs = dict(zip(new_ids, self.reservoir.generate(len(new_ids))))
+
+            db.add_all(SystemKey(key_id=key_id, public_key=pk, private_key=sk) for key_id, (pk, sk) in keypairs.items())
+            try:
                 db.commit()
-                db.refresh(new_key)
-                return new_key.public_key, new_key.private_key
+                created = new_ids
+            except IntegrityError:
+                # Some key_ids were created concurrently: fall back to one insert per key
+                db.rollback()
+                created = []
+                for key_id, (pk, sk) in keypairs.items():
+                    db.add(SystemKey(key_id=key_id, public_key=pk, private_key=sk))
+                    try:
+                        db.commit()
+                        created.append(key_id)
+                    except IntegrityError:
+                        db.rollback()
+                        existing.add(key_id)
         finally:
             db.close()
+
+        with self._lock:
+            self.created += len(created)
+            for key_id in created:
+                if key_id not in self._flights:
+                    self._remember(key_id, (1,) + tuple(keypairs[key_id]))
+        return {"created": created, "existing": [key_id for key_id in key_ids if key_id in existing]}
+
+    def rotate(self, key_id: str) -> int:
+        """
+        Retires the current keypair of key_id and installs a fresh one.
+        Existing records keep working through get_key_version() until they are re-wrapped.
+        Returns the new version.
+        """
+        db = SessionLocal()
+        try:
+            # Lock the row so concurrent rotations of one key serialize (MySQL; SQLite locks the DB)
+            key_record = db.query(SystemKey).filter(SystemKey.key_id == key_id).with_for_update().first()
+            if key_record is None:
+                raise ValueError(f"Unknown system key {key_id}")
+            version = self._current_version(db, key_id)
+            pk, sk = self.reservoir.take() or self.reservoir.generate(1)[0]
+
+            db.add(SystemKeyVersion(
+                key_id=key_id,
+                version=version,
+                public_key=key_record.public_key,
+                private_key=key_record.private_key,
+                retired_at=str(time.time())
+            ))
+            key_record.public_key = pk
+            key_record.private_key = sk
+            try:
+                db.commit()
+            except IntegrityError:
+                db.rollback()
+                raise ValueError(f"System key {key_id} was rotated concurrently")
+        finally:
+            db.close()
+
+        # Nothing may keep encrypting to the retired public key, nor keep its secrets around
+        self.invalidate(key_id)
+        encaps_pool.invalidate(key_id)
+        decaps_cache.invalidate(key_id)
+        return version + 1
+
+    def invalidate(self, key_id: str):
+        """
+        Forgets the cached keypair for key_id (e.g. after a rotation); the next lookup reloads it.
+        """
+        with self._lock:
+            self._keys.pop(key_id, None)
+            self._generations[key_id] = self._generations.get(key_id, 0) + 1
+
+    def clear(self):
+        with self._lock:
+            for key_id in list(self._keys):
+                self._generations[key_id] = self._generations.get(key_id, 0) + 1
+            self._keys.clear()
+            self._retired.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._keys)
+            loading = len(self._flights)
+        lookups = self.hits + self.misses
+        return {
+            "cached_keys": size,
+            "loading": loading,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "created": self.created,
+            "max_entries": self.max_entries
+        }
+
+
+# Shared by the whole app (encryption and key management routes)
+key_manager = KeyManager()
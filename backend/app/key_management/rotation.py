@@ -0,0 +1,222 @@
+import asyncio
+import base64
+import hashlib
+import time
+import uuid
+from typing import AsyncIterator, List
+from decouple import config
+from app.database import SessionLocal
+from app.models import RewrapJob
+from app.blockchain.chain import Blockchain
+from app.encryption.core import DualKeyEncryption
+from app.encryption.envelope import Envelope, MultiRecipientEnvelope
+from app.key_management.manager import KeyManager, key_manager
+
+# Records re-wrapped (concurrently, on the KEM workers) between two checkpoints
+REWRAP_BATCH_SIZE = config("REWRAP_BATCH_SIZE", default=256, cast=int)
+
+
+class RewrapRun:
+    """
+    Streams stored records of one key_id over to its current key version.
+
+    Records are dicts, either a JSON record as returned by /encryption/encrypt
+    ({"id", "encrypted_data", "kyber_ciphertext", "key_version", "wrapped_secret"}) or a binary
+    envelope ({"id", "envelope": base64}); in a multi-recipient envelope only this key's slot
+    is re-wrapped. Only the Kyber ciphertext and wrapped secret change:
+    cost scales with the number of records, not with payload size, and no user key is needed.
+
+    Progress is checkpointed in rewrap_jobs after every batch (with one summarized ledger block),
+    once the batch's records have been handed to the caller. A run created with the job_id of an
+    interrupted one skips the records the caller confirms it stored (resume_from, at most the
+    checkpoint; default: the checkpoint), so the caller simply replays the same stream.
+    Records replayed between resume_from and the checkpoint are counted again.
+    """
+
+    def __init__(self, key_id: str, user_id: str, job_id: str = None, batch_size: int = REWRAP_BATCH_SIZE,
+                 resume_from: int = None, engine: DualKeyEncryption = None, manager: KeyManager = key_manager,
+                 blockchain: Blockchain = None):
+        self.key_id = key_id
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.engine = engine or DualKeyEncryption()
+        self.manager = manager
+        self.blockchain = blockchain or Blockchain()
+        self.job = self._load_job(job_id) if job_id else self._create_job()
+        if resume_from is not None:
+            if not 0 <= resume_from <= self.job.processed:
+                raise ValueError(f"Re-wrap job {self.job.job_id} can resume from 0-{self.job.processed}, not {resume_from}")
+            self.job.processed = resume_from
+        self.job_id = self.job.job_id
+        self.target_version = self.job.target_version
+        self._target_public_key, _ = self.manager.get_key_version(key_id, self.target_version)
+        self._old_keys = {}
+
+    def _load_job(self, job_id: str) -> RewrapJob:
+        db = SessionLocal()
+        try:
+            job = db.query(RewrapJob).filter(RewrapJob.job_id == job_id).first()
+        finally:
+            db.close()
+        if job is None or job.key_id != self.key_id:
+            raise ValueError(f"Unknown re-wrap job {job_id} for key {self.key_id}")
+        return job
+
+    def _create_job(self) -> RewrapJob:
+        version, _, _ = self.manager.get_current_key(self.key_id)
+        job = RewrapJob(
+            job_id=uuid.uuid4().hex,
+            key_id=self.key_id,
+            target_version=version,
+            processed=0,
+            rewrapped=0,
+            skipped=0,
+            failed=0,
+            status="running",
+            updated_at=str(time.time())
+        )
+        db = SessionLocal()
+        try:
+            db.add(job)
+            db.commit()
+            db.refresh(job)
+            db.expunge(job)
+        finally:
+            db.close()
+        return job
+
+    async def run(self, records: AsyncIterator[dict]) -> AsyncIterator[dict]:
+        """
+        Yields each re-wrapped record (or {"id", "error"}) in input order, followed after every
+        batch by {"checkpoint": {...}} once that batch's progress is durable.
+        """
+        position = 0
+        batch = []
+        async for record in records:
+            position += 1
+            if position <= self.job.processed:
+                continue  # Stored by the caller before the interruption
+            batch.append(record)
+            if len(batch) >= self.batch_size:
+                async for item in self._process(batch):
+                    yield item
+                batch = []
+        if batch:
+            async for item in self._process(batch):
+                yield item
+        await asyncio.to_thread(self._save, "completed")
+        yield {"checkpoint": self.status()}
+
+    async def _process(self, batch: List[dict]) -> AsyncIterator[dict]:
+        results = await asyncio.gather(*(self._rewrap(record) for record in batch))
+        for output, _ in results:
+            yield output
+
+        # Only reached once the caller took the batch's last record
+        rewrapped = sum(1 for r in results if r[1] == "rewrapped")
+        skipped = sum(1 for r in results if r[1] == "skipped")
+        self.job.processed += len(batch)
+        self.job.rewrapped += rewrapped
+        self.job.skipped += skipped
+        self.job.failed += len(batch) - rewrapped - skipped
+        await asyncio.to_thread(self._save, "running")
+
+        # One summarized ledger block per batch
+        digest = hashlib.sha256()
+        for output, _ in results:
+            digest.update(str(output.get("id", "")).encode() + b"\x00")
+        await self.blockchain.add_block_async(
+            event_type="KEY_REWRAP_BATCH",
+            key_id=self.key_id,
+            user_id=self.user_id,
+            data_reference=f"rewrap-{self.job_id}-v{self.target_version}-{self.job.processed}-{rewrapped}-{digest.hexdigest()}"
+        )
+        yield {"checkpoint": self.status()}
+
+    async def _old_private_key(self, version: int) -> bytes:
+        # Loaded once per version, off the event loop
+        if version not in self._old_keys:
+            _, self._old_keys[version] = await asyncio.to_thread(self.manager.get_key_version, self.key_id, version)
+        return self._old_keys[version]
+
+    async def _rewrap(self, record: dict):
+        """
+        Returns: (output record, "rewrapped" | "skipped" | "failed")
+        """
+        try:
+            if not isinstance(record, dict) or ("envelope" not in record and "kyber_ciphertext" not in record):
+                raise ValueError("Not a stored record")
+            if record.get("key_id", self.key_id) != self.key_id:
+                raise ValueError(f"Record belongs to key {record['key_id']}")
+            if "envelope" in record:
+                blob = base64.b64decode(record["envelope"])
+                if MultiRecipientEnvelope.is_multi_recipient(blob):
+                    return await self._rewrap_multi(record, MultiRecipientEnvelope.from_bytes(blob))
+                envelope = Envelope.from_bytes(blob)
+                if envelope.key_id != self.key_id:
+                    raise ValueError(f"Envelope belongs to key {envelope.key_id}")
+                if envelope.key_version >= self.target_version:
+                    return record, "skipped"
+                old_sk = await self._old_private_key(envelope.key_version)
+                envelope = await self.engine.rewrap_envelope_async(envelope, old_sk, self._target_public_key, self.target_version)
+                return {**record, "envelope": base64.b64encode(envelope.to_bytes()).decode('utf-8')}, "rewrapped"
+
+            old_version = record.get("key_version") or 1
+            if old_version >= self.target_version:
+                return record, "skipped"
+            old_sk = await self._old_private_key(old_version)
+            kyber_ciphertext, wrapped_secret = await self.engine.rewrap_record_async(
+                record["kyber_ciphertext"], record.get("wrapped_secret"), self.key_id, old_version,
+                old_sk, self._target_public_key, self.target_version
+            )
+            return {
+                **record,
+                "kyber_ciphertext": kyber_ciphertext,
+                "wrapped_secret": wrapped_secret,
+                "key_version": self.target_version
+            }, "rewrapped"
+        except Exception as e:
+            record_id = record.get("id") if isinstance(record, dict) else None
+            return {"id": record_id, "error": f"Re-wrap failed. {str(e)}"}, "failed"
+
+    async def _rewrap_multi(self, record: dict, envelope: MultiRecipientEnvelope):
+        slot_version = envelope.recipient(self.key_id).key_version
+        if slot_version >= self.target_version:
+            return record, "skipped"
+        old_sk = await self._old_private_key(slot_version)
+        envelope = await self.engine.rewrap_recipient_async(envelope, self.key_id, old_sk, self._target_public_key, self.target_version)
+        return {**record, "envelope": base64.b64encode(envelope.to_bytes()).decode('utf-8')}, "rewrapped"
+
+    def _save(self, status: str):
+        self.job.status = status
+        self.job.updated_at = str(time.time())
+        db = SessionLocal()
+        try:
+            db.merge(self.job)
+            db.commit()
+        finally:
+            db.close()
+
+    def status(self) -> dict:
+        return job_status(self.job)
+
+
+def job_status(job: RewrapJob) -> dict:
+    return {
+        "job_id": job.job_id,
+        "key_id": job.key_id,
+        "target_version": job.target_version,
+        "processed": job.processed,
+        "rewrapped": job.rewrapped,
+        "skipped": job.skipped,
+        "failed": job.failed,
+        "status": job.status
+    }
+
+
+def get_job(job_id: str) -> RewrapJob:
+    db = SessionLocal()
+    try:
+        return db.query(RewrapJob).filter(RewrapJob.job_id == job_id).first()
+    finally:
+        db.close()
@@ -0,0 +1,123 @@
+import asyncio
+import hashlib
+import json
+import tempfile
+from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from app.key_management.manager import key_manager
+from app.key_management.rotation import REWRAP_BATCH_SIZE, RewrapRun, get_job, job_status
+from app.blockchain.chain import Blockchain
+from app.rbac.dependencies import RoleChecker, UserRole, get_current_user_id
+
+router = APIRouter()
+blockchain = Blockchain()
+
+# RBAC: Only ADMIN can manage system keys
+allow_admin = RoleChecker([UserRole.ADMIN])
+
+# Upper bound on key_ids per provisioning call
+MAX_PROVISION_SIZE = 1000
+# Re-wrap request bodies beyond this are spooled to disk
+SPOOL_MAX_MEMORY = 8 * 1024 * 1024
+
+class ProvisionRequest(BaseModel):
+    key_ids: List[str]
+
+@router.post("/provision", dependencies=[Depends(allow_admin)])
+async def provision_keys(request: ProvisionRequest, user_id: str = Depends(get_current_user_id)):
+    if not request.key_ids:
+        raise HTTPException(status_code=400, detail="No key_ids given")
+    if len(request.key_ids) > MAX_PROVISION_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_PROVISION_SIZE} key_ids per call")
+    if any(not key_id or len(key_id) > 100 for key_id in request.key_ids):
+        raise HTTPException(status_code=400, detail="key_ids must be 1-100 characters")
+
+    # 1. Generate (in parallel on the KEM workers) and persist
+    try:
+        result = await asyncio.to_thread(key_manager.provision, request.key_ids)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # 2. Log to Blockchain (one block per created key, one commit)
+    if result["created"]:
+        public_keys = {key_id: (await key_manager.get_current_key_async(key_id))[1] for key_id in result["created"]}
+        await blockchain.add_blocks_async([{
+            "event_type": "KEY_PROVISIONED",
+            "key_id": key_id,
+            "user_id": user_id,
+            "data_reference": f"pk-sha256-{hashlib.sha256(public_keys[key_id]).hexdigest()}"
+        } for key_id in result["created"]])
+
+    return result
+
+@router.post("/{key_id}/rotate", dependencies=[Depends(allow_admin)])
+async def rotate_key(key_id: str, user_id: str = Depends(get_current_user_id)):
+    """
+    Retires the current keypair of key_id and installs a new version.
+    Stored records keep decrypting with their key_version; move them over with /rewrap.
+    """
+    try:
+        version = await asyncio.to_thread(key_manager.rotate, key_id)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    
+    await blockchain.add_block_async(
+        event_type="KEY_ROTATED",
+        key_id=key_id,
+        user_id=user_id,
+        data_reference=f"version-{version}"
+    )
+    return {"key_id": key_id, "version": version}
+
+@router.post("/{key_id}/rewrap", dependencies=[Depends(allow_admin)])
+async def rewrap_records(request: Request, key_id: str, job_id: str = None, batch_size: int = REWRAP_BATCH_SIZE,
+                         resume_from: int = None, user_id: str = Depends(get_current_user_id)):
+    """
+    Re-wraps a stream of stored records (NDJSON, one record per line) to the current version
+    of key_id, answering with the re-wrapped records as NDJSON in the same order.
+    A {"checkpoint": ...} line follows every batch; to resume an interrupted job,
+    send the same stream again with ?job_id=... and resume_from= the number of input records
+    whose output you stored (defaults to the last checkpoint).
+    """
+    if not 0 < batch_size <= 10000:
+        raise HTTPException(status_code=400, detail="batch_size must be between 1 and 10000")
+    try:
+        run = await asyncio.to_thread(RewrapRun, key_id, user_id, job_id, batch_size, resume_from)
+    except ValueError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+    # Spool the request body first: the streaming response competes with it for receive()
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_MEMORY)
+    async for chunk in request.stream():
+        spool.write(chunk)
+    spool.seek(0)
+
+    async def records():
+        for line in spool:
+            if line.strip():
+                yield _parse_line(line)
+
+    async def generate():
+        try:
+            async for item in run.run(records()):
+                yield json.dumps(item) + "\n"
+        finally:
+            spool.close()
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson", headers={"X-Rewrap-Job": run.job_id})
+
+def _parse_line(line: bytes):
+    # Unparseable lines are passed on as-is and reported as failed records
+    try:
+        return json.loads(line)
+    except ValueError:
+        return line.decode('utf-8', 'replace')
+
+@router.get("/rewrap/{job_id}", dependencies=[Depends(allow_admin)])
+async def get_rewrap_job(job_id: str):
+    job = get_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown re-wrap job")
+    return job_status(job)
@@ -1,14 +1,65 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from app.auth.routes import router as auth_router
 from app.encryption.routes import router as encryption_router
 from app.blockchain.routes import router as blockchain_router
 from app.monitoring.routes import router as monitoring_router
+from app.key_management.routes import router as key_management_router
+from app.encryption.kem_pool import kem_pool
+from app.encryption.encaps_pool import ENCAPS_POOL_ENABLED, encaps_pool
+from app.encryption.segment_pool import segment_pool
+from app.encryption.decaps_cache import decaps_cache
+from app.key_management.keypair_pool import KEYPAIR_POOL_ENABLED, keypair_reservoir
+from app.blockchain.appender import LEDGER_APPENDER_ENABLED, ledger_appender
+from app.blockchain.verification import LEDGER_FULL_VERIFY_INTERVAL_SECONDS, chain_verifier
+from app.blockchain.archive import LEDGER_ARCHIVE_INTERVAL_SECONDS, ledger_archive
+from app.monitoring.analytics import security_stats
+from app.monitoring.alerts import anomaly_detector
 from fastapi.middleware.cors import CORSMiddleware
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Start (and warm up) the Kyber worker processes before serving requests
+    kem_pool.start()
+    if ENCAPS_POOL_ENABLED:
+        encaps_pool.start()
+    if KEYPAIR_POOL_ENABLED:
+        keypair_reservoir.start()
+    # Load the dashboard counters once; ledger appends keep them current from here on
+    security_stats.rebuild()
+    # Refill the anomaly detector's sliding windows from the recent ledger
+    anomaly_detector.replay()
+    if LEDGER_APPENDER_ENABLED:
+        ledger_appender.start()
+    # Scheduled full re-verification of the ledger
+    full_verification = None
+    if LEDGER_FULL_VERIFY_INTERVAL_SECONDS > 0:
+        full_verification = asyncio.create_task(chain_verifier.run_scheduled(LEDGER_FULL_VERIFY_INTERVAL_SECONDS))
+    # Scheduled sealing of cold ledger blocks into segment files
+    archiving = None
+    if LEDGER_ARCHIVE_INTERVAL_SECONDS > 0:
+        archiving = asyncio.create_task(ledger_archive.run_scheduled(chain_verifier, LEDGER_ARCHIVE_INTERVAL_SECONDS))
+    yield
+    if full_verification is not None:
+        full_verification.cancel()
+    if archiving is not None:
+        archiving.cancel()
+    # Commit ledger events still queued
+    ledger_appender.stop()
+    keypair_reservoir.stop()
+    encaps_pool.stop()
+    # Wipe cached shared secrets
+    decaps_cache.clear()
+    segment_pool.shutdown()
+    # Let in-flight KEM calls finish, cancel queued ones
+    kem_pool.shutdown(wait=True)
+
 app = FastAPI(
     title="Dual-Key Encryption System",
     description="Secure backend with dual-key encryption and blockchain audit.",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Enable CORS for Frontend
@@ -24,6 +75,7 @@ app.include_router(auth_router, prefix="/auth")
 app.include_router(encryption_router, prefix="/encryption")
 app.include_router(blockchain_router, prefix="/audit")
 app.include_router(monitoring_router, prefix="/monitor")
+app.include_router(key_management_router, prefix="/keys")
 
 @app.get("/")
 async def root():
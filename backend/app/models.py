@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, Enum, Float
+from sqlalchemy import Column, Integer, String, LargeBinary, DateTime, Enum, Float, Index, Text
 from .database import Base
 import enum
 from datetime import datetime
@@ -23,6 +23,31 @@ class SystemKey(Base):
     public_key = Column(LargeBinary)
     private_key = Column(LargeBinary)
 
+# Retired versions of a system key, kept so records can still be opened (and re-wrapped)
+# after a rotation. The current version lives in system_keys.
+class SystemKeyVersion(Base):
+    __tablename__ = "system_key_versions"
+
+    key_id = Column(String(100), primary_key=True)
+    version = Column(Integer, primary_key=True)
+    public_key = Column(LargeBinary)
+    private_key = Column(LargeBinary)
+    retired_at = Column(String(50))
+
+# Progress of a re-wrap job, checkpointed after every batch so it can resume
+class RewrapJob(Base):
+    __tablename__ = "rewrap_jobs"
+
+    job_id = Column(String(64), primary_key=True)
+    key_id = Column(String(100))
+    target_version = Column(Integer)
+    processed = Column(Integer, default=0)
+    rewrapped = Column(Integer, default=0)
+    skipped = Column(Integer, default=0)
+    failed = Column(Integer, default=0)
+    status = Column(String(20))
+    updated_at = Column(String(50))
+
 class LedgerBlock(Base):
     __tablename__ = "ledger"
 
@@ -35,3 +60,69 @@ class LedgerBlock(Base):
     data_reference = Column(String(255))
     previous_hash = Column(String(64))
     hash = Column(String(64))
+    hash_version = Column(Integer, default=1) # Block hash format (see blockchain/block.py)
+    ts = Column(Float) # timestamp in seconds, for range queries (hashes still use the string above)
+
+    __table_args__ = (
+        Index("ix_ledger_event_type_ts", "event_type", "ts"),
+        Index("ix_ledger_user_id_ts", "user_id", "ts"),
+        Index("ix_ledger_key_id_ts", "key_id", "ts"),
+        Index("ix_ledger_ts", "ts"),
+    )
+
+# Signed ledger verification checkpoints. The "watermark" row is the last block routine
+# validation has verified (moved forward in place); "checkpoint" rows pin every
+# LEDGER_CHECKPOINT_INTERVAL-th block hash for the scheduled full re-verification.
+class LedgerCheckpoint(Base):
+    __tablename__ = "ledger_checkpoints"
+
+    id = Column(Integer, primary_key=True, index=True)
+    kind = Column(String(20), index=True)
+    block_index = Column(Integer)
+    block_hash = Column(String(64))
+    verified_at = Column(String(50))
+    signature = Column(String(64))
+
+# Merkle root over each sealed run of consecutive ledger blocks; batch_hash chains the batches
+# (sha256 of previous_batch_hash + merkle_root), so one batch row vouches for all before it.
+class LedgerBatch(Base):
+    __tablename__ = "ledger_batches"
+
+    batch_index = Column(Integer, primary_key=True)
+    first_index = Column(Integer, unique=True)
+    last_index = Column(Integer, unique=True)
+    merkle_root = Column(String(64))
+    previous_batch_hash = Column(String(64))
+    batch_hash = Column(String(64))
+    sealed_at = Column(String(50))
+
+# Sealed ledger segment files (blockchain/archive.py): blocks first_index..last_index live in
+# <file_name>.seg / .idx instead of the ledger table. segment_hash chains the segments and is
+# recorded in the chain by the block at sealed_block_index.
+class LedgerSegment(Base):
+    __tablename__ = "ledger_segments"
+
+    segment_index = Column(Integer, primary_key=True)
+    first_index = Column(Integer, unique=True)
+    last_index = Column(Integer, unique=True)
+    first_timestamp = Column(Float, index=True)
+    last_timestamp = Column(Float, index=True)
+    file_name = Column(String(255))
+    file_hash = Column(String(64))
+    index_hash = Column(String(64))
+    last_block_hash = Column(String(64))
+    previous_segment_hash = Column(String(64))
+    segment_hash = Column(String(64))
+    sealed_block_index = Column(Integer)
+    sealed_at = Column(String(50))
+    event_counts = Column(Text) # JSON {event_type: blocks}, recorded when sealed
+
+# Lifetime and encryption budget of a wrapped data key (encryption/data_keys.py), keyed by the
+# SHA-256 of the wrapped key, so they hold across cache evictions, re-unwraps and processes.
+class DataKeyUsage(Base):
+    __tablename__ = "data_key_usage"
+
+    key_hash = Column(String(64), primary_key=True)
+    uses = Column(Integer, default=0)
+    max_uses = Column(Integer)
+    expires_at = Column(Float)
@@ -1,39 +1,330 @@
-from typing import List, Dict
-from app.blockchain.chain import Blockchain
+import logging
+import threading
 import time
+from collections import deque
+from datetime import datetime
+from typing import Callable, Dict, List
+from decouple import config
+from app.blockchain.appender import LedgerAppender, ledger_appender
+from app.blockchain.block import Block
+from app.blockchain.chain import Blockchain
+from app.blockchain.verification import LEDGER_FULL_VERIFY_INTERVAL_SECONDS, chain_verifier
+
+logger = logging.getLogger(__name__)
 
 blockchain = Blockchain()
 
-def check_decryption_failures(threshold: int = 3, time_window: int = 600) -> List[Dict]:
-    """
-    Check for multiple decryption failures within a time window.
-    """
-    current_time = time.time()
-    failures = []
-    
-    # In a real system, we would query a database or indexed logs.
-    # Here we iterate the chain (inefficient for large chains, but fine for MVP).
-    recent_blocks = [b for b in blockchain.get_chain() if current_time - b.timestamp < time_window]
-    
-    user_failures = {}
-    
-    for block in recent_blocks:
-        if block.event_type == "DECRYPTION_FAILED":
-            user_id = block.user_id
-            user_failures[user_id] = user_failures.get(user_id, 0) + 1
-            
-    for user_id, count in user_failures.items():
-        if count >= threshold:
-            failures.append({
-                "user_id": user_id,
-                "issue": "Excessive Decryption Failures",
-                "count": count,
-                "severity": "HIGH"
-            })
-            
-    return failures
-
-def check_anomalies() -> List[Dict]:
-    alerts = []
-    alerts.extend(check_decryption_failures())
-    return alerts
+# Failed decryptions (DECRYPTION_FAILED, FILE_DECRYPTION_FAILED) per user / per key
+ALERT_USER_FAILURES = config("ALERT_USER_FAILURES", default=3, cast=int)
+ALERT_KEY_FAILURES = config("ALERT_KEY_FAILURES", default=10, cast=int)
+ALERT_FAILURE_WINDOW_SECONDS = config("ALERT_FAILURE_WINDOW_SECONDS", default=600, cast=int)
+# Successful decryptions per key
+ALERT_KEY_DECRYPTS = config("ALERT_KEY_DECRYPTS", default=1000, cast=int)
+ALERT_KEY_DECRYPT_WINDOW_SECONDS = config("ALERT_KEY_DECRYPT_WINDOW_SECONDS", default=3600, cast=int)
+# Decryptions by a user between these local hours (start == end disables the rule)
+ALERT_OFF_HOURS_START = config("ALERT_OFF_HOURS_START", default=22, cast=int)
+ALERT_OFF_HOURS_END = config("ALERT_OFF_HOURS_END", default=6, cast=int)
+ALERT_OFF_HOURS_WINDOW_SECONDS = config("ALERT_OFF_HOURS_WINDOW_SECONDS", default=3600, cast=int)
+# Buckets per sliding window (the window slides a bucket at a time)
+ALERT_WINDOW_BUCKETS = config("ALERT_WINDOW_BUCKETS", default=10, cast=int)
+# Most recent alerts kept for /monitor/alerts
+ALERT_STORE_SIZE = config("ALERT_STORE_SIZE", default=1000, cast=int)
+# Idle windows are dropped every this many events
+PRUNE_EVERY = 10000
+
+
+def is_failure(block: Block) -> bool:
+    return block.event_type.endswith("DECRYPTION_FAILED")
+
+
+def is_decryption(block: Block) -> bool:
+    return "DECRYPTION" in block.event_type and not is_failure(block)
+
+
+def is_off_hours(block: Block) -> bool:
+    if "DECRYPTION" not in block.event_type or ALERT_OFF_HOURS_START == ALERT_OFF_HOURS_END:
+        return False
+    hour = datetime.fromtimestamp(block.timestamp).hour
+    if ALERT_OFF_HOURS_START < ALERT_OFF_HOURS_END:
+        return ALERT_OFF_HOURS_START <= hour < ALERT_OFF_HOURS_END
+    return hour >= ALERT_OFF_HOURS_START or hour < ALERT_OFF_HOURS_END
+
+
+class SlidingWindowCounter:
+    """
+    Events in the last `window` seconds, kept in a ring of `buckets` time buckets with a running
+    total. add() only clears the buckets the window slid past since the previous event, so it
+    is O(1) amortized; the window is exact to one bucket width.
+    """
+
+    def __init__(self, window: float, buckets: int = ALERT_WINDOW_BUCKETS):
+        self.width = window / buckets
+        self.counts = [0] * buckets
+        self.head = None  # Newest bucket seen
+        self.total = 0
+
+    def add(self, timestamp: float) -> int:
+        bucket = int(timestamp // self.width)
+        size = len(self.counts)
+        if self.head is None or bucket - self.head >= size:
+            self.counts = [0] * size
+            self.total = 0
+            self.head = bucket
+        elif bucket > self.head:
+            for expired in range(self.head + 1, bucket + 1):
+                self.total -= self.counts[expired % size]
+                self.counts[expired % size] = 0
+            self.head = bucket
+        elif bucket <= self.head - size:
+            return self.total  # Older than the window
+        self.counts[bucket % size] += 1
+        self.total += 1
+        return self.total
+
+    def idle(self, timestamp: float) -> bool:
+        return self.head is None or int(timestamp // self.width) - self.head >= len(self.counts)
+
+
+class Rule:
+    """
+    Alerts when `threshold` matching events of one subject (user_id or key_id) fall within
+    `window` seconds. It fires once on reaching the threshold and re-arms after the count has
+    dropped below it again.
+    """
+
+    def __init__(self, name: str, issue: str, subject: str, matches: Callable[[Block], bool],
+                 threshold: int, window: int, severity: str):
+        self.name = name
+        self.issue = issue
+        self.subject = subject
+        self.matches = matches
+        self.threshold = threshold
+        self.window = window
+        self.severity = severity
+
+    def to_dict(self) -> dict:
+        return {"name": self.name, "issue": self.issue, "subject": self.subject, "threshold": self.threshold,
+                "window_seconds": self.window, "severity": self.severity}
+
+
+def default_rules() -> List[Rule]:
+    # A threshold of 0 disables a rule
+    rules = [
+        Rule("user_failure_burst", "Excessive Decryption Failures", "user_id", is_failure,
+             ALERT_USER_FAILURES, ALERT_FAILURE_WINDOW_SECONDS, "HIGH"),
+        Rule("key_failure_burst", "Excessive Decryption Failures On Key", "key_id", is_failure,
+             ALERT_KEY_FAILURES, ALERT_FAILURE_WINDOW_SECONDS, "HIGH"),
+        Rule("key_decrypt_volume", "Unusual Decryption Volume On Key", "key_id", is_decryption,
+             ALERT_KEY_DECRYPTS, ALERT_KEY_DECRYPT_WINDOW_SECONDS, "MEDIUM"),
+        Rule("off_hours_activity", "Off-Hours Decryption Activity", "user_id", is_off_hours,
+             1, ALERT_OFF_HOURS_WINDOW_SECONDS, "LOW")
+    ]
+    return [rule for rule in rules if rule.threshold > 0]
+
+
+class AlertStore:
+    """
+    The most recent alerts (bounded), newest first when queried.
+    """
+
+    def __init__(self, max_size: int = ALERT_STORE_SIZE):
+        self._alerts = deque(maxlen=max_size)
+        self._lock = threading.Lock()
+        self.raised = 0
+
+    def add(self, alert: dict) -> dict:
+        with self._lock:
+            self.raised += 1
+            alert["id"] = self.raised
+            self._alerts.append(alert)
+        return alert
+
+    def query(self, since: float = None, rule: str = None, user_id: str = None, key_id: str = None,
+              severity: str = None, limit: int = None, active_at: float = None) -> List[Dict]:
+        """
+        active_at: only alerts whose rule window is still open at that time.
+        """
+        with self._lock:
+            alerts = list(self._alerts)
+        results = []
+        for alert in reversed(alerts):
+            if since is not None and alert["timestamp"] < since:
+                continue
+            if active_at is not None and alert["timestamp"] + alert["window_seconds"] < active_at:
+                continue
+            if (rule is not None and alert["rule"] != rule) or (severity is not None and alert["severity"] != severity):
+                continue
+            if (user_id is not None and alert.get("user_id") != user_id) or (key_id is not None and alert.get("key_id") != key_id):
+                continue
+            results.append(alert)
+            if limit is not None and len(results) >= limit:
+                break
+        return results
+
+    def stats(self) -> dict:
+        return {"raised": self.raised, "stored": len(self._alerts)}
+
+
+alert_store = AlertStore()
+
+
+class AnomalyDetector:
+    """
+    Evaluates the rules on ledger events as they are appended (appender listener), keeping one
+    sliding window per rule and subject; each event costs O(1) per rule, nothing is scanned.
+
+    Blocks are observed once, in index order. If a batch skips indices (another server process
+    appended in between), it is held back together with everything appended after it, and a
+    filler thread reads the missing blocks from the ledger first: on_append runs in the
+    appender's writer thread and never does I/O. replay() warms the windows up from the recent
+    ledger at startup.
+    """
+
+    def __init__(self, rules: List[Rule] = None, store: AlertStore = alert_store, chain: Blockchain = blockchain,
+                 appender: LedgerAppender = ledger_appender):
+        self.rules = default_rules() if rules is None else rules
+        self.store = store
+        self.blockchain = chain
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._last_index = None
+        self._backlog = deque()  # Blocks held back until the gap before them is filled
+        self._filler = None  # Thread reading the ledger; blocks appended meanwhile are held back
+        self.observed = 0
+        appender.add_listener(self.on_append)
+
+    def on_append(self, blocks: List[Block]):
+        if not blocks:
+            return
+        with self._lock:
+            gap = self._last_index is not None and blocks[0].index > self._last_index + 1
+            if self._filler is None and not gap:
+                for block in blocks:
+                    self._observe(block)
+                return
+            self._backlog.extend(blocks)
+            if self._filler is None:
+                self._filler = threading.Thread(target=self._fill_gaps, name="anomaly-gap-filler", daemon=True)
+                self._filler.start()
+
+    def _fill_gaps(self):
+        # Filler thread: one gap per round, then the held back blocks up to the next gap
+        while True:
+            with self._lock:
+                if not self._backlog:
+                    self._filler = None
+                    self._idle.notify_all()
+                    return
+                after, first = self._last_index, self._backlog[0].index
+            missing = []
+            if after is not None and first > after + 1:
+                try:
+                    missing = list(self.blockchain.iter_blocks(after=after, limit=first - after - 1))
+                except Exception:
+                    logger.exception("Reading ledger blocks %d-%d for anomaly detection failed", after + 1, first - 1)
+            with self._lock:
+                for block in missing:
+                    self._observe(block)
+                # Whatever the ledger did not return is skipped
+                self._observe(self._backlog.popleft())
+                while self._backlog and self._backlog[0].index <= self._last_index + 1:
+                    self._observe(self._backlog.popleft())
+
+    def flush(self, timeout: float = None) -> bool:
+        """
+        Waits until held back blocks have been observed. Returns False on timeout.
+        """
+        current = threading.current_thread()
+        with self._idle:
+            return self._idle.wait_for(lambda: self._filler in (None, current), timeout)
+
+    def replay(self, now: float = None):
+        """
+        Feeds the events of the longest rule window (indexed ts range read) through the rules.
+        Blocks appended meanwhile are held back as for a gap, so the ledger is read without the lock.
+        """
+        window = max((rule.window for rule in self.rules), default=0)
+        since = (now or time.time()) - window
+        with self._lock:
+            after, replaying = self._last_index, self._filler is None
+            if replaying:
+                self._filler = threading.current_thread()
+        try:
+            for block in self.blockchain.iter_blocks(after=after, since=since):
+                with self._lock:
+                    self._observe(block)
+        finally:
+            if replaying:
+                self._fill_gaps()
+
+    def _observe(self, block: Block):
+        if self._last_index is not None and block.index <= self._last_index:
+            return
+        self._last_index = block.index
+        for rule in self.rules:
+            if not rule.matches(block):
+                continue
+            subject = getattr(block, rule.subject)
+            window = self._windows.get((rule.name, subject))
+            if window is None:
+                window = self._windows[(rule.name, subject)] = SlidingWindowCounter(rule.window)
+            count = window.add(block.timestamp)
+            if count == rule.threshold:
+                self.store.add({
+                    "rule": rule.name,
+                    "issue": rule.issue,
+                    "severity": rule.severity,
+                    rule.subject: subject,
+                    "count": count,
+                    "window_seconds": rule.window,
+                    "block_index": block.index,
+                    "timestamp": block.timestamp,
+                    "message": f"{rule.issue}: {rule.subject} {subject} ({count} in {rule.window}s)"
+                })
+        self.observed += 1
+        if self.observed % PRUNE_EVERY == 0:
+            self._windows = {k: w for k, w in self._windows.items() if not w.idle(block.timestamp)}
+
+    def stats(self) -> dict:
+        return {
+            "rules": [rule.to_dict() for rule in self.rules],
+            "observed": self.observed,
+            "last_index": self._last_index,
+            "held_back": len(self._backlog),
+            "windows": len(self._windows),
+            **self.store.stats()
+        }
+
+
+anomaly_detector = AnomalyDetector()
+
+
+def integrity_alert(result: dict, store: AlertStore = alert_store) -> dict:
+    """
+    Raises a CRITICAL alert for a failed scheduled full verification (verifier listener).
+    It stays active until the next scheduled run.
+    """
+    return store.add({
+        "rule": "ledger_integrity",
+        "issue": "Ledger Integrity Check Failed",
+        "severity": "CRITICAL",
+        "count": 1,
+        "window_seconds": LEDGER_FULL_VERIFY_INTERVAL_SECONDS,
+        "block_index": result["first_bad_index"],
+        "timestamp": result["finished_at"],
+        "message": f"Ledger Integrity Check Failed: {result['error']}"
+    })
+
+
+chain_verifier.add_listener(integrity_alert)
+
+
+def check_anomalies(since: float = None, rule: str = None, user_id: str = None, key_id: str = None,
+                    severity: str = None, limit: int = None) -> List[Dict]:
+    """
+    Alerts raised by the streaming detector, newest first. Without `since`, only the active
+    ones (raised within their rule's window); with it, the history since then.
+    """
+    active_at = time.time() if since is None else None
+    return alert_store.query(since, rule, user_id, key_id, severity, limit, active_at)
@@ -1,80 +1,175 @@
+import threading
+import time
+from datetime import datetime, timezone
 from typing import Dict, List
+from sqlalchemy import case, func
+from app.blockchain.appender import LedgerAppender, ledger_appender
+from app.blockchain.block import Block
 from app.blockchain.chain import Blockchain
-import time
-from datetime import datetime, timedelta
+from app.database import SessionLocal
+from app.models import LedgerBlock
 
 blockchain = Blockchain()
 
+# Length of the timeline (one bucket per hour, the current hour included)
+TIMELINE_HOURS = 24
+
+
+def local_hour(timestamp: float) -> int:
+    # Hours since the epoch on the local clock, so buckets start at local hour boundaries
+    # (also in zones with a half-hour offset)
+    offset = datetime.fromtimestamp(timestamp).astimezone().utcoffset().total_seconds()
+    return int((timestamp + offset) // 3600)
+
+
+def hour_start(hour: int) -> float:
+    # Timestamp at which local hour `hour` (see local_hour) begins
+    return datetime.fromtimestamp(hour * 3600, timezone.utc).replace(tzinfo=None).timestamp()
+
+
+def _category(event_type: str) -> str:
+    if "ENCRYPTION" in event_type:
+        return "ENCRYPTION"
+    if "DECRYPTION_FAILED" in event_type:
+        return "FAILURE"
+    if "DECRYPTION" in event_type:
+        return "DECRYPTION"
+    return "OTHER"
+
+
+class SecurityStats:
+    """
+    Security analytics kept up to date incrementally, so /monitor/stats does not scan the ledger.
+
+    - Totals per event_type, and a ring of TIMELINE_HOURS per-hour counters (local hours,
+      slot = hour % 24, reset when a new hour reuses it), are fed by the appender's listener with every
+      committed batch.
+    - rebuild() loads them from the database with one aggregate query (GROUP BY event_type
+      and hour bucket, answered from the (event_type, ts) index) plus the per-segment counts
+      stored in ledger_segments; only segments reaching into the timeline are read. It runs at startup and whenever the listener sees a gap in the
+      indices, i.e. another server process appended in between.
+    """
+
+    def __init__(self, chain: Blockchain = blockchain, appender: LedgerAppender = ledger_appender):
+        self.blockchain = chain
+        self._lock = threading.Lock()
+        self._built = False
+        self._last_index = 0
+        self._totals = {}
+        self._hours = [[None, 0] for _ in range(TIMELINE_HOURS)]
+        self.rebuilds = 0
+        appender.add_listener(self.on_append)
+
+    def _count_hour(self, hour: int, count: int):
+        slot = self._hours[hour % TIMELINE_HOURS]
+        if slot[0] == hour:
+            slot[1] += count
+        elif slot[0] is None or slot[0] < hour:
+            slot[0], slot[1] = hour, count
+
+    def on_append(self, blocks: List[Block]):
+        with self._lock:
+            if not self._built:
+                return  # The first snapshot() rebuilds from the database
+            for block in blocks:
+                if block.index <= self._last_index:
+                    continue  # Already counted by rebuild()
+                if block.index != self._last_index + 1:
+                    self._built = False  # Blocks from another process are missing
+                    return
+                self._totals[block.event_type] = self._totals.get(block.event_type, 0) + 1
+                self._count_hour(local_hour(block.timestamp), 1)
+                self._last_index = block.index
+
+    def rebuild(self, now: float = None):
+        """
+        Reloads the counters from both ledger tiers. Holds the lock throughout, so appends
+        committed meanwhile are applied after it (or skipped if the query already saw them).
+        """
+        current = local_hour(now or time.time())
+        oldest = current - TIMELINE_HOURS + 1
+        since = hour_start(oldest)
+        archive = self.blockchain.archive
+        with self._lock:
+            totals, hours, last_index = {}, {}, 0
+            db = SessionLocal()
+            try:
+                # 1. Archived segments: counts recorded when sealed; only segments reaching into the timeline are read
+                archived_through = None
+                for segment in archive.segments(db):
+                    for event_type, count in archive.event_counts(segment).items():
+                        totals[event_type] = totals.get(event_type, 0) + count
+                    if segment.last_timestamp >= since:
+                        for row in archive.read_segment(segment):
+                            if row.ts is not None and row.ts >= since:
+                                hours[local_hour(row.ts)] = hours.get(local_hour(row.ts), 0) + 1
+                    archived_through = last_index = segment.last_index
+
+                # 2. Hot table: one GROUP BY over (event_type, hour of the timeline or NULL)
+                bucket = case(
+                    *[(LedgerBlock.ts >= hour_start(hour), hour) for hour in range(current, oldest - 1, -1)],
+                    else_=None
+                ).label("hour")
+                query = db.query(LedgerBlock.event_type, bucket, func.count(LedgerBlock.id), func.max(LedgerBlock.index))
+                if archived_through is not None:
+                    query = query.filter(LedgerBlock.index > archived_through)
+                for event_type, hour, count, max_index in query.group_by(LedgerBlock.event_type, bucket):
+                    totals[event_type] = totals.get(event_type, 0) + count
+                    if hour is not None:
+                        hours[hour] = hours.get(hour, 0) + count
+                    last_index = max(last_index, max_index)
+            finally:
+                db.close()
+
+            self._totals = totals
+            self._hours = [[None, 0] for _ in range(TIMELINE_HOURS)]
+            for hour, count in hours.items():
+                self._count_hour(hour, count)
+            self._last_index = last_index
+            self._built = True
+            self.rebuilds += 1
+
+    def snapshot(self, now: float = None) -> Dict:
+        now = now or time.time()
+        if not self._built:
+            self.rebuild(now)
+        current = local_hour(now)
+        with self._lock:
+            totals = dict(self._totals)
+            hours = {hour: count for hour, count in self._hours if hour is not None}
+
+        distribution = {"ENCRYPTION": 0, "DECRYPTION": 0, "FAILURE": 0, "OTHER": 0}
+        for event_type, count in totals.items():
+            distribution[_category(event_type)] += count
+
+        # Oldest to newest, labelled with the local hour
+        timeline = []
+        for hour in range(current - TIMELINE_HOURS + 1, current + 1):
+            timeline.append({
+                "time": datetime.fromtimestamp(hour * 3600, timezone.utc).strftime("%H:00"),
+                "events": hours.get(hour, 0)
+            })
+        return {
+            "total_events": sum(totals.values()),
+            "events_last_24h": sum(point["events"] for point in timeline),
+            "distribution": distribution,
+            "timeline": timeline
+        }
+
+    def stats(self) -> dict:
+        return {"built": self._built, "last_index": self._last_index, "rebuilds": self.rebuilds}
+
+
+security_stats = SecurityStats()
+
+
 def get_security_stats() -> Dict:
     """
     Aggregates blockchain events for visualization.
     Returns:
         - total_events
-        - events_last_24h
+        - events_last_24h (the 24 hourly buckets of the timeline)
         - event_distribution (Encryption vs Decryption vs Failures)
         - timeline (Events per hour for last 24h)
     """
-    chain = blockchain.get_chain()
-    
-    stats = {
-        "total_events": len(chain),
-        "events_last_24h": 0,
-        "distribution": {
-            "ENCRYPTION": 0,
-            "DECRYPTION": 0,
-            "FAILURE": 0,
-            "OTHER": 0
-        },
-        "timeline": []
-    }
-    
-    now = time.time()
-    twenty_four_hours_ago = now - 86400
-    
-    # Initialize timeline buckets (last 24 hours)
-    timeline_buckets = {}
-    for i in range(24):
-        hour_key = (datetime.fromtimestamp(now) - timedelta(hours=i)).strftime("%H:00")
-        timeline_buckets[hour_key] = 0
-
-    for block in chain:
-        # 1. Count Last 24h
-        if block.timestamp > twenty_four_hours_ago:
-            stats["events_last_24h"] += 1
-            
-            # Add to timeline
-            block_time = datetime.fromtimestamp(block.timestamp)
-            hour_key = block_time.strftime("%H:00")
-            if hour_key in timeline_buckets:
-                timeline_buckets[hour_key] += 1
-
-        # 2. Distribution
-        evt = block.event_type
-        if "ENCRYPTION" in evt:
-            stats["distribution"]["ENCRYPTION"] += 1
-        elif "DECRYPTION_FAILED" in evt:
-            stats["distribution"]["FAILURE"] += 1
-        elif "DECRYPTION" in evt:
-            stats["distribution"]["DECRYPTION"] += 1
-        else:
-            stats["distribution"]["OTHER"] += 1
-
-    # Format timeline for frontend
-    # Sort by time (oldest to newest)
-    sorted_hours = sorted(timeline_buckets.keys(), key=lambda x: datetime.strptime(x, "%H:00") if x else 0)
-    # Actually, simple string sort might fail if crossing midnight, but for MVP it's okay-ish. 
-    # Better to just reverse the list of last 24h generated.
-    
-    final_timeline = []
-    # Re-generate keys in correct order (oldest to newest)
-    for i in range(23, -1, -1):
-        t = datetime.fromtimestamp(now) - timedelta(hours=i)
-        key = t.strftime("%H:00")
-        final_timeline.append({
-            "time": key,
-            "events": timeline_buckets.get(key, 0)
-        })
-        
-    stats["timeline"] = final_timeline
-    
-    return stats
+    return security_stats.snapshot()
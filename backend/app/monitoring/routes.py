@@ -1,5 +1,6 @@
-from fastapi import APIRouter, Depends
-from app.monitoring.alerts import check_anomalies
+import asyncio
+from fastapi import APIRouter, Depends, HTTPException
+from app.monitoring.alerts import anomaly_detector, check_anomalies
 from app.rbac.dependencies import RoleChecker, UserRole
 
 router = APIRouter()
@@ -7,11 +8,58 @@ router = APIRouter()
 # Only ADMIN can view alerts
 allow_monitor = RoleChecker([UserRole.ADMIN])
 
+# Alerts returned per request
+DEFAULT_ALERT_LIMIT = 100
+MAX_ALERT_LIMIT = 1000
+
 @router.get("/alerts", dependencies=[Depends(allow_monitor)])
-async def get_alerts():
-    return {"alerts": check_anomalies()}
+async def get_alerts(
+    since: float = None,
+    rule: str = None,
+    user_id: str = None,
+    key_id: str = None,
+    severity: str = None,
+    limit: int = None
+):
+    """
+    Active alerts (raised within their rule's window), newest first; ?since=<seconds since the
+    epoch> returns the history since then instead. Optionally for one rule, user, key or severity.
+    """
+    limit = min(limit or DEFAULT_ALERT_LIMIT, MAX_ALERT_LIMIT)
+    if limit < 1:
+        raise HTTPException(status_code=400, detail="limit must be positive")
+    return {"alerts": check_anomalies(since, rule, user_id, key_id, severity, limit)}
+
+@router.get("/detector", dependencies=[Depends(allow_monitor)])
+async def get_detector_stats():
+    return anomaly_detector.stats()
 
 @router.get("/stats", dependencies=[Depends(allow_monitor)])
 async def get_stats():
     from app.monitoring.analytics import get_security_stats
-    return get_security_stats()
+    # A (re)build reads the database: keep it off the event loop
+    return await asyncio.to_thread(get_security_stats)
+
+@router.get("/crypto", dependencies=[Depends(allow_monitor)])
+async def get_crypto_stats():
+    from app.encryption.encaps_pool import encaps_pool
+    from app.encryption.data_keys import data_key_cache
+    from app.encryption.decaps_cache import decaps_cache
+    from app.key_management.manager import key_manager
+    from app.key_management.keypair_pool import keypair_reservoir
+    return {
+        "system_keys": key_manager.stats(),
+        "keypair_reservoir": keypair_reservoir.stats(),
+        "encapsulation_pool": encaps_pool.stats(),
+        "decapsulation_cache": decaps_cache.stats(),
+        "data_key_sessions": data_key_cache.stats()
+    }
+
+@router.get("/ledger", dependencies=[Depends(allow_monitor)])
+async def get_ledger_stats():
+    from app.blockchain.appender import ledger_appender
+    from app.blockchain.verification import chain_verifier
+    from app.blockchain.archive import ledger_archive
+    from app.monitoring.analytics import security_stats
+    return {"appender": ledger_appender.stats(), "verification": chain_verifier.stats(), "archive": ledger_archive.stats(),
+            "analytics": security_stats.stats()}
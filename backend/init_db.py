@@ -3,6 +3,7 @@ from sqlalchemy_utils import database_exists, create_database
 from app.database import SQLALCHEMY_DATABASE_URL, engine, SessionLocal
 from app.models import Base, User, UserRole, LedgerBlock
 from app.blockchain.block import Block
+from app.blockchain.appender import LEDGER_HASH_VERSION
 import datetime
 import time
 
@@ -50,18 +51,21 @@ def init_db():
             key_id="SYSTEM",
             user_id="SYSTEM",
             data_reference="GENESIS_BLOCK",
-            previous_hash="0"
+            previous_hash="0",
+            hash_version=LEDGER_HASH_VERSION
         )
         
         db_block = LedgerBlock(
             index=genesis_block.index,
-            timestamp=str(genesis_block.timestamp), # Store as string
+            timestamp=genesis_block.stored_timestamp(), # Store as string
             event_type=genesis_block.event_type,
             key_id=genesis_block.key_id,
             user_id=genesis_block.user_id,
             data_reference=genesis_block.data_reference,
             previous_hash=genesis_block.previous_hash,
-            hash=genesis_block.hash
+            hash=genesis_block.hash,
+            hash_version=genesis_block.hash_version,
+            ts=genesis_block.timestamp
         )
         db.add(db_block)
         db.commit()
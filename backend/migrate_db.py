@@ -0,0 +1,76 @@
+from sqlalchemy import inspect, text
+from app.database import SQLALCHEMY_DATABASE_URL, engine
+from app.models import Base
+from app.blockchain.block import timestamp_seconds
+
+# Columns added to existing tables since they were first created, in order.
+# (table, column, DDL for the column)
+COLUMN_MIGRATIONS = [
+    # Block hash format: existing blocks keep v1, new ones are written as v2
+    ("ledger", "hash_version", "INT NOT NULL DEFAULT 1"),
+    # Numeric timestamp for range queries (backfilled below)
+    ("ledger", "ts", "DOUBLE"),
+    # Blocks per event type of each archived segment (older segments are filled in on first read)
+    ("ledger_segments", "event_counts", "TEXT"),
+]
+
+# Indexes added since tables were first created: (table, name, columns)
+INDEX_MIGRATIONS = [
+    ("ledger", "ix_ledger_event_type_ts", ("event_type", "ts")),
+    ("ledger", "ix_ledger_user_id_ts", ("user_id", "ts")),
+    ("ledger", "ix_ledger_key_id_ts", ("key_id", "ts")),
+    ("ledger", "ix_ledger_ts", ("ts",)),
+]
+
+# Rows per backfill transaction
+BACKFILL_BATCH = 5000
+
+def migrate_db():
+    """
+    Brings an existing database up to the current schema without dropping data
+    (init_db.py resets everything): creates missing tables, adds missing columns (backfilling
+    ledger.ts), then adds missing indexes.
+    """
+    # 1. Create missing tables
+    Base.metadata.create_all(bind=engine)
+    print(f"Checked tables: {SQLALCHEMY_DATABASE_URL.split('@')[-1]}")
+
+    # 2. Add missing columns
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, column, ddl in COLUMN_MIGRATIONS:
+            existing = {c["name"] for c in inspector.get_columns(table)}
+            if column in existing:
+                print(f"{table}.{column} already present.")
+                continue
+            conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+            print(f"Added {table}.{column}.")
+
+    # 3. Backfill ledger.ts from the stored (hashed) timestamp
+    backfilled = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT id, timestamp, hash_version FROM ledger WHERE ts IS NULL LIMIT :n"
+            ), {"n": BACKFILL_BATCH}).all()
+            if not rows:
+                break
+            conn.execute(text("UPDATE ledger SET ts = :ts WHERE id = :id"), [
+                {"id": row_id, "ts": timestamp_seconds(stored, version)} for row_id, stored, version in rows
+            ])
+            backfilled += len(rows)
+    if backfilled:
+        print(f"Backfilled ledger.ts for {backfilled} blocks.")
+
+    # 4. Add missing indexes
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table, name, columns in INDEX_MIGRATIONS:
+            if name in {i["name"] for i in inspector.get_indexes(table)}:
+                print(f"Index {name} already present.")
+                continue
+            conn.execute(text(f"CREATE INDEX {name} ON {table} ({', '.join(columns)})"))
+            print(f"Added index {name}.")
+
+if __name__ == "__main__":
+    migrate_db()
@@ -0,0 +1,50 @@
+import os
+from tests.benchmarks.harness import Case
+from app.encryption.core import DualKeyEncryption
+from app.encryption.decaps_cache import DecapsulationCache
+from app.encryption.digests import PayloadDigests
+from app.encryption.kyber_utils import generate_kyber_keypair, encapsulate_secret, decapsulate_secret
+
+
+def _size_label(size: int) -> str:
+    for unit, scale in (("GB", 1 << 30), ("MB", 1 << 20), ("KB", 1 << 10)):
+        if size >= scale and size % scale == 0:
+            return f"{size // scale}{unit}"
+    return f"{size}B"
+
+
+def collect(profile: dict):
+    engine = DualKeyEncryption()
+    pk, sk = generate_kyber_keypair()
+    kyber_ciphertext, kyber_secret = encapsulate_secret(pk)
+    master_key = engine._derive_master_key(kyber_secret, "benchmark-user-key")
+
+    yield Case("kyber.generate_keypair", generate_kyber_keypair)
+    yield Case("kyber.encapsulate", lambda: encapsulate_secret(pk))
+    yield Case("kyber.decapsulate", lambda: decapsulate_secret(kyber_ciphertext, sk))
+    yield Case("engine.derive_master_key", lambda: engine._derive_master_key(kyber_secret, "benchmark-user-key"))
+
+    # Repeat decrypts of one record: every call decapsulates vs. served from the decapsulation cache
+    record = engine.encrypt_data("benchmark record", pk, "benchmark-user-key")
+    cached_engine = DualKeyEncryption(decaps=DecapsulationCache(enabled=True))
+    yield Case("engine.decrypt_data[uncached]", lambda: engine.decrypt_data(
+        record["encrypted_data"], record["kyber_ciphertext"], sk, "benchmark-user-key"))
+    yield Case("engine.decrypt_data[cached]", lambda: cached_engine.decrypt_data(
+        record["encrypted_data"], record["kyber_ciphertext"], sk, "benchmark-user-key"))
+
+    for size in profile["payload_sizes"]:
+        label = _size_label(size)
+        payload = os.urandom(size)
+        encrypted = engine._encrypt_aes(payload, master_key)
+        # Big payloads are slow per op; a few iterations are enough
+        iterations = 3 if size >= (16 << 20) else 10000
+        yield Case(f"aes.encrypt[{label}]", lambda p=payload: engine._encrypt_aes(p, master_key),
+                   bytes_per_op=size, max_iterations=iterations)
+        yield Case(f"aes.decrypt[{label}]", lambda e=encrypted: engine._decrypt_aes(e, master_key),
+                   bytes_per_op=size, max_iterations=iterations)
+        # Same, with the plaintext and ciphertext SHA-256 computed in the same pass (ledger references)
+        yield Case(f"aes.encrypt_digest[{label}]", lambda p=payload: engine._encrypt_aes(p, master_key, PayloadDigests()),
+                   bytes_per_op=size, max_iterations=iterations)
+        yield Case(f"aes.decrypt_digest[{label}]", lambda e=encrypted: engine._decrypt_aes(e, master_key, PayloadDigests()),
+                   bytes_per_op=size, max_iterations=iterations)
+        del payload, encrypted
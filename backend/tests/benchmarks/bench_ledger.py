@@ -0,0 +1,109 @@
+from tests.benchmarks.harness import Case
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.block import Block, HASH_VERSIONS
+from app.blockchain.chain import Blockchain
+from app.blockchain.parallel_verify import ParallelChainVerifier
+import os
+from app.database import SessionLocal, engine
+from app.models import Base, LedgerBlock
+from app.monitoring.alerts import AlertStore, AnomalyDetector
+from app.monitoring.analytics import SecurityStats
+
+SEED_BATCH = 10000
+# Events in flight at once for the group-commit case
+CONCURRENT_APPENDS = 64
+# Events per transaction for the hash-format append cases
+APPEND_BATCH = 1000
+# Blocks per call for the anomaly detector case
+DETECTOR_BATCH = 1000
+# Chains at least this long also get a parallel full-verification case
+PARALLEL_VERIFY_MIN_LENGTH = 10000
+
+
+def _reset_ledger():
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def _chain_length() -> int:
+    db = SessionLocal()
+    try:
+        return db.query(LedgerBlock).count()
+    finally:
+        db.close()
+
+
+def _grow_chain(blockchain: Blockchain, length: int):
+    missing = length - _chain_length()
+    while missing > 0:
+        batch = min(SEED_BATCH, missing)
+        blockchain.add_blocks([{
+            "event_type": "ENCRYPTION_KYBER",
+            "key_id": "bench-key",
+            "user_id": "bench",
+            "data_reference": "bench"
+        }] * batch)
+        missing -= batch
+
+
+def collect(profile: dict):
+    _reset_ledger()
+    blockchain = Blockchain()
+    blockchain.add_block("GENESIS", "SYSTEM", "SYSTEM", "GENESIS_BLOCK")
+    appender = LedgerAppender(max_delay=0)
+    appender.start()
+    security_stats = SecurityStats(blockchain)
+
+    def concurrent_appends():
+        # Callers enqueue without waiting for each other; the writer commits them in groups
+        futures = [appender.submit([{
+            "event_type": "ENCRYPTION_KYBER",
+            "key_id": "bench-key",
+            "user_id": "bench",
+            "data_reference": "bench"
+        }]) for _ in range(CONCURRENT_APPENDS)]
+        for future in futures:
+            future.result()
+
+    for length in profile["chain_lengths"]:
+        # Chains are grown in place, so each length reuses the previous one
+        _grow_chain(blockchain, length)
+        full_scan_iterations = 3 if length >= 100000 else 1000
+        yield Case(f"ledger.add_block[{length}]",
+                   lambda: blockchain.add_block("ENCRYPTION_KYBER", "bench-key", "bench", "bench"),
+                   max_iterations=200)
+        yield Case(f"ledger.get_chain[{length}]", blockchain.get_chain, max_iterations=full_scan_iterations)
+        # Routine validation re-hashes only what was appended since the last run
+        yield Case(f"ledger.is_chain_valid[{length}]", blockchain.is_chain_valid, max_iterations=full_scan_iterations)
+        yield Case(f"ledger.verify_full[{length}]", lambda: blockchain.is_chain_valid(full=True),
+                   max_iterations=full_scan_iterations)
+        # /monitor/stats: counters kept by the append listener vs reloading them
+        yield Case(f"ledger.security_stats[{length}]", security_stats.snapshot)
+        yield Case(f"ledger.security_stats_rebuild[{length}]", security_stats.rebuild, max_iterations=full_scan_iterations)
+        workers = os.cpu_count() or 1
+        if length >= PARALLEL_VERIFY_MIN_LENGTH and workers > 1:
+            # Includes starting the worker processes, as a scheduled run would
+            parallel = ParallelChainVerifier(workers=workers, chunk_size=max(length // (4 * workers), 1000))
+            database_url = engine.url.render_as_string(hide_password=False)
+            yield Case(f"ledger.verify_parallel[{length},workers={workers}]",
+                       lambda p=parallel: p.run(database_url), max_iterations=full_scan_iterations)
+        # Last: it grows the chain
+        yield Case(f"ledger.appender[{length}x{CONCURRENT_APPENDS}]", concurrent_appends, max_iterations=20)
+
+    # Hash formats. Validate path: stored row -> Block -> hash; append path: one batch write
+    events = [{"event_type": "ENCRYPTION_KYBER", "key_id": "bench-key", "user_id": "bench",
+               "data_reference": "hash-1234567890"}] * APPEND_BATCH
+    for version in HASH_VERSIONS:
+        sample = Block(1, 1700000000.123456, "ENCRYPTION_KYBER", "bench-key", "bench", "hash-1234567890",
+                       "ab" * 32, version)
+        row = (1, sample.stored_timestamp(), "ENCRYPTION_KYBER", "bench-key", "bench", "hash-1234567890", "ab" * 32, version)
+        yield Case(f"ledger.block_hash[v{version}]", lambda r=row: Block.from_stored(*r).hash)
+        appender = LedgerAppender(hash_version=version)
+        yield Case(f"ledger.append_batch[{APPEND_BATCH},v{version}]", lambda a=appender: a.write(events), max_iterations=20)
+
+    # Streaming anomaly rules: one batch through a fresh detector (windows created as subjects appear)
+    observed = [Block(i + 1, 1700000000 + i / 100, "DECRYPTION_FAILED" if i % 10 == 0 else "DECRYPTION_KYBER",
+                      f"key-{i % 50}", f"user-{i % 200}", "bench", "ab" * 32) for i in range(DETECTOR_BATCH)]
+    yield Case(f"ledger.anomaly_detector[{DETECTOR_BATCH}]",
+               lambda: AnomalyDetector(store=AlertStore(), appender=LedgerAppender()).on_append(observed),
+               max_iterations=50)
@@ -0,0 +1,65 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+from tests.benchmarks.harness import Case
+from tests.benchmarks.bench_crypto import _size_label
+from app.encryption.streaming import DEFAULT_CHUNK_SIZE, SegmentedEncryptor, SegmentedDecryptor
+
+# Plaintext handed to each update() call per worker
+SEGMENTS_PER_WORKER = 4
+# Decryption needs the real ciphertext in memory, so it is capped
+MAX_DECRYPT_SIZE = 256 << 20
+
+
+def _worker_counts() -> list:
+    cpus = os.cpu_count() or 1
+    counts = {1, cpus}
+    n = 2
+    while n < cpus:
+        counts.add(n)
+        n *= 2
+    return sorted(counts)
+
+
+def _encrypt(size: int, workers: int, executor, master_key: bytes, block: bytes) -> bytes:
+    """
+    Encrypts `size` bytes through the segmented encryptor. The input is one reused block,
+    so multi-GB runs do not need multi-GB of RAM. Returns the last window of output.
+    """
+    encryptor = SegmentedEncryptor(master_key, b"\x00" * 1568, DEFAULT_CHUNK_SIZE, executor)
+    remaining = size
+    out = b""
+    while remaining > 0:
+        piece = block if remaining >= len(block) else block[:remaining]
+        out = encryptor.update(piece)
+        remaining -= len(piece)
+    return out + encryptor.finalize()
+
+
+def collect(profile: dict):
+    master_key = os.urandom(32)
+    for size in profile["parallel_sizes"]:
+        label = _size_label(size)
+        for workers in _worker_counts():
+            block = os.urandom(DEFAULT_CHUNK_SIZE * SEGMENTS_PER_WORKER * workers)
+            executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
+            yield Case(f"segments.encrypt[{label},workers={workers}]",
+                       lambda s=size, w=workers, e=executor, b=block: _encrypt(s, w, e, master_key, b),
+                       bytes_per_op=size, min_iterations=1, max_iterations=3)
+
+            if size <= MAX_DECRYPT_SIZE:
+                plaintext = os.urandom(size)
+                encryptor = SegmentedEncryptor(master_key, b"\x00" * 1568, DEFAULT_CHUNK_SIZE)
+                container = encryptor.update(plaintext) + encryptor.finalize()
+                header = encryptor.header
+                body = memoryview(container)[header.size:]
+                window = header.segment_size * SEGMENTS_PER_WORKER * workers
+
+                def decrypt(e=executor, body=body, header=header, window=window):
+                    decryptor = SegmentedDecryptor(master_key, header, e)
+                    for i in range(0, len(body), window):
+                        decryptor.update(body[i:i + window])
+                    decryptor.finalize()
+
+                yield Case(f"segments.decrypt[{label},workers={workers}]", decrypt,
+                           bytes_per_op=size, min_iterations=1, max_iterations=3)
+                del plaintext, container
@@ -0,0 +1,115 @@
+import json
+import os
+import platform
+import statistics
+import time
+
+# Payload sizes and chain lengths per profile.
+# "quick" is meant for every change; "full" sweeps up to 1 GB payloads and 1M-block chains.
+PROFILES = {
+    "quick": {
+        "payload_sizes": [64, 4096, 1 << 20, 16 << 20],
+        "chain_lengths": [1000, 10000],
+        "parallel_sizes": [64 << 20],
+        "min_time": 0.2,
+    },
+    "full": {
+        "payload_sizes": [64, 1024, 64 << 10, 1 << 20, 16 << 20, 256 << 20, 1 << 30],
+        "chain_lengths": [1000, 10000, 100000, 1000000],
+        "parallel_sizes": [1 << 30, 4 << 30],
+        "min_time": 1.0,
+    },
+}
+
+
+class Case:
+    """
+    One benchmark: `fn` is timed repeatedly. `bytes_per_op` adds a MB/s figure.
+    """
+
+    def __init__(self, name: str, fn, bytes_per_op: int = None, min_iterations: int = 3, max_iterations: int = 10000):
+        self.name = name
+        self.fn = fn
+        self.bytes_per_op = bytes_per_op
+        self.min_iterations = min_iterations
+        self.max_iterations = max_iterations
+
+
+# Fast operations are looped so one sample lasts at least this long (timer noise stays small)
+MIN_SAMPLE_TIME = 0.001
+
+
+def _calibrate(fn) -> int:
+    number = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(number):
+            fn()
+        if time.perf_counter() - t0 >= MIN_SAMPLE_TIME:
+            return number
+        number *= 10
+
+
+def measure(case: Case, min_time: float) -> dict:
+    number = _calibrate(case.fn)
+    samples = []
+    started = time.perf_counter()
+    while len(samples) < case.max_iterations and (
+        len(samples) < case.min_iterations or time.perf_counter() - started < min_time
+    ):
+        t0 = time.perf_counter()
+        for _ in range(number):
+            case.fn()
+        samples.append((time.perf_counter() - t0) / number)
+
+    samples.sort()
+    median = statistics.median(samples)
+    result = {
+        "iterations": len(samples) * number,
+        "min": samples[0],
+        "median": median,
+        "mean": statistics.fmean(samples),
+        "p95": samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+        "ops_per_sec": 1 / median if median else None,
+    }
+    if case.bytes_per_op:
+        result["mb_per_sec"] = case.bytes_per_op / median / (1 << 20) if median else None
+    return result
+
+
+def environment() -> dict:
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "database": os.environ.get("DATABASE_URL", "").split(":")[0],
+    }
+
+
+def load(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(report: dict, path: str):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list:
+    """
+    Returns the cases whose median time regressed by more than `tolerance` (0.5 = 50% slower)
+    against the baseline. Cases missing from either side are ignored.
+    """
+    regressions = []
+    for name, result in report["results"].items():
+        base = baseline.get("results", {}).get(name)
+        if not base or not base.get("median"):
+            continue
+        ratio = result["median"] / base["median"]
+        result["baseline_ratio"] = ratio
+        if ratio > 1 + tolerance:
+            regressions.append({"case": name, "median": result["median"], "baseline": base["median"], "ratio": ratio})
+    return regressions
@@ -0,0 +1,74 @@
+"""
+Offline benchmark runner for the encryption engine and the ledger.
+
+    cd backend
+    python -m tests.benchmarks.run                      # quick profile, compare with baselines/quick.json
+    python -m tests.benchmarks.run --profile full --output results.json
+    python -m tests.benchmarks.run --update-baseline    # record this machine's numbers as the baseline
+
+The ledger runs against a throwaway SQLite database unless DATABASE_URL is already set.
+Exits with status 1 when any case is slower than its baseline by more than --tolerance.
+"""
+import argparse
+import importlib
+import os
+import sys
+import tempfile
+
+BASELINE_DIR = os.path.join(os.path.dirname(__file__), "baselines")
+SUITES = ["crypto", "parallel", "ledger"]
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--profile", default="quick")
+    parser.add_argument("--suite", action="append", choices=SUITES, help="Run only these suites (repeatable)")
+    parser.add_argument("--case", help="Run only cases whose name contains this string")
+    parser.add_argument("--output", help="Write the JSON report here")
+    parser.add_argument("--baseline", help="Baseline JSON (default: baselines/<profile>.json)")
+    parser.add_argument("--update-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="Allowed slowdown vs baseline (0.5 = 50%%)")
+    args = parser.parse_args(argv)
+
+    # Must be set before anything imports app.database
+    workdir = tempfile.mkdtemp(prefix="dualkey-bench-")
+    os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(workdir, 'bench.db')}")
+    os.environ.setdefault("KEM_POOL_WORKERS", "0")
+
+    from tests.benchmarks import harness
+
+    if args.profile not in harness.PROFILES:
+        parser.error(f"Unknown profile {args.profile} (choose from {', '.join(harness.PROFILES)})")
+    profile = harness.PROFILES[args.profile]
+
+    report = {"profile": args.profile, "environment": harness.environment(), "results": {}}
+    for suite in args.suite or SUITES:
+        module = importlib.import_module(f"tests.benchmarks.bench_{suite}")
+        for case in module.collect(profile):
+            if args.case and args.case not in case.name:
+                continue
+            result = harness.measure(case, profile["min_time"])
+            report["results"][case.name] = result
+            rate = f"{result['mb_per_sec']:10.1f} MB/s" if "mb_per_sec" in result else f"{result['ops_per_sec']:10.1f} op/s"
+            print(f"{case.name:40s} median {result['median'] * 1000:10.3f} ms  {rate}", flush=True)
+
+    baseline_path = args.baseline or os.path.join(BASELINE_DIR, f"{args.profile}.json")
+    regressions = []
+    if args.update_baseline:
+        harness.save(report, baseline_path)
+        print(f"Baseline written to {baseline_path}")
+    elif os.path.exists(baseline_path):
+        regressions = harness.compare(report, harness.load(baseline_path), args.tolerance)
+        for r in regressions:
+            print(f"REGRESSION {r['case']}: {r['median'] * 1000:.3f} ms vs baseline {r['baseline'] * 1000:.3f} ms ({r['ratio']:.2f}x)")
+        report["regressions"] = regressions
+    else:
+        print(f"No baseline at {baseline_path}; run with --update-baseline to record one")
+
+    if args.output:
+        harness.save(report, args.output)
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
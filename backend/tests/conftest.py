@@ -0,0 +1,16 @@
+import os
+import tempfile
+import pytest
+from sqlalchemy import create_engine
+from app import database
+from app.models import Base
+
+
+@pytest.fixture
+def ledger_db(monkeypatch):
+    path = os.path.join(tempfile.mkdtemp(), "ledger.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    monkeypatch.setattr(database.SessionLocal, "kw", {**database.SessionLocal.kw, "bind": engine})
+    yield engine
+    engine.dispose()
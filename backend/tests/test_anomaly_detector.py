@@ -0,0 +1,78 @@
+import threading
+from datetime import datetime
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.block import Block
+from app.blockchain.chain import Blockchain
+from app.monitoring import alerts
+from app.monitoring.alerts import AlertStore, AnomalyDetector, SlidingWindowCounter, default_rules
+
+NOON = datetime(2026, 3, 2, 12).timestamp()
+
+
+def block(index: int, timestamp: float, event_type: str, user_id: str = "alice", key_id: str = "k1") -> Block:
+    return Block(index, timestamp, event_type, key_id, user_id, "ref", "0" * 64)
+
+
+def make_detector(chain: Blockchain = None):
+    store = AlertStore()
+    appender = LedgerAppender()
+    return AnomalyDetector(default_rules(), store, chain or Blockchain(appender), appender), store, appender
+
+
+def test_sliding_window_counter_expires_whole_buckets():
+    counter = SlidingWindowCounter(100, buckets=10)
+    assert [counter.add(t) for t in (0, 5, 50, 99)] == [1, 2, 3, 4]
+    assert counter.add(105) == 3  # Bucket 0 slid out
+    assert counter.add(151) == 3  # Buckets up to 5 slid out
+    assert counter.add(40) == 3  # Older than the window: ignored
+    assert counter.add(400) == 1 and not counter.idle(450) and counter.idle(500)
+
+
+def test_rules_fire_once_per_burst_and_rearm():
+    detector, store, _ = make_detector()
+    events = ["DECRYPTION_FAILED", "FILE_DECRYPTION_FAILED", "DECRYPTION_FAILED", "DECRYPTION_FAILED"]
+    detector.on_append([block(i + 1, NOON + i, e) for i, e in enumerate(events)])
+    assert [(a["rule"], a["user_id"], a["count"]) for a in store.query()] == [("user_failure_burst", "alice", 3)]
+
+    # The window drains, so the next burst is a new alert
+    detector.on_append([block(5 + i, NOON + 1200 + i, "DECRYPTION_FAILED") for i in range(3)])
+    assert [a["block_index"] for a in store.query(rule="user_failure_burst")] == [7, 3]
+    assert store.query(user_id="bob") == [] and store.query(since=NOON + 600)[0]["block_index"] == 7
+
+    night = datetime(2026, 3, 2, 23).timestamp()
+    detector.on_append([block(8, night, "FILE_DECRYPTION", user_id="bob"), block(9, night + 1, "DECRYPTION_KYBER", user_id="bob")])
+    assert [(a["rule"], a["user_id"]) for a in store.query(severity="LOW")] == [("off_hours_activity", "bob")]
+
+
+def test_blocks_appended_elsewhere_are_read_from_the_ledger_off_the_writer_thread(ledger_db):
+    chain = Blockchain(LedgerAppender())
+    reads = []
+    iter_blocks = chain.iter_blocks
+
+    def record_read(**kwargs):
+        reads.append(threading.current_thread())
+        return iter_blocks(**kwargs)
+
+    chain.iter_blocks = record_read
+    detector, store, appender = make_detector(chain)
+    failure = {"event_type": "DECRYPTION_FAILED", "key_id": "k1", "user_id": "alice", "data_reference": "ref"}
+    appender.write([failure])
+    LedgerAppender().write([failure, failure])  # Another server process
+    appender.write([failure])
+    appender.write([failure])
+    assert detector.flush(timeout=5)
+    assert detector.observed == 5 and store.query()[0]["count"] == 3
+    assert store.query()[0]["block_index"] == 3
+    assert reads and threading.current_thread() not in reads  # The writer thread never read
+    assert detector.stats()["held_back"] == 0
+
+
+def test_only_alerts_in_an_open_window_are_active(monkeypatch):
+    detector, store, _ = make_detector()
+    monkeypatch.setattr(alerts, "alert_store", store)
+    detector.on_append([block(i + 1, NOON + i, "DECRYPTION_FAILED") for i in range(3)])
+    monkeypatch.setattr(alerts.time, "time", lambda: NOON + 300)
+    assert [a["rule"] for a in alerts.check_anomalies()] == ["user_failure_burst"]
+    monkeypatch.setattr(alerts.time, "time", lambda: NOON + 3600)
+    assert alerts.check_anomalies() == []
+    assert len(alerts.check_anomalies(since=0)) == 1  # History on request
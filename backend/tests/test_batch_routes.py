@@ -0,0 +1,104 @@
+import asyncio
+import hashlib
+import pytest
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.chain import Blockchain
+from app.encryption import routes
+from app.encryption.core import DualKeyEncryption
+from app.encryption.kem_pool import KemPool
+from app.encryption.routes import BatchDecryptionRequest, BatchEncryptionRequest
+from app.key_management.manager import KeyManager
+
+
+@pytest.fixture
+def batch_env(ledger_db, monkeypatch):
+    manager = KeyManager()
+    blockchain = Blockchain(LedgerAppender())
+    appends = []
+    add_blocks_async = blockchain.add_blocks_async
+
+    async def record_append(events, **kwargs):
+        appends.append(events)
+        return await add_blocks_async(events, **kwargs)
+
+    monkeypatch.setattr(blockchain, "add_blocks_async", record_append)
+    monkeypatch.setattr(routes, "key_manager", manager)
+    monkeypatch.setattr(routes, "blockchain", blockchain)
+    monkeypatch.setattr(routes, "encryption_engine", DualKeyEncryption(kem=KemPool(workers=0)))
+    return manager, appends
+
+
+def encrypt_batch(records: list) -> list:
+    request = BatchEncryptionRequest(records=records)
+    return asyncio.run(routes.encrypt_batch(request, user_id="svc"))["results"]
+
+
+def decrypt_batch(records: list) -> list:
+    request = BatchDecryptionRequest(records=records)
+    return asyncio.run(routes.decrypt_batch(request, user_id="admin"))["results"]
+
+
+def batch_reference(*results) -> str:
+    digest = hashlib.sha256(b"".join(bytes.fromhex(result["ciphertext_sha256"]) for result in results))
+    return f"batch-{len(results)}-{digest.hexdigest()}"
+
+
+def test_encrypt_batch_keeps_order_and_the_cause_of_failed_keys(batch_env, monkeypatch):
+    manager, appends = batch_env
+    manager.get_current_key("k1")
+
+    def provision(key_ids):
+        raise RuntimeError("keygen unavailable")
+
+    monkeypatch.setattr(manager, "provision", provision)
+    results = encrypt_batch([
+        {"data": "a", "user_key": "u", "key_id": "k1"},
+        {"data": "b", "user_key": "u", "key_id": "new"},
+        {"data": "c", "user_key": "u", "key_id": "k1"},
+    ])
+
+    assert [result["index"] for result in results] == [0, 1, 2]
+    assert "keygen unavailable" in results[1]["error"]
+    assert "error" not in results[0] and "error" not in results[2]
+    [events] = appends
+    assert [(event["event_type"], event["key_id"]) for event in events] == [("ENCRYPTION_BATCH", "k1")]
+    assert events[0]["data_reference"].startswith("batch-2-")
+
+
+def test_decrypt_batch_reports_each_failure_in_one_append(batch_env):
+    manager, appends = batch_env
+    old = encrypt_batch([{"data": "old", "user_key": "u", "key_id": "k1"}])[0]
+    manager.rotate("k1")
+    new = encrypt_batch([{"data": f"new-{i}", "user_key": "u", "key_id": "k1"} for i in range(2)])
+    appends.clear()
+
+    def record(result: dict, user_key: str = "u", **kwargs) -> dict:
+        return {"encrypted_data": result["encrypted_data"], "kyber_ciphertext": result["kyber_ciphertext"],
+                "user_key": user_key, "key_id": "k1", "key_version": result["key_version"], **kwargs}
+
+    results = decrypt_batch([
+        record(new[1]),
+        record(old),
+        record(new[0], user_key="wrong"),
+        record(new[0], key_version=7),
+    ])
+
+    assert [result.get("data") for result in results] == ["new-1", "old", None, None]
+    assert "Decryption failed" in results[2]["error"]
+    assert "Unknown version 7" in results[3]["error"]
+    assert [result["ciphertext_sha256"] for result in results[:2]] == [new[1]["ciphertext_sha256"], old["ciphertext_sha256"]]
+    assert results[0]["plaintext_sha256"] == hashlib.sha256(b"new-1").hexdigest()
+    [events] = appends
+    assert [event["event_type"] for event in events] == ["DECRYPTION_BATCH", "DECRYPTION_FAILED", "DECRYPTION_FAILED"]
+    assert events[0]["data_reference"] == batch_reference(new[1], old)
+
+
+def test_batch_reference_is_built_from_the_record_digests(batch_env):
+    _, appends = batch_env
+    encrypted = encrypt_batch([{"data": f"r{i}", "user_key": "u", "key_id": "k1"} for i in range(3)])
+    assert [result["plaintext_sha256"] for result in encrypted] == [hashlib.sha256(f"r{i}".encode()).hexdigest() for i in range(3)]
+    assert appends[0][0]["data_reference"] == batch_reference(*encrypted)
+
+    decrypt_batch([{"encrypted_data": r["encrypted_data"], "kyber_ciphertext": r["kyber_ciphertext"], "user_key": "u",
+                    "key_id": "k1", "key_version": r["key_version"]} for r in encrypted])
+    assert appends[1][0]["data_reference"] == appends[0][0]["data_reference"]
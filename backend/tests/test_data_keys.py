@@ -0,0 +1,46 @@
+import asyncio
+import base64
+import pytest
+from app.encryption import routes
+from app.encryption.core import DualKeyEncryption
+from app.encryption.data_keys import DataKeyBudget, DataKeyCache
+from app.encryption.kyber_utils import generate_kyber_keypair
+
+engine = DualKeyEncryption()
+pk, sk = generate_kyber_keypair()
+
+
+def session(monkeypatch, budget: DataKeyBudget):
+    data_key, wrapped = engine.generate_data_key(pk, "user-key")
+    request = routes.DataKeyRecordsRequest(wrapped_data_key=base64.b64encode(wrapped).decode(), user_key="user-key",
+                                           key_id="k", records=[])
+    monkeypatch.setattr(routes.key_manager, "get_key_version", lambda key_id, version: (pk, sk))
+    monkeypatch.setattr(routes, "data_key_budget", budget)
+    monkeypatch.setattr(routes, "data_key_cache", DataKeyCache())
+    return data_key, wrapped, request
+
+
+def test_budget_survives_cache_eviction_and_re_unwrapping(ledger_db, monkeypatch):
+    data_key, wrapped, request = session(monkeypatch, DataKeyBudget(max_uses=5))
+    assert asyncio.run(routes._session_data_key(wrapped, request, uses=5)) == bytes(data_key)
+    with pytest.raises(ValueError, match="usage limit"):
+        asyncio.run(routes._session_data_key(wrapped, request, uses=1))
+
+    # A fresh cache (eviction, restart, another process) unwraps again but gets no new budget
+    monkeypatch.setattr(routes, "data_key_cache", DataKeyCache())
+    monkeypatch.setattr(routes, "data_key_budget", DataKeyBudget(max_uses=5))
+    with pytest.raises(ValueError, match="usage limit"):
+        asyncio.run(routes._session_data_key(wrapped, request, uses=1))
+    assert routes.data_key_cache.stats()["misses"] == 0  # Refused before unwrapping
+    # Records already encrypted stay decryptable
+    assert asyncio.run(routes._session_data_key(wrapped, request)) == bytes(data_key)
+
+
+def test_expired_keys_cannot_encrypt(ledger_db, monkeypatch):
+    budget = DataKeyBudget(ttl_seconds=0)
+    _, wrapped, request = session(monkeypatch, budget)
+    budget.register(wrapped)
+    for _ in range(2):
+        routes.data_key_cache.clear()
+        with pytest.raises(ValueError, match="expired"):
+            asyncio.run(routes._session_data_key(wrapped, request, uses=1))
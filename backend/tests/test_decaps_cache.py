@@ -0,0 +1,55 @@
+import time
+from app.encryption.core import DualKeyEncryption
+from app.encryption.decaps_cache import DecapsulationCache, decaps_cache
+from app.encryption.kyber_utils import generate_kyber_keypair
+from app.key_management.manager import KeyManager
+
+pk, sk = generate_kyber_keypair()
+
+def test_repeat_decrypts_hit_the_cache():
+    engine = DualKeyEncryption(decaps=DecapsulationCache(enabled=True))
+    record = engine.encrypt_data("hello", pk, "user-key")
+    for _ in range(3):
+        assert engine.decrypt_data(record["encrypted_data"], record["kyber_ciphertext"], sk, "user-key") == "hello"
+    assert engine.decaps.stats()["hits"] == 2
+    assert engine.decaps.stats()["misses"] == 1
+
+def test_eviction_ttl_and_invalidation_wipe_secrets():
+    cache = DecapsulationCache(enabled=True, ttl_seconds=60, max_entries=2)
+    cache.put(b"a", b"\x01" * 32, "k1")
+    secret_a = cache._entries[b"a"].secret
+    cache.put(b"b", b"\x02" * 32, "k1")
+    cache.put(b"c", b"\x03" * 32, "k2")
+    # Least recently used entry is evicted and zeroized
+    assert cache.get(b"a") is None
+    assert secret_a == bytearray(32)
+
+    cache.invalidate("k1")
+    assert cache.get(b"b") is None
+    assert cache.get(b"c") == b"\x03" * 32
+
+    cache.ttl_seconds = 0
+    cache.put(b"d", b"\x04" * 32, "k2")
+    time.sleep(0.001)
+    assert cache.get(b"d") is None
+
+def test_disabled_cache_stores_nothing():
+    cache = DecapsulationCache(enabled=False)
+    cache.put(b"a", b"\x01" * 32)
+    assert cache.get(b"a") is None
+    assert cache.stats()["entries"] == 0
+
+def test_every_decrypt_path_can_be_invalidated_by_key(ledger_db, monkeypatch):
+    monkeypatch.setattr(decaps_cache, "enabled", True)  # The shared cache, used by rotate()
+    engine = DualKeyEncryption(decaps=decaps_cache)
+    manager = KeyManager()
+    _, key_pk, key_sk = manager.get_current_key("k1")
+
+    record = engine.encrypt_file(b"data", key_pk, "user-key")
+    assert engine.decrypt_file(record["encrypted_file"], record["kyber_ciphertext"], key_sk, "user-key", key_id="k1") == b"data"
+    wrapped = engine.generate_data_key(key_pk, "user-key")[1]
+    engine.decrypt_data_key(wrapped, key_sk, "user-key", key_id="k1")
+    assert decaps_cache.stats()["entries"] == 2
+
+    manager.rotate("k1")
+    assert decaps_cache.stats()["entries"] == 0
@@ -0,0 +1,75 @@
+import base64
+import hashlib
+import io
+import os
+from app.encryption import core
+from app.encryption.core import DualKeyEncryption
+from app.encryption.digests import PayloadDigests
+from app.encryption.envelope import Envelope, MultiRecipientEnvelope
+from app.encryption.kyber_utils import generate_kyber_keypair
+from app.encryption.streaming import SegmentHeader
+
+engine = DualKeyEncryption()
+pk, sk = generate_kyber_keypair()
+
+
+def test_cbc_digests_match_a_separate_hash(monkeypatch):
+    monkeypatch.setattr(core, "DIGEST_CHUNK_SIZE", 1000)  # Several pieces, not block aligned
+    data = os.urandom(5000)
+    result = engine.encrypt_file(data, pk, "user-key")
+    assert result["plaintext_sha256"] == hashlib.sha256(data).hexdigest()
+    assert result["ciphertext_sha256"] == hashlib.sha256(result["encrypted_file"]).hexdigest()
+
+    digests = PayloadDigests()
+    assert engine.decrypt_file(result["encrypted_file"], result["kyber_ciphertext"], sk, "user-key", digests) == data
+    assert digests.to_dict() == {k: result[k] for k in ("plaintext_sha256", "ciphertext_sha256")}
+
+    text = engine.encrypt_data("hello", pk, "user-key")
+    digests = PayloadDigests()
+    assert engine.decrypt_data(text["encrypted_data"], text["kyber_ciphertext"], sk, "user-key", digests=digests) == "hello"
+    assert digests.reference == f"sha256-{hashlib.sha256(base64.b64decode(text['encrypted_data'])).hexdigest()}"
+
+
+def container_digest(container: bytes) -> str:
+    # SHA-256(header | SHA-256 of each segment), see streaming.py
+    header = SegmentHeader.parse(container)
+    body = container[header.size:]
+    digest = hashlib.sha256(header.to_bytes())
+    for i in range(0, len(body), header.segment_size):
+        digest.update(hashlib.sha256(body[i:i + header.segment_size]).digest())
+    return digest.hexdigest()
+
+
+def test_streaming_digests_cover_the_whole_container():
+    data = os.urandom(300 * 1024 + 7)
+    container = io.BytesIO()
+    sealed = PayloadDigests()
+    engine.encrypt_fileobj(io.BytesIO(data), container, pk, "user-key", chunk_size=64 * 1024, digests=sealed)
+    assert sealed.plaintext.hexdigest() == hashlib.sha256(data).hexdigest()
+    assert sealed.ciphertext.hexdigest() == container_digest(container.getvalue())
+
+    opened = PayloadDigests()
+    plaintext = io.BytesIO()
+    container.seek(0)
+    engine.decrypt_fileobj(container, plaintext, sk, "user-key", digests=opened)
+    assert plaintext.getvalue() == data
+    assert opened.to_dict() == sealed.to_dict()
+
+    # The plaintext pass is opt-in: by default only the container digest is computed
+    container.seek(0)
+    decryptor_digests = engine.open_stream_decryptor(SegmentHeader.parse(container.getvalue()), sk, "user-key").digests
+    assert decryptor_digests.plaintext is None and "plaintext_sha256" not in decryptor_digests.to_dict()
+
+
+def test_envelope_digests_cover_the_serialized_envelope():
+    sealed, opened = PayloadDigests(), PayloadDigests()
+    blob = engine.encrypt_envelope(b"payload", pk, "user-key", "k1", digests=sealed)
+    assert engine.decrypt_envelope(Envelope.from_bytes(blob), sk, "user-key", digests=opened) == b"payload"
+    assert sealed.ciphertext.hexdigest() == hashlib.sha256(blob).hexdigest()
+    assert opened.to_dict() == sealed.to_dict()
+
+    sealed, opened = PayloadDigests(), PayloadDigests()
+    blob = engine.encrypt_multi(b"payload", [("k1", 1, pk, "a"), ("k2", 1, pk, "b")], digests=sealed)
+    assert engine.decrypt_multi(MultiRecipientEnvelope.from_bytes(blob), "k2", sk, "b", digests=opened) == b"payload"
+    assert sealed.ciphertext.hexdigest() == hashlib.sha256(blob).hexdigest()
+    assert opened.to_dict() == sealed.to_dict()
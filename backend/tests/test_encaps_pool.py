@@ -0,0 +1,122 @@
+import threading
+import time
+from app.encryption.encaps_pool import EncapsulationPool
+from app.encryption.kem_pool import KemPool
+from app.encryption.kyber_utils import decapsulate_secret, generate_kyber_keypair
+from app.key_management import manager as manager_module
+from app.key_management.manager import KeyManager
+
+
+class GatedKem(KemPool):
+    """
+    Inline KEM whose background submissions wait while the gate is closed (a refill in flight).
+    """
+
+    def __init__(self):
+        super().__init__(workers=0)
+        self.gate = threading.Event()
+        self.gate.set()
+        self.waiting = threading.Event()
+
+    def submit(self, fn, *args):
+        if not self.gate.is_set():
+            self.waiting.set()
+            self.gate.wait()
+        return super().submit(fn, *args)
+
+
+def wait_for(condition, timeout: float = 10):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert condition()
+
+
+def depth(pool: EncapsulationPool, key_id: str = "k1") -> int:
+    return pool.stats()["depth"].get(key_id, 0)
+
+
+def test_take_refills_to_the_high_watermark_and_hands_out_each_pair_once():
+    pk, sk = generate_kyber_keypair()
+    pool = EncapsulationPool(kem=KemPool(workers=0), low_watermark=2, high_watermark=4)
+    assert pool.take("k1", pk) is None  # Not running: caller encapsulates inline
+    pool.start()
+    try:
+        assert pool.take("k1", pk) is None  # First use activates the key
+        wait_for(lambda: depth(pool) == 4)
+
+        pairs = [pool.take("k1", pk) for _ in range(2)]
+        assert depth(pool) == 2  # Still at the low watermark: no refill yet
+        pairs.append(pool.take("k1", pk))  # Below it: refilled back up
+        wait_for(lambda: depth(pool) == 4)
+
+        assert len({ciphertext for ciphertext, _ in pairs}) == 3
+        assert all(decapsulate_secret(ciphertext, sk) == bytes(secret) for ciphertext, secret in pairs)
+        stats = pool.stats()
+        assert (stats["hits"], stats["misses"], stats["produced"]) == (3, 1, 7)
+    finally:
+        pool.stop()
+
+
+def test_invalidate_wipes_the_pairs_of_a_key():
+    pk, _ = generate_kyber_keypair()
+    pool = EncapsulationPool(kem=KemPool(workers=0), low_watermark=2, high_watermark=4)
+    pool.start()
+    try:
+        pool.take("k1", pk)
+        wait_for(lambda: depth(pool) == 4)
+        secrets = [secret for _, secret in pool._keys["k1"].pairs]
+        pool.invalidate("k1")
+        assert "k1" not in pool.stats()["depth"] and pool.stats()["evicted"] == 4
+        assert all(not any(secret) for secret in secrets)
+    finally:
+        pool.stop()
+
+
+def test_no_pair_for_the_retired_public_key_is_handed_out_after_rotation(ledger_db, monkeypatch):
+    kem = GatedKem()
+    pool = EncapsulationPool(kem=kem, low_watermark=2, high_watermark=4)
+    monkeypatch.setattr(manager_module, "encaps_pool", pool)
+    manager = KeyManager()
+    _, old_pk, _ = manager.get_current_key("k1")
+    pool.start()
+    try:
+        pool.take("k1", old_pk)
+        wait_for(lambda: depth(pool) == 4)
+
+        # A refill for the old public key is in flight when the key is rotated
+        kem.gate.clear()
+        for _ in range(3):
+            assert pool.take("k1", old_pk) is not None
+        assert kem.waiting.wait(10)
+        manager.rotate("k1")
+        _, new_pk, new_sk = manager.get_current_key("k1")
+        assert pool.take("k1", new_pk) is None
+        kem.gate.set()
+
+        wait_for(lambda: depth(pool) == 4)
+        pairs = [pool.take("k1", new_pk) for _ in range(4)]
+        assert all(decapsulate_secret(ciphertext, new_sk) == bytes(secret) for ciphertext, secret in pairs)
+    finally:
+        kem.gate.set()
+        pool.stop()
+
+
+def test_failed_refills_are_counted():
+    class BrokenKem:
+        def submit(self, fn, *args):
+            raise RuntimeError("no workers")
+
+    pk, _ = generate_kyber_keypair()
+    pool = EncapsulationPool(kem=BrokenKem(), low_watermark=1, high_watermark=2)
+    pool.start()
+    try:
+        assert pool.take("k1", pk) is None
+        wait_for(lambda: pool.stats()["refill_failures"] >= 1)
+        assert depth(pool) == 0
+        # The failed refill is not left marked as running: the next take retries
+        failures = pool.stats()["refill_failures"]
+        pool.take("k1", pk)
+        wait_for(lambda: pool.stats()["refill_failures"] > failures)
+    finally:
+        pool.stop()
@@ -0,0 +1,65 @@
+import asyncio
+import pytest
+from app.encryption.core import DualKeyEncryption
+from app.encryption.envelope import Envelope, MultiRecipientEnvelope
+from app.encryption.kyber_utils import generate_kyber_keypair
+
+engine = DualKeyEncryption()
+pk, sk = generate_kyber_keypair()
+
+def test_envelope_round_trip():
+    blob = engine.encrypt_envelope(b"\x00binary payload\xff", pk, "user-key", "system-key-001")
+    envelope = Envelope.from_bytes(blob)
+    assert envelope.key_id == "system-key-001"
+    assert engine.decrypt_envelope(envelope, sk, "user-key") == b"\x00binary payload\xff"
+
+def test_envelope_rejects_wrong_user_key_and_tampering():
+    blob = engine.encrypt_envelope(b"payload", pk, "user-key", "system-key-001")
+    with pytest.raises(ValueError):
+        engine.decrypt_envelope(Envelope.from_bytes(blob), sk, "other-key")
+    with pytest.raises(ValueError):
+        Envelope.from_bytes(blob[:-1])
+    tampered = bytearray(blob)
+    tampered[-20] ^= 1
+    with pytest.raises(ValueError):
+        engine.decrypt_envelope(Envelope.from_bytes(bytes(tampered)), sk, "user-key")
+
+def test_rewrap_moves_envelope_and_json_record_to_new_key_version():
+    new_pk, new_sk = generate_kyber_keypair()
+    envelope = Envelope.from_bytes(engine.encrypt_envelope(b"payload", pk, "user-key", "system-key-001"))
+    rewrapped = asyncio.run(engine.rewrap_envelope_async(envelope, sk, new_pk, 2))
+    assert rewrapped.ciphertext == envelope.ciphertext
+    assert engine.decrypt_envelope(Envelope.from_bytes(rewrapped.to_bytes()), new_sk, "user-key") == b"payload"
+
+    record = engine.encrypt_data("record", pk, "user-key")
+    kyber_ciphertext, wrapped_secret = asyncio.run(engine.rewrap_record_async(
+        record["kyber_ciphertext"], None, "system-key-001", 1, sk, new_pk, 2))
+    assert engine.decrypt_data(record["encrypted_data"], kyber_ciphertext, new_sk, "user-key",
+                               key_id="system-key-001", wrapped_secret_b64=wrapped_secret, key_version=2) == "record"
+    # The wrapped secret is bound to key_id and version
+    with pytest.raises(ValueError):
+        engine.decrypt_data(record["encrypted_data"], kyber_ciphertext, new_sk, "user-key",
+                            key_id="system-key-002", wrapped_secret_b64=wrapped_secret, key_version=2)
+
+def test_multi_recipient_envelope_opens_per_key_and_rewraps_one_slot():
+    pk2, sk2 = generate_kyber_keypair()
+    blob = engine.encrypt_multi(b"shared payload", [
+        ("region-eu", 1, pk, "eu-user-key"),
+        ("region-us", 1, pk2, "us-user-key"),
+    ])
+    assert MultiRecipientEnvelope.is_multi_recipient(blob)
+    envelope = MultiRecipientEnvelope.from_bytes(blob)
+    assert engine.decrypt_multi(envelope, "region-eu", sk, "eu-user-key") == b"shared payload"
+    assert asyncio.run(engine.decrypt_multi_async(envelope, "region-us", sk2, "us-user-key")) == b"shared payload"
+    # Each slot only opens with its own system key and user key
+    with pytest.raises(ValueError):
+        engine.decrypt_multi(envelope, "region-us", sk2, "eu-user-key")
+    with pytest.raises(ValueError):
+        engine.decrypt_multi(envelope, "region-apac", sk, "eu-user-key")
+
+    new_pk, new_sk = generate_kyber_keypair()
+    rewrapped = MultiRecipientEnvelope.from_bytes(
+        asyncio.run(engine.rewrap_recipient_async(envelope, "region-eu", sk, new_pk, 2)).to_bytes())
+    assert rewrapped.recipient("region-eu").key_version == 2
+    assert engine.decrypt_multi(rewrapped, "region-eu", new_sk, "eu-user-key") == b"shared payload"
+    assert engine.decrypt_multi(rewrapped, "region-us", sk2, "us-user-key") == b"shared payload"
@@ -0,0 +1,41 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+from app.encryption.kem_pool import KemPool
+
+
+def test_inline_calls_run_off_the_event_loop():
+    pool = KemPool(workers=0)
+
+    async def call():
+        return threading.get_ident(), await pool.run(threading.get_ident)
+
+    loop_thread, worker_thread = asyncio.run(call())
+    assert worker_thread != loop_thread
+
+
+def test_broken_pool_is_replaced_without_blocking_the_loop():
+    pool = KemPool(workers=1)
+    pool.start()
+    try:
+        dead = pool.submit(os.getpid).result()
+        os.kill(dead, signal.SIGKILL)
+        deadline = time.monotonic() + 10
+        while not pool._executor._broken and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+        async def call():
+            ticks = 0
+            task = asyncio.create_task(pool.run(os.getpid))
+            while not task.done():
+                await asyncio.sleep(0.01)
+                ticks += 1
+            return ticks, task.result()
+
+        ticks, pid = asyncio.run(call())
+        assert pid != dead
+        assert ticks > 5  # The loop kept running while new workers were spawned and warmed up
+    finally:
+        pool.shutdown()
@@ -0,0 +1,35 @@
+import time
+from app.encryption.kem_pool import KemPool
+from app.key_management.keypair_pool import KeypairReservoir
+
+def test_reservoir_refills_in_background_and_hands_out_each_pair_once():
+    reservoir = KeypairReservoir(kem=KemPool(workers=0), low_watermark=2, high_watermark=4)
+    assert reservoir.take() is None  # Not running: caller generates inline
+    reservoir.start()
+    try:
+        deadline = time.monotonic() + 10
+        while reservoir.stats()["depth"] < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert reservoir.stats()["depth"] == 4
+
+        pairs = [reservoir.take() for _ in range(3)] + reservoir.generate(3)
+        assert len({pk for pk, _ in pairs}) == 6
+        assert reservoir.stats()["hits"] == 4
+    finally:
+        reservoir.stop()
+
+
+def test_failed_refills_are_counted():
+    class BrokenKem:
+        def submit(self, fn, *args):
+            raise RuntimeError("no workers")
+
+    reservoir = KeypairReservoir(kem=BrokenKem(), low_watermark=1, high_watermark=2)
+    reservoir.start()
+    try:
+        deadline = time.monotonic() + 10
+        while reservoir.stats()["refill_failures"] == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert reservoir.stats()["refill_failures"] >= 1 and reservoir.stats()["depth"] == 0
+    finally:
+        reservoir.stop()
@@ -0,0 +1,37 @@
+import asyncio
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.chain import Blockchain
+
+
+def event(i: int) -> dict:
+    return {"event_type": "ENCRYPTION_KYBER", "key_id": "k", "user_id": "u", "data_reference": f"ref-{i}"}
+
+
+def test_concurrent_appends_are_grouped_into_one_unforked_chain(ledger_db):
+    appender = LedgerAppender(max_batch=64, max_delay=0.05)
+    blockchain = Blockchain(appender)
+    blockchain.add_block("GENESIS", "SYSTEM", "SYSTEM", "GENESIS_BLOCK")  # inline while stopped
+    appender.start()
+    try:
+        async def append_all():
+            return await asyncio.gather(*(blockchain.add_block_async(**event(i)) for i in range(100)))
+        blocks = asyncio.run(append_all())
+    finally:
+        appender.stop()
+
+    assert sorted(b.index for b in blocks) == list(range(2, 102))
+    assert appender.batches < 100  # group commit, not one transaction per event
+    chain = blockchain.get_chain()
+    assert [b.index for b in chain] == list(range(1, 102))
+    assert blockchain.is_chain_valid()
+
+
+def test_stop_commits_queued_events(ledger_db):
+    appender = LedgerAppender(max_delay=0.5)
+    blockchain = Blockchain(appender)
+    appender.start()
+    futures = [appender.submit([event(i)]) for i in range(10)]
+    appender.stop()
+    assert all(f.done() and not f.exception() for f in futures)
+    assert len(blockchain.get_chain()) == 10
+    assert blockchain.is_chain_valid()
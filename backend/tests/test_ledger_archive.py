@@ -0,0 +1,114 @@
+import json
+import os
+import tempfile
+import pytest
+from app.database import SessionLocal
+from app.models import LedgerBlock
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.archive import LedgerArchive, SEGMENT_EVENT
+from app.blockchain.batches import MerkleBatcher
+from app.blockchain.chain import Blockchain
+from app.blockchain.merkle import verify_proof
+from app.blockchain.parallel_verify import ParallelChainVerifier
+from app.blockchain.verification import ChainVerifier
+
+
+def make_chain(count: int, segment_blocks: int = 10, hot_blocks: int = 5):
+    appender = LedgerAppender()
+    archive = LedgerArchive(tempfile.mkdtemp(), segment_blocks, hot_blocks, appender)
+    verifier = ChainVerifier(checkpoint_interval=7, parallel=ParallelChainVerifier(workers=1, chunk_size=8), archive=archive)
+    blockchain = Blockchain(appender, verifier, archive)
+    blockchain.add_blocks([{"event_type": "ENCRYPTION_KYBER", "key_id": f"k{i % 3}", "user_id": "u",
+                            "data_reference": f"ref-{i}"} for i in range(count)])
+    return blockchain, archive
+
+
+def hot_indices():
+    db = SessionLocal()
+    try:
+        return [i for (i,) in db.query(LedgerBlock.index).order_by(LedgerBlock.index.asc())]
+    finally:
+        db.close()
+
+
+def test_cold_blocks_are_sealed_and_read_through(ledger_db):
+    blockchain, archive = make_chain(40)
+    before = [b.to_dict() for b in blockchain.get_chain()]
+    assert blockchain.is_chain_valid()
+    assert archive.seal(blockchain.verifier.verified_through()) == 3  # 1-10, 11-20, 21-30; 31-40 stays hot
+
+    hot = hot_indices()
+    assert hot[0] == 31 and len(hot) == 13  # Plus one LEDGER_SEGMENT_SEALED block per segment
+    chain = blockchain.get_chain()
+    assert [b.to_dict() for b in chain[:len(before)]] == before
+    assert [b.event_type for b in chain[len(before):]] == [SEGMENT_EVENT] * 3
+
+    assert blockchain.get_block(17).to_dict() == before[16]
+    assert [b.index for b in blockchain.iter_blocks(after=8, limit=4)] == [9, 10, 11, 12]
+    assert [b.index for b in blockchain.iter_blocks(after=25, limit=10, filters={"key_id": "k0"})] == [28, 31, 34, 37, 40]
+    db = SessionLocal()
+    try:
+        assert archive.index_at(db, before[11]["timestamp"]) == 12
+    finally:
+        db.close()
+    assert [b.index for b in blockchain.iter_blocks(limit=3, since=before[11]["timestamp"])] == [12, 13, 14]
+    assert blockchain.count_events() == {"ENCRYPTION_KYBER": 40, SEGMENT_EVENT: 3}
+    db = SessionLocal()
+    try:
+        assert [json.loads(segment.event_counts) for segment in archive.segments(db)] == [{"ENCRYPTION_KYBER": 10}] * 3
+    finally:
+        db.close()
+
+    # Full verification covers both tiers; proofs still work for archived blocks
+    assert blockchain.verifier.verify_full()["is_valid"]
+    assert blockchain.is_chain_valid()
+    batcher = MerkleBatcher(batch_size=8, archive=archive)
+    assert batcher.seal(up_to=40) == 5
+    assert verify_proof(batcher.proof(11))
+
+
+def test_tampered_segment_fails_full_verification(ledger_db):
+    blockchain, archive = make_chain(30)
+    assert blockchain.is_chain_valid()
+    assert archive.seal(blockchain.verifier.verified_through()) == 2
+
+    path = os.path.join(archive.directory, "00000001.seg")
+    os.chmod(path, 0o644)
+    with open(path, "r+b") as f:
+        f.seek(3)
+        byte = f.read(1)
+        f.seek(3)
+        f.write(bytes([byte[0] ^ 1]))
+    result = blockchain.verifier.verify_full()
+    assert not result["is_valid"] and result["first_bad_index"] == 11
+
+
+def test_event_counts_come_from_the_segment_rows(ledger_db, monkeypatch):
+    blockchain, archive = make_chain(30)
+    assert blockchain.is_chain_valid()
+    assert archive.seal(blockchain.verifier.verified_through()) == 2
+
+    def unreadable(segment, after=None):
+        raise AssertionError("segment file read")
+    monkeypatch.setattr(archive, "read_segment", unreadable)
+    assert blockchain.count_events() == {"ENCRYPTION_KYBER": 30, SEGMENT_EVENT: 2}
+
+
+def test_seal_interrupted_after_its_chain_event_is_completed_next_time(ledger_db, monkeypatch):
+    blockchain, archive = make_chain(20)
+    assert blockchain.is_chain_valid()
+    submit = archive.appender.submit
+
+    def crash_after_commit(events):
+        submit(events).result()
+        raise RuntimeError("crashed before the segment was recorded")
+    monkeypatch.setattr(archive.appender, "submit", crash_after_commit)
+    with pytest.raises(RuntimeError):
+        archive.seal(blockchain.verifier.verified_through())
+    assert archive.stats()["segments"] == 0
+
+    # The retry reuses the recorded event instead of appending another one
+    monkeypatch.setattr(archive.appender, "submit", submit)
+    assert archive.seal(blockchain.verifier.verified_through()) == 1
+    assert blockchain.count_events()[SEGMENT_EVENT] == 1
+    assert blockchain.verifier.verify_full()["is_valid"]
@@ -0,0 +1,46 @@
+from app.database import SessionLocal
+from app.models import LedgerBlock
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.chain import Blockchain
+
+
+def test_iter_blocks_pages_by_cursor_and_filters(ledger_db):
+    blockchain = Blockchain(LedgerAppender())
+    blockchain.add_blocks([{"event_type": "ENCRYPTION_KYBER" if i % 3 else "DECRYPTION_KYBER", "key_id": f"k{i % 2}",
+                            "user_id": "u", "data_reference": f"ref-{i}"} for i in range(30)])
+
+    pages, after = [], None
+    while True:
+        page = list(blockchain.iter_blocks(after=after, limit=7, chunk_size=3))
+        if not page:
+            break
+        pages.append(page)
+        after = page[-1].index
+    assert [b.index for page in pages for b in page] == list(range(1, 31))
+    # Page boundaries link up
+    for previous, page in zip(pages, pages[1:]):
+        assert page[0].previous_hash == previous[-1].hash
+
+    decrypts = list(blockchain.iter_blocks(filters={"event_type": "DECRYPTION_KYBER", "key_id": "k0"}))
+    assert [b.index for b in decrypts] == [1, 7, 13, 19, 25]
+    assert blockchain.get_block(7).hash == decrypts[1].hash
+    assert blockchain.get_block(99) is None
+
+
+def test_time_range_and_filters_run_in_sql(ledger_db):
+    blockchain = Blockchain(LedgerAppender())
+    blockchain.add_blocks([{"event_type": "DECRYPTION_FAILED" if i % 4 == 0 else "ENCRYPTION_KYBER", "key_id": "k",
+                            "user_id": f"u{i % 2}", "data_reference": f"ref-{i}"} for i in range(40)])
+    # Spread the blocks one second apart (ts is not hashed)
+    db = SessionLocal()
+    try:
+        db.query(LedgerBlock).update({LedgerBlock.ts: 1000 + LedgerBlock.index})
+        db.commit()
+    finally:
+        db.close()
+
+    assert [b.index for b in blockchain.iter_blocks(since=1010, until=1020)] == list(range(10, 20))
+    failures = blockchain.iter_blocks(filters={"event_type": "DECRYPTION_FAILED", "user_id": "u0"}, since=1015)
+    assert [b.index for b in failures] == [17, 21, 25, 29, 33, 37]
+    assert [b.index for b in blockchain.iter_blocks(after=30, limit=2, since=1015)] == [31, 32]
+    assert blockchain.count_events() == {"DECRYPTION_FAILED": 10, "ENCRYPTION_KYBER": 30}
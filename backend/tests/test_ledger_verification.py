@@ -0,0 +1,177 @@
+import asyncio
+import time
+from app.database import SessionLocal
+from app.models import LedgerBlock, LedgerCheckpoint
+from app.blockchain.block import Block, HASH_V1, HASH_V2
+from app.blockchain.chain import Blockchain
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.verification import ChainVerifier, CHECKPOINT, WATERMARK
+from app.blockchain.parallel_verify import ParallelChainVerifier
+from app.monitoring.alerts import AlertStore, integrity_alert
+
+
+def grow(blockchain: Blockchain, count: int):
+    blockchain.add_blocks([{"event_type": "ENCRYPTION_KYBER", "key_id": "k", "user_id": "u",
+                            "data_reference": f"ref-{i}"} for i in range(count)])
+
+
+def update_block(index: int, **changes):
+    db = SessionLocal()
+    try:
+        db.query(LedgerBlock).filter(LedgerBlock.index == index).update(changes)
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_validation_only_rehashes_new_blocks(ledger_db):
+    verifier = ChainVerifier(checkpoint_interval=10)
+    blockchain = Blockchain(LedgerAppender(), verifier)
+    grow(blockchain, 25)
+    assert blockchain.is_chain_valid()  # No watermark yet: full pass
+    assert verifier.last_full["verified_through"] == 25
+
+    grow(blockchain, 5)
+    assert blockchain.is_chain_valid()
+    assert verifier.incremental_runs == 1 and verifier.blocks_verified == 5
+    db = SessionLocal()
+    try:
+        pinned = sorted(r.block_index for r in db.query(LedgerCheckpoint).filter(LedgerCheckpoint.kind == CHECKPOINT))
+    finally:
+        db.close()
+    assert pinned == [10, 20, 30]
+
+    # Tampering after the watermark is caught by routine validation
+    grow(blockchain, 2)
+    update_block(31, data_reference="forged")
+    assert not blockchain.is_chain_valid()
+
+
+def test_full_verification_catches_rewrites_behind_the_watermark(ledger_db):
+    verifier = ChainVerifier(checkpoint_interval=10)
+    blockchain = Blockchain(LedgerAppender(), verifier)
+    grow(blockchain, 25)
+    assert blockchain.is_chain_valid()
+
+    # Rewrite block 5 and re-hash everything after it consistently
+    previous_hash = None
+    for block in blockchain.get_chain():
+        if block.index < 5:
+            previous_hash = block.hash
+            continue
+        forged = Block(block.index, block.timestamp, block.event_type, block.key_id, block.user_id,
+                       "forged" if block.index == 5 else block.data_reference, previous_hash,
+                       block.hash_version, block.timestamp_ns)
+        update_block(block.index, data_reference=forged.data_reference, previous_hash=forged.previous_hash, hash=forged.hash)
+        previous_hash = forged.hash
+
+    # The signed watermark and checkpoints no longer match the rewritten chain
+    assert not blockchain.is_chain_valid()
+    result = verifier.verify_full()
+    assert not result["is_valid"] and result["error"]
+
+
+def test_parallel_full_verification_reports_first_bad_index(ledger_db):
+    verifier = ParallelChainVerifier(workers=2, chunk_size=7)
+    blockchain = Blockchain(LedgerAppender(), ChainVerifier(parallel=verifier))
+    grow(blockchain, 30)
+    url = ledger_db.url.render_as_string(hide_password=False)
+    result = verifier.run(url)
+    assert result["is_valid"] and result["blocks"] == 30 and result["last_index"] == 30
+    assert verifier.progress["chunks_done"] == verifier.progress["chunks_total"] == 5
+
+    # Re-hashed consistently, so only the link into its chunk (and the next block's link) breaks
+    block = blockchain.get_block(15)
+    forged = Block(15, block.timestamp, block.event_type, block.key_id, block.user_id, block.data_reference, "f" * 64,
+                   block.hash_version, block.timestamp_ns)
+    update_block(15, previous_hash=forged.previous_hash, hash=forged.hash)
+    update_block(24, data_reference="forged")
+    result = verifier.run(url)
+    assert not result["is_valid"] and result["first_bad_index"] == 15
+    assert blockchain.verifier.verify_full()["first_bad_index"] == 15
+
+
+def test_v1_and_v2_blocks_verify_side_by_side(ledger_db):
+    grow(Blockchain(LedgerAppender(hash_version=HASH_V1)), 5)
+    blockchain = Blockchain(LedgerAppender(hash_version=HASH_V2), ChainVerifier())
+    grow(blockchain, 5)
+    assert [b.hash_version for b in blockchain.get_chain()] == [1] * 5 + [2] * 5
+    assert blockchain.is_chain_valid(full=True)
+
+    # v2 hashes the exact integer nanoseconds
+    block = blockchain.get_block(7)
+    assert Block.from_stored(7, str(block.timestamp_ns), block.event_type, block.key_id, block.user_id,
+                             block.data_reference, block.previous_hash, HASH_V2).hash == block.hash
+    update_block(7, timestamp=str(block.timestamp_ns + 1))
+    assert not blockchain.is_chain_valid(full=True)
+
+
+def delete_blocks(first: int, kind: str = None):
+    db = SessionLocal()
+    try:
+        if kind is not None:
+            db.query(LedgerCheckpoint).filter(LedgerCheckpoint.kind == kind).delete()
+        else:
+            db.query(LedgerBlock).filter(LedgerBlock.index >= first).delete()
+        db.commit()
+    finally:
+        db.close()
+
+
+def test_truncation_is_detected_and_the_watermark_never_moves_back(ledger_db):
+    verifier = ChainVerifier(checkpoint_interval=10)
+    blockchain = Blockchain(LedgerAppender(), verifier)
+    grow(blockchain, 30)
+    assert blockchain.is_chain_valid() and verifier.verified_through() == 30
+
+    delete_blocks(16)
+    assert not blockchain.is_chain_valid()
+    result = verifier.verify_full()
+    assert not result["is_valid"] and "truncated" in result["error"] and result["first_bad_index"] == 20
+    assert verifier.verified_through() == 30 and not blockchain.is_chain_valid()
+
+    # Dropping the watermark as well does not turn it into a first validation
+    delete_blocks(None, kind=WATERMARK)
+    assert not blockchain.is_chain_valid()
+    assert "watermark is missing" in verifier.verify_full()["error"]
+    assert verifier.verified_through() is None
+
+
+def test_parallel_verification_catches_missing_blocks(ledger_db):
+    verifier = ParallelChainVerifier(workers=1, chunk_size=7)
+    grow(Blockchain(LedgerAppender(), ChainVerifier(parallel=verifier)), 30)
+    url = ledger_db.url.render_as_string(hide_password=False)
+    db = SessionLocal()
+    try:
+        db.query(LedgerBlock).filter(LedgerBlock.index.in_([10, 15])).delete()
+        db.commit()
+    finally:
+        db.close()
+    result = verifier.run(url)
+    assert not result["is_valid"] and result["first_bad_index"] == 11
+    assert verifier.run(url, {8: "x", 40: "y"})["error"] == "Block 40: pinned by a signed checkpoint but missing (chain truncated)"
+
+
+def test_scheduled_verification_failures_reach_the_listeners(ledger_db):
+    verifier = ChainVerifier(checkpoint_interval=10, parallel=ParallelChainVerifier(workers=1, chunk_size=8))
+    blockchain = Blockchain(LedgerAppender(), verifier)
+    grow(blockchain, 12)
+    assert blockchain.is_chain_valid()
+    update_block(4, data_reference="forged")
+
+    failures = []
+    verifier.add_listener(failures.append)
+
+    async def one_run():
+        task = asyncio.create_task(verifier.run_scheduled(0))
+        while not failures:
+            await asyncio.sleep(0.01)
+        task.cancel()
+
+    asyncio.run(one_run())
+    assert failures[0]["first_bad_index"] == 4 and verifier.last_full["is_valid"] is False
+
+    store = AlertStore()
+    integrity_alert(failures[0], store)
+    [alert] = store.query(active_at=time.time())
+    assert alert["rule"] == "ledger_integrity" and alert["severity"] == "CRITICAL" and alert["block_index"] == 4
@@ -99,3 +99,22 @@ def test_access_denied():
     }
     response = client.post("/encryption/decrypt", json=decrypt_payload, headers=headers)
     assert response.status_code == 403
+
+def test_binary_envelope_decrypts_on_its_own_route():
+    payload = {"user": {"username": "admin", "role": "ADMIN"}, "password": "password"}
+    token = client.post("/auth/login", json=payload).json()["access_token"]
+    headers = {"Authorization": f"Bearer {token}"}
+
+    encrypt_payload = {"data": "Sensitive Secret Data", "user_key": "user-secret-key-123", "key_id": "system-key-001"}
+    envelope = client.post("/encryption/encrypt", json=encrypt_payload,
+                           headers={**headers, "Accept": "application/octet-stream"}).content
+    binary = {**headers, "Content-Type": "application/octet-stream", "X-User-Key": "user-secret-key-123"}
+    response = client.post("/encryption/decrypt-envelope", content=envelope, headers=binary)
+    assert response.status_code == 200
+    assert response.json()["data"] == "Sensitive Secret Data"
+
+    # /decrypt keeps its JSON schema and points binary bodies to the envelope route
+    assert client.post("/encryption/decrypt", content=envelope, headers=binary).status_code == 415
+    assert client.post("/encryption/decrypt", json={"key_id": "system-key-001"}, headers=headers).status_code == 422
+    schema = client.get("/openapi.json").json()["paths"]["/encryption/decrypt"]["post"]["requestBody"]["content"]
+    assert schema["application/json"]["schema"]["$ref"].endswith("/DecryptionRequest")
@@ -0,0 +1,32 @@
+import hashlib
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.batches import MerkleBatcher
+from app.blockchain.chain import Blockchain
+from app.blockchain.merkle import leaf_hash, merkle_root, audit_path, verify_inclusion, verify_proof
+
+
+def test_inclusion_proofs_for_every_tree_size():
+    for size in range(1, 18):
+        leaves = [leaf_hash(hashlib.sha256(bytes([i])).hexdigest()) for i in range(size)]
+        root = merkle_root(leaves)
+        for position in range(size):
+            path = audit_path(position, leaves)
+            assert len(path) <= (size - 1).bit_length()
+            assert verify_inclusion(leaves[position], position, size, path, root)
+            if size > 1:
+                assert not verify_inclusion(leaves[position], (position + 1) % size, size, path, root)
+
+
+def test_proof_from_sealed_batches_verifies_offline(ledger_db):
+    blockchain = Blockchain(LedgerAppender())
+    blockchain.add_blocks([{"event_type": "ENCRYPTION_KYBER", "key_id": "k", "user_id": "u",
+                            "data_reference": f"ref-{i}"} for i in range(20)])
+    batcher = MerkleBatcher(batch_size=8)
+    assert batcher.seal(up_to=20) == 2  # 1-8, 9-16; 17-20 stays open
+    assert batcher.proof(18) is None
+
+    proof = batcher.proof(11)
+    assert proof["batch"]["batch_index"] == 1 and len(proof["audit_path"]) == 3
+    assert verify_proof(proof)
+    proof["block"]["data_reference"] = "forged"
+    assert not verify_proof(proof)
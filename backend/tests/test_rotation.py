@@ -0,0 +1,79 @@
+import asyncio
+import pytest
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.chain import Blockchain
+from app.encryption.core import DualKeyEncryption
+from app.encryption.kem_pool import KemPool
+from app.key_management.manager import KeyManager
+from app.key_management.rotation import RewrapRun, get_job
+
+engine = DualKeyEncryption(kem=KemPool(workers=0))
+
+
+async def stream(records):
+    for record in records:
+        yield record
+
+
+def make_run(manager: KeyManager, **kwargs) -> RewrapRun:
+    return RewrapRun("k1", "admin", engine=engine, manager=manager, blockchain=Blockchain(LedgerAppender()), **kwargs)
+
+
+def encrypt(manager: KeyManager, count: int) -> list:
+    _, pk, _ = manager.get_current_key("k1")
+    return [{"id": i, **engine.encrypt_data(f"secret-{i}", pk, "user-key")} for i in range(count)]
+
+
+def decrypt(manager: KeyManager, record: dict) -> str:
+    _, sk = manager.get_key_version("k1", record.get("key_version") or 1)
+    return engine.decrypt_data(record["encrypted_data"], record["kyber_ciphertext"], sk, "user-key", key_id="k1",
+                               wrapped_secret_b64=record.get("wrapped_secret"), key_version=record.get("key_version") or 1)
+
+
+def test_rotation_keeps_old_records_readable(ledger_db):
+    manager = KeyManager()
+    [record] = encrypt(manager, 1)
+    old_pk = manager.get_current_key("k1")[1]
+    assert manager.rotate("k1") == 2
+    version, pk, _ = manager.get_current_key("k1")
+    assert version == 2 and pk != old_pk
+    assert decrypt(manager, record) == "secret-0"
+    with pytest.raises(ValueError):
+        manager.rotate("missing")
+
+
+def test_interrupted_rewrap_resumes_from_what_the_client_stored(ledger_db):
+    manager = KeyManager()
+    records = encrypt(manager, 5)
+    manager.rotate("k1")
+    run = make_run(manager, batch_size=2)
+
+    async def interrupted():
+        received = []
+        output = run.run(stream(records))
+        async for item in output:
+            received.append(item)
+            if len(received) == 4:  # Batch 1, its checkpoint, first record of batch 2
+                break
+        await output.aclose()
+        return received
+
+    received = asyncio.run(interrupted())
+    assert received[2]["checkpoint"]["processed"] == 2
+    # Batch 2 was handed out but not checkpointed
+    assert get_job(run.job_id).processed == 2
+
+    # The client only stored the first record before the connection dropped
+    with pytest.raises(ValueError):
+        make_run(manager, job_id=run.job_id, resume_from=3)
+    resumed = make_run(manager, job_id=run.job_id, resume_from=1, batch_size=2)
+
+    async def replay():
+        return [item async for item in resumed.run(stream(records))]
+
+    outputs = [item for item in asyncio.run(replay()) if "checkpoint" not in item]
+    assert [item["id"] for item in outputs] == [1, 2, 3, 4]
+    stored = [received[0]] + outputs
+    assert all(record["key_version"] == 2 for record in stored)
+    assert [decrypt(manager, record) for record in stored] == [f"secret-{i}" for i in range(5)]
+    assert get_job(run.job_id).processed == 5 and get_job(run.job_id).status == "completed"
@@ -0,0 +1,76 @@
+import tempfile
+import time
+from datetime import datetime
+from app.blockchain.appender import LedgerAppender
+from app.blockchain.archive import LedgerArchive
+from app.blockchain.block import Block
+from app.blockchain.chain import Blockchain
+from app.blockchain.parallel_verify import ParallelChainVerifier
+from app.blockchain.verification import ChainVerifier
+from app.monitoring.analytics import SecurityStats
+
+
+def events(event_type: str, count: int):
+    return [{"event_type": event_type, "key_id": "k", "user_id": "u", "data_reference": "r"} for _ in range(count)]
+
+
+def make_stats():
+    appender = LedgerAppender()
+    archive = LedgerArchive(tempfile.mkdtemp(), 10, 5, appender)
+    verifier = ChainVerifier(parallel=ParallelChainVerifier(workers=1, chunk_size=8), archive=archive)
+    blockchain = Blockchain(appender, verifier, archive)
+    return blockchain, SecurityStats(blockchain, appender)
+
+
+def test_counters_follow_appends_without_rebuilding(ledger_db):
+    blockchain, stats = make_stats()
+    blockchain.add_blocks(events("ENCRYPTION_KYBER", 30) + events("DECRYPTION_FAILED", 2))
+    snapshot = stats.snapshot()
+    assert stats.rebuilds == 1
+    assert snapshot["total_events"] == 32
+    assert snapshot["distribution"] == {"ENCRYPTION": 30, "DECRYPTION": 0, "FAILURE": 2, "OTHER": 0}
+    assert snapshot["events_last_24h"] == 32 and snapshot["timeline"][-1]["events"] == 32
+
+    # Appends (the archive's LEDGER_SEGMENT_SEALED blocks included) arrive through the listener
+    assert blockchain.is_chain_valid()
+    assert blockchain.archive.seal(blockchain.verifier.verified_through()) == 2
+    blockchain.add_blocks(events("DECRYPTION_KYBER", 3))
+    snapshot = stats.snapshot()
+    assert stats.rebuilds == 1
+    assert snapshot["distribution"] == {"ENCRYPTION": 30, "DECRYPTION": 3, "FAILURE": 2, "OTHER": 2}
+
+    # A rebuild over both tiers gives the same answer
+    stats.rebuild()
+    assert stats.snapshot() == snapshot
+    assert stats.snapshot(now=time.time() + 48 * 3600)["events_last_24h"] == 0
+
+
+def test_appends_from_another_process_trigger_a_rebuild(ledger_db):
+    blockchain, stats = make_stats()
+    blockchain.add_blocks(events("ENCRYPTION_KYBER", 3))
+    assert stats.snapshot()["total_events"] == 3
+
+    LedgerAppender().write(events("ENCRYPTION_KYBER", 2))  # Not seen by the listener
+    blockchain.add_blocks(events("ENCRYPTION_KYBER", 1))
+    assert stats.snapshot()["total_events"] == 6 and stats.rebuilds == 2
+
+
+def test_timeline_buckets_follow_local_hours(ledger_db, monkeypatch):
+    monkeypatch.setenv("TZ", "Asia/Kolkata")  # UTC+05:30
+    time.tzset()
+    try:
+        blockchain, stats = make_stats()
+        event = datetime(2026, 3, 2, 6, 10).timestamp()
+        stats.rebuild(now=event)
+        stats.on_append([Block(1, event, "ENCRYPTION_KYBER", "k", "u", "r", "0" * 64)])
+        timeline = stats.snapshot(now=event + 600)["timeline"]
+        assert timeline[-1] == {"time": "06:00", "events": 1} and timeline[-2] == {"time": "05:00", "events": 0}
+
+        # A rebuild buckets the stored block the same way
+        blockchain.add_blocks(events("ENCRYPTION_KYBER", 1))
+        now = time.time()
+        stats.rebuild(now=now)
+        assert stats.snapshot(now=now)["timeline"][-1] == {"time": datetime.fromtimestamp(now).strftime("%H:00"), "events": 1}
+    finally:
+        monkeypatch.undo()
+        time.tzset()
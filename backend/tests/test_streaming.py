@@ -0,0 +1,96 @@
+import os
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+from app.encryption.streaming import HEADER_PREFIX_SIZE, MAX_CHUNK_SIZE, SegmentedEncryptor, SegmentedDecryptor, SegmentedRangeReader, SegmentHeader, _SegmentCipher
+from app.encryption.segment_pool import SegmentPool
+
+MASTER_KEY = os.urandom(32)
+KEM_CT = os.urandom(1568)
+
+def _encrypt(data: bytes, chunk_size: int, feed: int) -> bytes:
+    encryptor = SegmentedEncryptor(MASTER_KEY, KEM_CT, chunk_size)
+    out = b""
+    for i in range(0, len(data), feed):
+        out += encryptor.update(data[i:i + feed])
+    return out + encryptor.finalize()
+
+def _decrypt(blob: bytes, feed: int) -> bytes:
+    prefix_len = HEADER_PREFIX_SIZE + SegmentHeader.kem_length(blob)
+    header = SegmentHeader.parse(blob[:prefix_len])
+    decryptor = SegmentedDecryptor(MASTER_KEY, header)
+    body = blob[prefix_len:]
+    out = b""
+    for i in range(0, len(body), feed):
+        out += decryptor.update(body[i:i + feed])
+    return out + decryptor.finalize()
+
+@pytest.mark.parametrize("size", [0, 1, 1024, 1025, 4096, 5000])
+def test_segmented_round_trip(size):
+    data = os.urandom(size)
+    blob = _encrypt(data, chunk_size=1024, feed=333)
+    assert _decrypt(blob, feed=777) == data
+
+def test_segmented_detects_truncation_and_reordering():
+    data = os.urandom(4096)
+    blob = _encrypt(data, chunk_size=1024, feed=4096)
+    segment = 1024 + 16
+    body_start = len(blob) - 4 * segment
+
+    # Dropping the final segment makes the previous one look final
+    with pytest.raises(ValueError):
+        _decrypt(blob[:-segment], feed=segment)
+
+    # Swapping two segments breaks their nonces
+    first = blob[body_start:body_start + segment]
+    second = blob[body_start + segment:body_start + 2 * segment]
+    swapped = blob[:body_start] + second + first + blob[body_start + 2 * segment:]
+    with pytest.raises(ValueError):
+        _decrypt(swapped, feed=segment)
+
+def test_parallel_segments_match_serial_output():
+    data = os.urandom(10 * 1024 + 5)
+    serial = SegmentedEncryptor(MASTER_KEY, KEM_CT, 1024)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        parallel = SegmentedEncryptor(MASTER_KEY, KEM_CT, 1024, executor)
+        # Same header => byte-identical output, whatever the worker count
+        parallel.header = serial.header
+        parallel._cipher = _SegmentCipher(MASTER_KEY, serial.header)
+        expected = serial.update(data) + serial.finalize()
+        assert parallel.update(data) + parallel.finalize() == expected
+
+        header = SegmentHeader.parse(expected[:serial.header.size])
+        decryptor = SegmentedDecryptor(MASTER_KEY, header, executor)
+        body = expected[serial.header.size:]
+        assert decryptor.update(body) + decryptor.finalize() == data
+
+def test_segment_window_is_capped_in_bytes():
+    pool = SegmentPool(workers=64, window_bytes=16 * 1024 * 1024)
+    assert pool.window(64 * 1024) == 64 * 64 * 1024  # A segment per worker while they fit
+    assert pool.window(1024 * 1024) == 16 * 1024 * 1024
+    assert pool.window(MAX_CHUNK_SIZE) == MAX_CHUNK_SIZE  # Client-chosen segment size: one at a time
+    assert SegmentPool(workers=1).window(4096) == 4096
+
+@pytest.mark.parametrize("size", [1, 1024, 1025, 5000])
+def test_range_reader_decrypts_only_overlapping_segments(size):
+    data = os.urandom(size)
+    blob = _encrypt(data, chunk_size=1024, feed=size)
+    header = SegmentHeader.parse(blob)
+    reader = SegmentedRangeReader(MASTER_KEY, header, len(blob))
+    assert reader.plaintext_size == size
+
+    for start, end in [(0, 0), (0, size - 1), (size // 2, size - 1), (size - 1, size - 1)]:
+        first, offset, length = reader.locate(start, end)
+        assert length <= (end // 1024 - start // 1024 + 1) * header.segment_size
+        assert reader.open(first, blob[offset:offset + length], start, end) == data[start:end + 1]
+
+    with pytest.raises(ValueError):
+        reader.locate(0, size)
+
+def test_range_reader_rejects_truncated_container():
+    blob = _encrypt(os.urandom(4096), chunk_size=1024, feed=4096)
+    header = SegmentHeader.parse(blob)
+    # Cutting a whole segment makes the last remaining one claim to be final
+    reader = SegmentedRangeReader(MASTER_KEY, header, len(blob) - header.segment_size)
+    final, offset, length = reader.final_span()
+    with pytest.raises(ValueError):
+        reader.open(final, blob[offset:offset + length])
@@ -17,6 +17,29 @@ CREATE TABLE IF NOT EXISTS system_keys (
     private_key BLOB NOT NULL
 );
 
+-- 3b. Retired System Key Versions (kept after rotation to open and re-wrap old records)
+CREATE TABLE IF NOT EXISTS system_key_versions (
+    key_id VARCHAR(100) NOT NULL,
+    version INT NOT NULL,
+    public_key BLOB NOT NULL,
+    private_key BLOB NOT NULL,
+    retired_at VARCHAR(50),
+    PRIMARY KEY (key_id, version)
+);
+
+-- 3c. Re-wrap Job Checkpoints
+CREATE TABLE IF NOT EXISTS rewrap_jobs (
+    job_id VARCHAR(64) PRIMARY KEY,
+    key_id VARCHAR(100),
+    target_version INT,
+    processed INT DEFAULT 0,
+    rewrapped INT DEFAULT 0,
+    skipped INT DEFAULT 0,
+    failed INT DEFAULT 0,
+    status VARCHAR(20),
+    updated_at VARCHAR(50)
+);
+
 -- 4. Create Ledger Table (Blockchain)
 CREATE TABLE IF NOT EXISTS ledger (
     id INT AUTO_INCREMENT PRIMARY KEY,
@@ -27,7 +50,63 @@ CREATE TABLE IF NOT EXISTS ledger (
     user_id VARCHAR(50),
     data_reference VARCHAR(255),
     previous_hash VARCHAR(64) NOT NULL,
-    hash VARCHAR(64) NOT NULL
+    hash VARCHAR(64) NOT NULL,
+    hash_version INT NOT NULL DEFAULT 1, -- 1: JSON block hash, 2: binary encoding (timestamp in ns)
+    ts DOUBLE, -- timestamp in seconds, for range queries
+    INDEX ix_ledger_event_type_ts (event_type, ts),
+    INDEX ix_ledger_user_id_ts (user_id, ts),
+    INDEX ix_ledger_key_id_ts (key_id, ts),
+    INDEX ix_ledger_ts (ts)
+);
+
+-- 4b. Ledger Verification Checkpoints (signed watermark for incremental validation)
+CREATE TABLE IF NOT EXISTS ledger_checkpoints (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    kind VARCHAR(20) NOT NULL,
+    block_index INT NOT NULL,
+    block_hash VARCHAR(64) NOT NULL,
+    verified_at VARCHAR(50) NOT NULL,
+    signature VARCHAR(64) NOT NULL,
+    INDEX idx_ledger_checkpoints_kind (kind)
+);
+
+-- 4c. Ledger Merkle Batches (root per sealed run of blocks, chained batch to batch)
+CREATE TABLE IF NOT EXISTS ledger_batches (
+    batch_index INT PRIMARY KEY,
+    first_index INT UNIQUE NOT NULL,
+    last_index INT UNIQUE NOT NULL,
+    merkle_root VARCHAR(64) NOT NULL,
+    previous_batch_hash VARCHAR(64) NOT NULL,
+    batch_hash VARCHAR(64) NOT NULL,
+    sealed_at VARCHAR(50) NOT NULL
+);
+
+-- 4d. Ledger Archive Segments (cold blocks sealed into compressed files, chained segment to segment)
+CREATE TABLE IF NOT EXISTS ledger_segments (
+    segment_index INT PRIMARY KEY,
+    first_index INT UNIQUE NOT NULL,
+    last_index INT UNIQUE NOT NULL,
+    first_timestamp DOUBLE NOT NULL,
+    last_timestamp DOUBLE NOT NULL,
+    file_name VARCHAR(255) NOT NULL,
+    file_hash VARCHAR(64) NOT NULL,
+    index_hash VARCHAR(64) NOT NULL,
+    last_block_hash VARCHAR(64) NOT NULL,
+    previous_segment_hash VARCHAR(64) NOT NULL,
+    segment_hash VARCHAR(64) NOT NULL,
+    sealed_block_index INT NOT NULL,
+    sealed_at VARCHAR(50) NOT NULL,
+    event_counts TEXT,
+    INDEX idx_ledger_segments_first_ts (first_timestamp),
+    INDEX idx_ledger_segments_last_ts (last_timestamp)
+);
+
+-- 4e. Data Key Usage (lifetime and encryption budget of each wrapped data key)
+CREATE TABLE IF NOT EXISTS data_key_usage (
+    key_hash VARCHAR(64) PRIMARY KEY,
+    uses INT NOT NULL DEFAULT 0,
+    max_uses INT NOT NULL,
+    expires_at DOUBLE NOT NULL
 );
 
 -- 5. Seed Initial Users (If not exists)